@@ -1,3 +1,11 @@
 from django.contrib import admin
+from .models import Tarea
 
-# Register your models here.
+
+@admin.register(Tarea)
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ("id", "tipo", "clave", "estado", "intentos", "creada", "disponible_en", "worker",
+                    "espera_s", "duracion_s")
+    list_filter = ("tipo", "estado")
+    search_fields = ("clave",)
+    readonly_fields = ("payload", "resultado", "ultimo_error")
@@ -1,7 +1,6 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import threading
 import logging
 
 # Logger para este módulo
@@ -88,19 +87,15 @@ class UpdateCalendarTimeView(APIView):
             profile.google_calendar_event_time = parsed_time
             profile.save()
             
-            # Recalcular eventos futuros en un hilo separado para no bloquear la respuesta
-            from notificaciones.services.google_calendar import recalculate_all_future_events
+            # Recalcular eventos futuros fuera del request: lo ejecuta el worker (run_worker).
+            # La clave evita encolar dos recálculos pendientes si cambia la hora varias veces.
+            from notificaciones.services.cola_tareas import encolar
             
-            def run_recalculation(user):
-                try:
-                    recalculate_all_future_events(user)
-                    logger.info(f"Recálculo de eventos finalizado para {user.username}")
-                except Exception as e:
-                    logger.error(f"Error en recálculo de eventos para {user.username}: {e}")
-
-            thread = threading.Thread(target=run_recalculation, args=(request.user,))
-            thread.daemon = True # El hilo muere si el proceso principal muere
-            thread.start()
+            encolar(
+                'recalcular_eventos',
+                {'user_id': request.user.id},
+                clave=f'recalcular_eventos:{request.user.id}',
+            )
             
             msg = "Hora actualizada. Los eventos se están reprogramando en segundo plano."
 
@@ -0,0 +1,117 @@
+"""
+Management command que procesa la cola de tareas de Calendar (modelo Tarea).
+
+Las vistas sólo encolan (cambio de hora preferida, vinculación de la cuenta);
+este worker reclama las tareas con un lease, las ejecuta y reintenta las que
+fallan con backoff. Se escala corriendo más procesos: cada uno reclama con
+SKIP LOCKED y no compiten por las mismas tareas.
+
+Uso:
+    # Worker continuo (servicio aparte de gunicorn)
+    python manage.py run_worker
+
+    # Vaciar la cola y salir (ej: desde un cron)
+    python manage.py run_worker --once
+
+    # Varias tareas por reclamo y lease más corto
+    python manage.py run_worker --batch 5 --lease 300
+"""
+
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from notificaciones.services.cola_tareas import (
+    LEASE_SEGUNDOS_DEFAULT, ejecutar, purgar_terminadas, reclamar,
+)
+from plantas.services.reparto_trabajo import id_worker_default
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola persistente de tareas de Google Calendar'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--worker',
+            default=None,
+            help='Identificador de este worker (default: host-pid)',
+        )
+        parser.add_argument(
+            '--batch',
+            type=int,
+            default=1,
+            help='Tareas a reclamar por vez (default: 1)',
+        )
+        parser.add_argument(
+            '--lease',
+            type=int,
+            default=LEASE_SEGUNDOS_DEFAULT,
+            help=f'Segundos de lease por tarea antes de que otro worker pueda retomarla (default: {LEASE_SEGUNDOS_DEFAULT})',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Segundos de espera cuando la cola está vacía (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Procesa las tareas disponibles y termina',
+        )
+        parser.add_argument(
+            '--max-tareas',
+            type=int,
+            default=None,
+            help='Termina después de ejecutar esta cantidad de tareas',
+        )
+        parser.add_argument(
+            '--purgar-dias',
+            type=int,
+            default=7,
+            help='Al iniciar, elimina las tareas terminadas hace más de N días (default: 7)',
+        )
+
+    def handle(self, *args, **options):
+        worker = options['worker'] or id_worker_default()
+        self.detener = False
+        signal.signal(signal.SIGTERM, self._pedir_detencion)
+        signal.signal(signal.SIGINT, self._pedir_detencion)
+
+        purgadas = purgar_terminadas(options['purgar_dias'])
+        self.stdout.write(self.style.SUCCESS(f'\n👷 Worker {worker} iniciado ({purgadas} tareas viejas purgadas)'))
+
+        ejecutadas = {'ok': 0, 'pendiente': 0, 'error': 0, 'cancelada': 0}
+        while not self.detener:
+            close_old_connections()
+            tareas = reclamar(worker, cantidad=options['batch'], lease_segundos=options['lease'])
+            if not tareas:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            for tarea in tareas:
+                estado = ejecutar(tarea)
+                ejecutadas[estado] += 1
+                icono = {'ok': '✅', 'pendiente': '🔁', 'error': '❌', 'cancelada': '⏭️'}[estado]
+                self.stdout.write(
+                    f'  {icono} {tarea.tipo} #{tarea.pk} intento {tarea.intentos}: {estado} '
+                    f'(espera {tarea.espera_s or 0:.1f} s, duración {tarea.duracion_s or 0:.2f} s)'
+                )
+                if estado != 'ok':
+                    self.stdout.write(self.style.WARNING(f'     {tarea.ultimo_error.splitlines()[0] if tarea.ultimo_error else ""}'))
+
+            if options['max_tareas'] and sum(ejecutadas.values()) >= options['max_tareas']:
+                break
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n🛑 Worker {worker} detenido: {ejecutadas["ok"]} ok, {ejecutadas["pendiente"]} reprogramadas, '
+            f'{ejecutadas["error"]} fallidas, {ejecutadas["cancelada"]} canceladas\n'
+        ))
+
+    def _pedir_detencion(self, signum, frame):
+        # Termina la tarea en curso y sale: si se corta antes, el lease la libera para otro worker
+        self.detener = True
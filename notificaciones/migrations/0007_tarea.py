@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificaciones', '0006_profile_google_calendar_event_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('payload', models.JSONField(default=dict)),
+                ('clave', models.CharField(blank=True, help_text='Clave de deduplicación entre tareas pendientes', max_length=255, null=True)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('ok', 'Completada'), ('error', 'Fallida'), ('cancelada', 'Cancelada')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('max_intentos', models.PositiveIntegerField(default=5)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now, help_text='No se ejecuta antes de este momento (backoff)')),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('lease_hasta', models.DateTimeField(blank=True, help_text='Pasado este momento otro worker puede retomarla', null=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('iniciada', models.DateTimeField(blank=True, null=True)),
+                ('terminada', models.DateTimeField(blank=True, null=True)),
+                ('espera_s', models.FloatField(blank=True, help_text='Segundos en cola hasta el último inicio', null=True)),
+                ('duracion_s', models.FloatField(blank=True, help_text='Duración del último intento', null=True)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'verbose_name': 'Tarea en cola',
+                'verbose_name_plural': 'Tareas en cola',
+                'ordering': ['-creada'],
+                'indexes': [models.Index(fields=['estado', 'disponible_en'], name='notificacio_estado_df2603_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tarea',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'pendiente')), fields=('clave',), name='tarea_clave_pendiente_unica'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 # notificaciones/models.py
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL  # recommended, works si más adelante cambiás user model
 
@@ -23,3 +24,55 @@ class Profile(models.Model):
 
     def __str__(self):
         return f"Profile: {getattr(self.user, 'username', self.user)}"
+
+
+class Tarea(models.Model):
+    """
+    Trabajo de Calendar encolado en la base para el worker (manage.py run_worker).
+    
+    Reemplaza a los threads daemon de las vistas: sobrevive a reinicios de
+    gunicorn y corre fuera de los workers web. Los workers reclaman tareas con
+    un lease (`lease_hasta`); si un worker muere, otro la retoma al vencer.
+    Con `clave` no se encolan dos tareas pendientes iguales (ej: el usuario
+    cambia la hora dos veces seguidas).
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_curso', 'En curso'),
+        ('ok', 'Completada'),
+        ('error', 'Fallida'),
+        ('cancelada', 'Cancelada'),
+    ]
+    
+    tipo = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    clave = models.CharField(max_length=255, blank=True, null=True, help_text="Clave de deduplicación entre tareas pendientes")
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=5)
+    disponible_en = models.DateTimeField(default=timezone.now, help_text="No se ejecuta antes de este momento (backoff)")
+    worker = models.CharField(max_length=100, blank=True, default='')
+    lease_hasta = models.DateTimeField(blank=True, null=True, help_text="Pasado este momento otro worker puede retomarla")
+    creada = models.DateTimeField(auto_now_add=True)
+    iniciada = models.DateTimeField(blank=True, null=True)
+    terminada = models.DateTimeField(blank=True, null=True)
+    espera_s = models.FloatField(blank=True, null=True, help_text="Segundos en cola hasta el último inicio")
+    duracion_s = models.FloatField(blank=True, null=True, help_text="Duración del último intento")
+    resultado = models.JSONField(blank=True, null=True)
+    ultimo_error = models.TextField(blank=True, default='')
+    
+    class Meta:
+        ordering = ['-creada']
+        verbose_name = "Tarea en cola"
+        verbose_name_plural = "Tareas en cola"
+        indexes = [
+            models.Index(fields=['estado', 'disponible_en']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['clave'], condition=models.Q(estado='pendiente'), name='tarea_clave_pendiente_unica'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} #{self.pk} ({self.estado})"
@@ -0,0 +1,227 @@
+"""
+Sincronización en lote de eventos de riego con Google Calendar.
+
+Las operaciones masivas (cambio de hora preferida, vinculación, desvinculación
+y baja de cuenta) agrupan los events().patch()/insert()/delete() en batch
+requests de googleapiclient: hasta LIMITE_LOTE operaciones por round trip en
+lugar de un request HTTP por evento.
+
+- Cada operación lleva una clave (el id de la planta) y su resultado se mapea
+  de vuelta a esa clave.
+- Sólo se reintentan los items que fallaron con un error transitorio
+  (429, 5xx, límites de cuota o error de red del lote), con backoff exponencial.
+"""
+
+import logging
+import random
+import time
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+# Máximo de requests por batch que acepta la Calendar API
+LIMITE_LOTE = 50
+MAX_REINTENTOS = 3
+BACKOFF_BASE_SEGUNDOS = 1.0
+STATUS_REINTENTABLES = {429, 500, 502, 503, 504}
+RAZONES_REINTENTABLES = {'rateLimitExceeded', 'userRateLimitExceeded'}
+# Borrar un evento que ya no existe cuenta como borrado
+STATUS_EVENTO_INEXISTENTE = {404, 410}
+
+
+def _esperar_backoff(intento):
+    time.sleep(BACKOFF_BASE_SEGUNDOS * (2 ** intento) * random.uniform(0.5, 1.5))
+
+
+def es_reintentable(error):
+    """Si el error de un item justifica reintentarlo en el próximo lote."""
+    if not isinstance(error, HttpError):
+        return True
+    status = error.resp.status
+    if status in STATUS_REINTENTABLES:
+        return True
+    if status == 403:
+        razones = {detalle.get('reason') for detalle in (error.error_details or []) if isinstance(detalle, dict)}
+        return bool(razones & RAZONES_REINTENTABLES)
+    return False
+
+
+def ejecutar_lote(service, operaciones, reintentos=MAX_REINTENTOS):
+    """
+    Ejecuta requests de la Calendar API en batches, reintentando sólo los fallidos.
+
+    Args:
+        service: Cliente de Calendar (get_user_calendar_service)
+        operaciones: Lista de (clave, request) con requests sin ejecutar,
+                     ej: (planta.id, service.events().delete(...))
+        reintentos: Rondas extra para los items con errores transitorios
+
+    Returns:
+        dict {clave: (respuesta, error)} con error None si el item salió bien
+    """
+    resultados = {}
+    pendientes = list(operaciones)
+
+    for intento in range(reintentos + 1):
+        fallidos = []
+        for inicio in range(0, len(pendientes), LIMITE_LOTE):
+            tanda = pendientes[inicio:inicio + LIMITE_LOTE]
+            por_id = {str(indice): (clave, request) for indice, (clave, request) in enumerate(tanda)}
+
+            def callback(request_id, respuesta, error):
+                resultados[por_id[request_id][0]] = (respuesta, error)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for request_id, (_, request) in por_id.items():
+                batch.add(request, request_id=request_id)
+            try:
+                batch.execute()
+            except Exception as e:
+                # Falló el round trip completo: todos los items de la tanda quedan con el error
+                logger.warning(f"Error ejecutando batch de Calendar ({len(tanda)} requests): {e}")
+                for clave, _ in tanda:
+                    resultados[clave] = (None, e)
+
+            fallidos.extend(
+                (clave, request) for clave, request in tanda
+                if resultados[clave][1] is not None and es_reintentable(resultados[clave][1])
+            )
+
+        if not fallidos or intento >= reintentos:
+            break
+        logger.warning(f"Reintentando {len(fallidos)} requests de Calendar (intento {intento + 1})")
+        _esperar_backoff(intento)
+        pendientes = fallidos
+
+    return resultados
+
+
+def borrar_eventos(user, plantas, service=None):
+    """
+    Borra en lote los eventos de Calendar de las plantas (no toca la BD).
+
+    Args:
+        user: Usuario dueño de las plantas, con Google Calendar vinculado
+        plantas: Plantas con google_calendar_event_id
+        service: Cliente de Calendar ya construido (opcional)
+
+    Returns:
+        (borrados, errores): set de ids de planta cuyo evento ya no existe en
+        Calendar y lista de mensajes de error
+    """
+    from notificaciones.services.google_calendar import get_user_calendar_service
+
+    plantas = [planta for planta in plantas if planta.google_calendar_event_id]
+    if not plantas:
+        return set(), []
+    service = service or get_user_calendar_service(user)
+
+    resultados = ejecutar_lote(service, [
+        (planta.id, service.events().delete(calendarId='primary', eventId=planta.google_calendar_event_id))
+        for planta in plantas
+    ])
+
+    borrados, errores = set(), []
+    for planta in plantas:
+        _, error = resultados[planta.id]
+        if error is None or (isinstance(error, HttpError) and error.resp.status in STATUS_EVENTO_INEXISTENTE):
+            borrados.add(planta.id)
+        else:
+            errores.append(f"Planta {planta.id}: no se pudo borrar el evento {planta.google_calendar_event_id}: {error}")
+    return borrados, errores
+
+
+def _evento_inexistente(error):
+    return isinstance(error, HttpError) and error.resp.status in STATUS_EVENTO_INEXISTENTE
+
+
+def sincronizar_eventos(user, plantas, calculos=None, motivo=None):
+    """
+    Sincroniza en lote el evento de riego de cada planta con su próxima fecha
+    programada, con la misma lógica que update_calendar_event_for_plant:
+
+    - Las plantas cuya huella no cambió se omiten (sin request).
+    - Las que ya tienen evento se actualizan con patch (mismo ID).
+    - Se crean las que no tienen evento y las cuyo evento ya no existe en Google.
+
+    Args:
+        user: Usuario dueño de las plantas, con Google Calendar vinculado
+        plantas: Lista de Planta del usuario
+        calculos: dict {planta_id: calculos_riego()} ya calculado en lote (opcional)
+        motivo: Texto del motivo para la descripción de los eventos (opcional;
+                default: el motivo_riego de cada planta)
+
+    Returns:
+        (eventos, errores): dict {planta_id: evento} de los actualizados o
+        creados y lista de mensajes de error
+    """
+    from plantas.models import Planta
+    from notificaciones.services.google_calendar import (
+        cuerpo_evento_riego, fecha_y_motivo_evento, get_user_calendar_service, huella_evento,
+    )
+
+    calculos = calculos or {}
+
+    # 1. Armar los eventos con la fecha programada de cada planta y descartar los que no cambiaron
+    cuerpos, a_actualizar, a_crear = {}, [], []
+    for planta in plantas:
+        datos_riego = calculos.get(planta.id) or planta.calculos_riego()
+        fecha_riego, motivo_planta = fecha_y_motivo_evento(planta, datos_riego, motivo=motivo)
+        body = cuerpo_evento_riego(user, planta, fecha_riego, motivo_planta, datos_riego)
+        huella = huella_evento(body)
+        if planta.google_calendar_event_id and planta.google_calendar_sync_hash == huella:
+            continue
+        cuerpos[planta.id] = (body, huella)
+        (a_actualizar if planta.google_calendar_event_id else a_crear).append(planta)
+    if not cuerpos:
+        return {}, []
+
+    service = get_user_calendar_service(user)
+    eventos, errores, inexistentes = {}, [], set()
+
+    # 2. Patch de los eventos existentes; los borrados en Google (404/410 o cancelados) se recrean
+    resultados = ejecutar_lote(service, [
+        (planta.id, service.events().patch(
+            calendarId='primary', eventId=planta.google_calendar_event_id, body=cuerpos[planta.id][0]
+        ))
+        for planta in a_actualizar
+    ])
+    for planta in a_actualizar:
+        evento, error = resultados[planta.id]
+        if error is None and evento and evento.get('status') != 'cancelled':
+            eventos[planta.id] = evento
+        elif error is None or _evento_inexistente(error):
+            inexistentes.add(planta.id)
+            a_crear.append(planta)
+        else:
+            errores.append(f"Planta {planta.id}: no se pudo actualizar el evento {planta.google_calendar_event_id}: {error}")
+
+    # 3. Crear los nuevos
+    resultados = ejecutar_lote(service, [
+        (planta.id, service.events().insert(calendarId='primary', body=cuerpos[planta.id][0]))
+        for planta in a_crear
+    ])
+    for planta in a_crear:
+        evento, error = resultados[planta.id]
+        if error is None and evento:
+            eventos[planta.id] = evento
+        else:
+            errores.append(f"Planta {planta.id}: no se pudo crear el evento de riego: {error}")
+
+    # 4. Guardar IDs y huellas en una sola query. Si el evento anterior ya no
+    #    existe y no se pudo crear el nuevo, se limpia el ID para no dejar uno fantasma
+    actualizadas = []
+    for planta in plantas:
+        if planta.id in eventos:
+            planta.google_calendar_event_id = eventos[planta.id].get('id')
+            planta.google_calendar_sync_hash = cuerpos[planta.id][1]
+        elif planta.id in inexistentes:
+            planta.google_calendar_event_id = None
+            planta.google_calendar_sync_hash = ''
+        else:
+            continue
+        actualizadas.append(planta)
+    Planta.objects.bulk_update(actualizadas, ['google_calendar_event_id', 'google_calendar_sync_hash'])
+
+    return eventos, errores
@@ -0,0 +1,127 @@
+"""
+Cache por proceso de clientes de Google Calendar, uno por usuario.
+
+get_user_calendar_service se llama en cada borrado, creación, patch y señal
+de Planta; construir el cliente con discovery.build() parsea el documento de
+discovery (~130 KB) cada vez. Acá:
+
+- El documento de discovery de calendar v3 se carga una sola vez por proceso
+  desde la copia estática que trae googleapiclient (sin ir a la red).
+- Los clientes se guardan en un LRU acotado (settings.GOOGLE_CALENDAR_CLIENTS_MAX)
+  por usuario, junto con sus credenciales.
+- Una entrada se invalida sola si cambian los tokens del Profile (se refrescó
+  el token o el usuario volvió a vincular) y explícitamente al desvincular.
+- httplib2 no es thread-safe: cada request usa la conexión del thread actual,
+  así un mismo cliente se puede usar desde las vistas, los threads y el cron.
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import google_auth_httplib2
+from django.conf import settings
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest, build_http
+
+logger = logging.getLogger(__name__)
+
+API = 'calendar'
+VERSION = 'v3'
+
+_documento = None
+_documento_lock = threading.Lock()
+
+# user_id -> (tokens, credenciales, servicio), en orden de uso
+_clientes = OrderedDict()
+_clientes_lock = threading.Lock()
+
+_http_local = threading.local()
+
+_metricas = {'hits': 0, 'misses': 0, 'invalidaciones': 0, 'descartes': 0}
+
+
+def _tamano_maximo():
+    return getattr(settings, 'GOOGLE_CALENDAR_CLIENTS_MAX', 256)
+
+
+def documento_discovery():
+    """Documento de discovery de Calendar v3 (parseado una sola vez por proceso)."""
+    global _documento
+    if _documento is None:
+        with _documento_lock:
+            if _documento is None:
+                contenido = discovery_cache.get_static_doc(API, VERSION)
+                if contenido is None:
+                    raise RuntimeError(f"googleapiclient no incluye el documento de discovery de {API} {VERSION}")
+                _documento = json.loads(contenido)
+    return _documento
+
+
+def _http_del_thread():
+    """Conexión httplib2 del thread actual (keep-alive dentro del thread)."""
+    http = getattr(_http_local, 'http', None)
+    if http is None:
+        http = _http_local.http = build_http()
+    return http
+
+
+def _construir(credenciales):
+    def request_builder(_http, *args, **kwargs):
+        http = google_auth_httplib2.AuthorizedHttp(credenciales, http=_http_del_thread())
+        return HttpRequest(http, *args, **kwargs)
+
+    return build_from_document(documento_discovery(), credentials=credenciales, requestBuilder=request_builder)
+
+
+def obtener(user_id, tokens, crear_credenciales):
+    """
+    Cliente de Calendar cacheado del usuario (o uno nuevo si no hay o cambiaron los tokens).
+
+    Args:
+        user_id: ID del usuario
+        tokens: Tupla con los tokens actuales del Profile (access, refresh)
+        crear_credenciales: callable sin argumentos que arma las Credentials
+
+    Returns:
+        (credenciales, servicio)
+    """
+    with _clientes_lock:
+        entrada = _clientes.get(user_id)
+        if entrada is not None and entrada[0] == tokens:
+            _clientes.move_to_end(user_id)
+            _metricas['hits'] += 1
+            return entrada[1], entrada[2]
+
+    credenciales = crear_credenciales()
+    servicio = _construir(credenciales)
+
+    with _clientes_lock:
+        _metricas['misses'] += 1
+        _clientes[user_id] = (tokens, credenciales, servicio)
+        _clientes.move_to_end(user_id)
+        while len(_clientes) > _tamano_maximo():
+            _clientes.popitem(last=False)
+            _metricas['descartes'] += 1
+    return credenciales, servicio
+
+
+def invalidar(user_id):
+    """Descarta el cliente cacheado del usuario (ej: al desvincular Google Calendar)."""
+    with _clientes_lock:
+        if _clientes.pop(user_id, None) is not None:
+            _metricas['invalidaciones'] += 1
+
+
+def limpiar():
+    """Descarta todos los clientes cacheados."""
+    with _clientes_lock:
+        _clientes.clear()
+
+
+def obtener_metricas():
+    """Copia de los contadores de hits, misses, invalidaciones y descartes por LRU, y el tamaño actual."""
+    with _clientes_lock:
+        return {**_metricas, 'clientes': len(_clientes)}
@@ -0,0 +1,194 @@
+"""
+Cola persistente de tareas de Calendar (modelo Tarea) y su ejecución por run_worker.
+
+- encolar: la vista registra la tarea y responde; con `clave` no se duplica
+  una tarea pendiente igual.
+- reclamar: el worker toma tareas disponibles con un lease. En PostgreSQL las
+  candidatas se leen con SELECT ... FOR UPDATE SKIP LOCKED; en todos los
+  motores un UPDATE condicional decide quién gana cada tarea. Las tareas en
+  curso con el lease vencido (worker caído) se pueden volver a reclamar.
+- ejecutar: corre el handler del tipo, guarda tiempos y resultado, y ante un
+  error la reprograma con backoff exponencial hasta max_intentos.
+"""
+
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from notificaciones.models import Tarea
+
+logger = logging.getLogger(__name__)
+
+LEASE_SEGUNDOS_DEFAULT = 600
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAX_SEGUNDOS = 3600
+
+
+class TareaIncompleta(Exception):
+    """El handler terminó pero con items fallidos: se reintenta la tarea."""
+
+
+def _recalcular_eventos(payload):
+    from notificaciones.services.google_calendar import recalculate_all_future_events
+
+    user = User.objects.select_related('profile').get(pk=payload['user_id'])
+    if not user.profile.google_access_token:
+        return {'omitida': 'Google Calendar no vinculado'}
+    count, errores = recalculate_all_future_events(user)
+    if errores:
+        raise TareaIncompleta(f"{len(errores)} eventos con error: {errores[:5]}")
+    return {'eventos_actualizados': count}
+
+
+def _poblar_eventos(payload):
+    from notificaciones.services.google_calendar import populate_missing_events
+
+    user = User.objects.select_related('profile').get(pk=payload['user_id'])
+    if not user.profile.google_access_token:
+        return {'omitida': 'Google Calendar no vinculado'}
+    count, errores = populate_missing_events(user)
+    if errores:
+        raise TareaIncompleta(f"{len(errores)} eventos con error: {errores[:5]}")
+    return {'eventos_creados': count}
+
+
+# tipo -> handler(payload) que devuelve un dict JSON-serializable con el resultado
+HANDLERS = {
+    'recalcular_eventos': _recalcular_eventos,
+    'poblar_eventos': _poblar_eventos,
+}
+
+
+def encolar(tipo, payload=None, clave=None, demora_segundos=0, max_intentos=5):
+    """
+    Encola una tarea (o devuelve la pendiente con la misma clave).
+
+    Args:
+        tipo: Clave de HANDLERS
+        payload: dict JSON-serializable para el handler
+        clave: Clave de deduplicación (ej: 'recalcular_eventos:<user_id>')
+        demora_segundos: No ejecutarla antes de este tiempo
+        max_intentos: Intentos antes de marcarla como fallida
+
+    Returns:
+        Tarea encolada o la pendiente existente
+    """
+    if tipo not in HANDLERS:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+    try:
+        with transaction.atomic():
+            return Tarea.objects.create(
+                tipo=tipo,
+                payload=payload or {},
+                clave=clave,
+                max_intentos=max_intentos,
+                disponible_en=timezone.now() + timedelta(seconds=demora_segundos),
+            )
+    except IntegrityError:
+        existente = Tarea.objects.filter(clave=clave, estado='pendiente').first()
+        if existente is None:
+            # La pendiente se reclamó entre el INSERT y el SELECT: encolar de nuevo
+            return encolar(tipo, payload, clave, demora_segundos, max_intentos)
+        logger.debug(f"Tarea {clave} ya pendiente (#{existente.pk}), no se duplica")
+        return existente
+
+
+def reclamar(worker, cantidad=1, lease_segundos=LEASE_SEGUNDOS_DEFAULT):
+    """
+    Reclama hasta `cantidad` tareas disponibles para este worker.
+
+    Returns:
+        Lista de Tarea en curso reclamadas (vacía si no hay trabajo)
+    """
+    ahora = timezone.now()
+    disponibles = Q(estado='pendiente', disponible_en__lte=ahora) | Q(estado='en_curso', lease_hasta__lt=ahora)
+
+    with transaction.atomic():
+        # Lease vencido sin intentos restantes: no se retoma
+        Tarea.objects.filter(
+            estado='en_curso', lease_hasta__lt=ahora, intentos__gte=F('max_intentos')
+        ).update(estado='error', terminada=ahora, ultimo_error='Lease vencido: el worker no terminó la tarea')
+
+        candidatas = Tarea.objects.filter(disponibles).order_by('disponible_en', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidatas = candidatas.select_for_update(skip_locked=True)
+        candidatas = list(candidatas[:cantidad])
+
+        reclamadas = []
+        lease_hasta = ahora + timedelta(seconds=lease_segundos)
+        for tarea in candidatas:
+            # UPDATE condicional: si otro worker la tomó primero, no afecta filas
+            ganada = Tarea.objects.filter(pk=tarea.pk, estado=tarea.estado, intentos=tarea.intentos).update(
+                estado='en_curso',
+                worker=worker,
+                lease_hasta=lease_hasta,
+                iniciada=ahora,
+                intentos=F('intentos') + 1,
+                espera_s=(ahora - tarea.creada).total_seconds(),
+            )
+            if ganada:
+                tarea.refresh_from_db()
+                reclamadas.append(tarea)
+    return reclamadas
+
+
+def _backoff(intentos):
+    segundos = min(BACKOFF_BASE_SEGUNDOS * (2 ** max(intentos - 1, 0)), BACKOFF_MAX_SEGUNDOS)
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def ejecutar(tarea):
+    """
+    Ejecuta una tarea reclamada y guarda su resultado.
+
+    Returns:
+        Estado final del intento: 'ok', 'pendiente' (se reintenta), 'error' o 'cancelada'
+    """
+    inicio = timezone.now()
+    try:
+        resultado = HANDLERS[tarea.tipo](tarea.payload)
+    except Exception as e:
+        fin = timezone.now()
+        tarea.duracion_s = (fin - inicio).total_seconds()
+        tarea.ultimo_error = ''.join(traceback.format_exception_only(type(e), e)).strip()[:2000]
+        tarea.worker, tarea.lease_hasta = '', None
+        if tarea.intentos < tarea.max_intentos and tarea.tipo in HANDLERS:
+            tarea.estado = 'pendiente'
+            tarea.disponible_en = fin + _backoff(tarea.intentos)
+            logger.warning(f"Tarea {tarea} falló (intento {tarea.intentos}/{tarea.max_intentos}), se reintenta: {e}")
+        else:
+            tarea.estado = 'error'
+            tarea.terminada = fin
+            logger.error(f"Tarea {tarea} falló definitivamente: {e}")
+        try:
+            with transaction.atomic():
+                tarea.save()
+        except IntegrityError:
+            # Ya hay una pendiente con la misma clave que hará el mismo trabajo
+            tarea.estado = 'cancelada'
+            tarea.terminada = fin
+            tarea.ultimo_error += '\nReemplazada por una tarea pendiente con la misma clave'
+            tarea.save()
+        return tarea.estado
+
+    fin = timezone.now()
+    tarea.estado = 'ok'
+    tarea.resultado = resultado
+    tarea.terminada = fin
+    tarea.duracion_s = (fin - inicio).total_seconds()
+    tarea.lease_hasta = None
+    tarea.ultimo_error = ''
+    tarea.save()
+    return tarea.estado
+
+
+def purgar_terminadas(dias=7):
+    """Elimina las tareas terminadas (ok, error, cancelada) hace más de `dias` días."""
+    limite = timezone.now() - timedelta(days=dias)
+    return Tarea.objects.filter(estado__in=['ok', 'error', 'cancelada'], terminada__lt=limite).delete()[0]
@@ -1,6 +1,7 @@
 # --- Librerías Estándar ---
 import os
 import json
+import hashlib
 import logging
 from datetime import datetime, timedelta
 
@@ -9,16 +10,17 @@ from dateutil import parser as dateparser
 import pytz
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google_auth_oauthlib.flow import Flow
-from google.auth.transport import requests as google_requests # Para el refresh del token
 from googleapiclient.errors import HttpError # Importar HttpError
 
 # --- Componentes de Django ---
 from django.conf import settings
 from django.utils import timezone
 
+# --- Servicios del proyecto ---
+from notificaciones.services import calendar_clients, google_tokens
+
 # Logger para este módulo
 logger = logging.getLogger(__name__)
 
@@ -45,35 +47,29 @@ def get_oauth_flow():
     # Desarrollo: Cargar desde el archivo local
     return Flow.from_client_secrets_file('notificaciones/services/client_secret.json', scopes=scopes, redirect_uri=redirect_uri)
 
+def _tokens_de_perfil(profile):
+    return (profile.google_access_token, profile.google_refresh_token)
+
+
 # Obtener el servicio de Google Calendar con las credenciales OAuth del usuario
 def get_user_calendar_service(user):
-    profile = user.profile
-    creds = Credentials(
-        token=profile.google_access_token,
-        refresh_token=profile.google_refresh_token,
-        token_uri='https://oauth2.googleapis.com/token',
-        client_id=settings.GOOGLE_CLIENT_ID,
-        client_secret=settings.GOOGLE_CLIENT_SECRET
+    """
+    Cliente de Calendar del usuario. Se reutiliza entre llamadas del mismo proceso
+    (ver calendar_clients) mientras no cambien los tokens del perfil.
+    """
+    # Refresca el token antes de que venza, una sola vez aunque haya llamadas concurrentes
+    profile = google_tokens.asegurar_token_vigente(user)
+    _, service = calendar_clients.obtener(
+        user.id, _tokens_de_perfil(profile), lambda: google_tokens.credenciales(profile)
     )
-
-    # --- LÓGICA CLAVE: Refrescar el token si es necesario ---
-    # Verificamos si el token ha expirado o está a punto de expirar (ej. en los próximos 5 minutos)
-    if creds.expired and creds.refresh_token:
-        logger.info(f"Token de Google expirado para {user.username}, refrescando...")
-        creds.refresh(google_requests.Request())
-        # Guardamos los nuevos tokens en el perfil del usuario
-        profile.google_access_token = creds.token
-        # Google a veces devuelve un nuevo refresh_token, aunque no siempre.
-        if creds.refresh_token:
-            profile.google_refresh_token = creds.refresh_token
-        profile.google_token_expiry = creds.expiry
-        profile.save()
-
-    return build('calendar', 'v3', credentials=creds)
+    return service
 
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 DEFAULT_TZ = 'America/Argentina/Cordoba'
+MOTIVO_EVENTO_DEFAULT = "Riego recalculado automáticamente según nueva hora preferida"
+# La nota del motivo va al final de la descripción y no entra en la huella
+SEPARADOR_NOTA = "\n\nNota: "
 
 
 
@@ -188,7 +184,61 @@ def delete_calendar_event(user, event_id):
         return False
 
 
-def create_riego_event(user, planta, fecha_riego, motivo=None):
+def cuerpo_evento_riego(user, planta, fecha_riego, motivo=None, datos_riego=None):
+    """
+    Arma el body de un evento de riego (summary, descripción, horario y recordatorios).
+    
+    Args:
+        user: Usuario de Django con profile
+        planta: Instancia de Planta
+        fecha_riego: date object con la fecha del próximo riego
+        motivo: Texto explicativo del recálculo (opcional)
+        datos_riego: Resultado de calculos_riego() ya calculado (opcional)
+    
+    Returns:
+        dict: Body para events().insert()
+    """
+    # Obtener hora preferida del usuario (o default 9 AM)
+    hora_riego = datetime.min.time().replace(hour=9)
+    if hasattr(user, 'profile') and user.profile.google_calendar_event_time:
+        hora_riego = user.profile.google_calendar_event_time
+        
+    # Crear evento a la hora configurada del día indicado
+    start_dt = ensure_timezone(datetime.combine(fecha_riego, hora_riego))
+    end_dt = start_dt + timedelta(minutes=30)
+    
+    # Obtener datos de riego para la descripción enriquecida
+    calculos = datos_riego or planta.calculos_riego()
+    agua_ml = calculos.get('recommended_water_ml', 'Variable')
+    
+    # Descripción enriquecida (Igual que en signals.py)
+    descripcion = (
+        f'¡Es hora de regar tu planta "{planta.nombre_personalizado}"!\n\n'
+        f'💧 Cantidad de agua recomendada: {agua_ml} ml.\n'
+        f'🪴 Tipo de planta: {planta.tipo_planta}.'
+    )
+    if motivo:
+        descripcion += f"{SEPARADOR_NOTA}{motivo}"
+    
+    return {
+        'summary': f"💧 Regar: {planta.nombre_personalizado}",
+        'description': descripcion,
+        'start': {
+            'dateTime': start_dt.isoformat(),
+            'timeZone': DEFAULT_TZ,
+        },
+        'end': {
+            'dateTime': end_dt.isoformat(),
+            'timeZone': DEFAULT_TZ,
+        },
+        'colorId': '9',  # 9 = Azul "Blueberry" (Coherencia visual)
+        'reminders': {
+            'useDefault': True, # Usar config del usuario como en signals
+        },
+    }
+
+
+def create_riego_event(user, planta, fecha_riego, motivo=None, datos_riego=None):
     """
     Crea un evento de riego en el calendario del usuario.
     
@@ -197,54 +247,14 @@ def create_riego_event(user, planta, fecha_riego, motivo=None):
         planta: Instancia de Planta
         fecha_riego: date object con la fecha del próximo riego
         motivo: Texto explicativo del recálculo (opcional)
+        datos_riego: Resultado de calculos_riego() ya calculado (opcional)
     
     Returns:
         dict: Evento creado con 'id' o None si hay error
     """
     try:
-        from datetime import datetime, timedelta
-        
         service = get_user_calendar_service(user)
-        
-        # Obtener hora preferida del usuario (o default 9 AM)
-        hora_riego = datetime.min.time().replace(hour=9)
-        if hasattr(user, 'profile') and user.profile.google_calendar_event_time:
-            hora_riego = user.profile.google_calendar_event_time
-            
-        # Crear evento a la hora configurada del día indicado
-        start_dt = ensure_timezone(datetime.combine(fecha_riego, hora_riego))
-        end_dt = start_dt + timedelta(minutes=30)
-        
-        # Obtener datos de riego para la descripción enriquecida
-        calculos = planta.calculos_riego()
-        agua_ml = calculos.get('recommended_water_ml', 'Variable')
-        
-        # Descripción enriquecida (Igual que en signals.py)
-        descripcion = (
-            f'¡Es hora de regar tu planta "{planta.nombre_personalizado}"!\n\n'
-            f'💧 Cantidad de agua recomendada: {agua_ml} ml.\n'
-            f'🪴 Tipo de planta: {planta.tipo_planta}.'
-        )
-        if motivo:
-            descripcion += f"\n\nNota: {motivo}"
-        
-        body = {
-            'summary': f"💧 Regar: {planta.nombre_personalizado}",
-            'description': descripcion,
-            'start': {
-                'dateTime': start_dt.isoformat(),
-                'timeZone': DEFAULT_TZ,
-            },
-            'end': {
-                'dateTime': end_dt.isoformat(),
-                'timeZone': DEFAULT_TZ,
-            },
-            'colorId': '9',  # 9 = Azul "Blueberry" (Coherencia visual)
-            'reminders': {
-                'useDefault': True, # Usar config del usuario como en signals
-            },
-        }
-        
+        body = cuerpo_evento_riego(user, planta, fecha_riego, motivo, datos_riego)
         event = service.events().insert(calendarId='primary', body=body).execute()
         return event
     
@@ -253,72 +263,122 @@ def create_riego_event(user, planta, fecha_riego, motivo=None):
         return None
 
 
-def update_calendar_event_for_plant(planta):
+def fecha_y_motivo_evento(planta, datos_riego, fecha_riego=None, motivo=None):
+    """
+    Fecha y motivo del evento de una planta: los indicados o, si no, los
+    programados en la planta (proxima_fecha_riego y motivo_riego, que en las
+    outdoor ya incluyen el ajuste por clima). El cálculo base sólo se usa para
+    plantas sin fecha programada.
+    """
+    fecha = fecha_riego or planta.proxima_fecha_riego or datos_riego['next_watering_date']
+    return fecha, motivo or planta.motivo_riego or MOTIVO_EVENTO_DEFAULT
+
+
+def huella_evento(body):
+    """
+    Huella de sincronización de un evento de riego: hash del body (fecha y hora
+    de inicio, cantidad de agua, summary y descripción) sin la nota del motivo,
+    que es texto libre y cambia de redacción sin que cambie el riego.
+    Se guarda en Planta.google_calendar_sync_hash.
+    """
+    descripcion = body.get('description', '').split(SEPARADOR_NOTA, 1)[0]
+    contenido = json.dumps({**body, 'description': descripcion}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def update_calendar_event_for_plant(planta, datos_riego=None, fecha_riego=None, motivo=None):
     """
-    Actualiza el evento de calendario para una planta.
-    Borra el evento anterior (si existe) y crea uno nuevo con la fecha actualizada.
+    Sincroniza el evento de calendario de una planta con su próximo riego.
+    
+    - Si la huella del evento no cambió desde la última sincronización, no llama a la API.
+    - Si cambió, hace patch del evento existente (mismo ID).
+    - Sólo si el evento ya no existe en Google (404/410 o cancelado) crea uno nuevo.
     
     Args:
         planta: Instancia de Planta con fecha_ultimo_riego y frecuencia_riego_dias
+        datos_riego: Resultado de calculos_riego() ya calculado en lote (opcional)
+        fecha_riego: date del evento (opcional; default: planta.proxima_fecha_riego
+                     o, si no tiene, la fecha calculada en datos_riego)
+        motivo: Texto del motivo para la descripción del evento (opcional;
+                default: planta.motivo_riego)
     
     Returns:
-        dict: Evento creado con 'id' o None si hay error
+        dict: Evento sincronizado con 'id' (sólo {'id'} si no hubo cambios) o None si hay error
     """
-    from datetime import timedelta
-    
     user = planta.usuario
     
-    # Calcular fecha del próximo riego usando la lógica del modelo
-    datos_riego = planta.calculos_riego()
-    fecha_proximo_riego = datos_riego['next_watering_date']
+    # Fecha programada en la planta (o la del cálculo base si todavía no tiene)
+    if datos_riego is None:
+        datos_riego = planta.calculos_riego()
+    fecha_proximo_riego, motivo = fecha_y_motivo_evento(planta, datos_riego, fecha_riego, motivo)
     
-    # Borrar evento anterior si existe
-    if planta.google_calendar_event_id:
-        delete_calendar_event(user, planta.google_calendar_event_id)
+    body = cuerpo_evento_riego(user, planta, fecha_proximo_riego, motivo, datos_riego)
+    huella = huella_evento(body)
     
-    # Crear nuevo evento
-    motivo = "Riego recalculado automáticamente según nueva hora preferida"
-    nuevo_evento = create_riego_event(user, planta, fecha_proximo_riego, motivo)
+    # Nada cambió desde la última sincronización: no hay llamada a la API
+    if planta.google_calendar_event_id and planta.google_calendar_sync_hash == huella:
+        return {'id': planta.google_calendar_event_id}
     
-    # Actualizar ID del evento en la planta
-    if nuevo_evento:
-        planta.google_calendar_event_id = nuevo_evento.get('id')
-        planta.save(update_fields=['google_calendar_event_id'])
+    try:
+        service = get_user_calendar_service(user)
+        evento = None
+        
+        # Patch del evento existente
+        if planta.google_calendar_event_id:
+            try:
+                evento = service.events().patch(
+                    calendarId='primary', eventId=planta.google_calendar_event_id, body=body
+                ).execute()
+                # Un evento borrado por el usuario queda 'cancelled': se recrea
+                if evento.get('status') == 'cancelled':
+                    evento = None
+            except HttpError as e:
+                if e.resp.status not in (404, 410):
+                    raise
+                logger.info(f"Evento {planta.google_calendar_event_id} ya no existe en Google, se recrea")
+        
+        # Crear nuevo evento (planta sin evento o evento inexistente)
+        if evento is None:
+            evento = service.events().insert(calendarId='primary', body=body).execute()
+    
+    except Exception as e:
+        logger.error(f"Error al sincronizar evento de riego para {planta.nombre_personalizado}: {e}")
+        return None
+    
+    # Guardar ID y huella en la planta
+    planta.google_calendar_event_id = evento.get('id')
+    planta.google_calendar_sync_hash = huella
+    planta.save(update_fields=['google_calendar_event_id', 'google_calendar_sync_hash'])
     
-    return nuevo_evento
+    return evento
 
 
 def recalculate_all_future_events(user):
     """
     Recalcula y actualiza todos los eventos futuros de riego para un usuario.
     Se llama cuando el usuario cambia su hora preferida de riego.
+    
+    Los eventos se actualizan con patch en batch requests (ver calendar_batch),
+    así 40 plantas son un round trip y no 80 requests.
     """
     from plantas.models import Planta
+    from plantas.services.riego_calculator import calcular_riego_lote
+    from notificaciones.services.calendar_batch import sincronizar_eventos
     
-    # Buscar todas las plantas del usuario que tengan un evento futuro programado
-    plantas_con_evento = Planta.objects.filter(
+    # Buscar todas las plantas del usuario que tengan un evento futuro programado.
+    # Nota: fecha_ultimo_riego es la base, el evento es para el PROXIMO riego
+    plantas_con_evento = list(Planta.objects.filter(
         usuario=user,
-        google_calendar_event_id__isnull=False
-    )
-    
-    count = 0
-    errores = []
+        google_calendar_event_id__isnull=False,
+        fecha_ultimo_riego__isnull=False,
+    ))
+    calculos = calcular_riego_lote(plantas_con_evento)
     
-    for planta in plantas_con_evento:
-        try:
-            # Solo actualizamos si la fecha de riego es futura o hoy
-            if planta.fecha_ultimo_riego: # Nota: fecha_ultimo_riego es la base, el evento es para el PROXIMO
-                 # Calculamos cuando DEBERIA ser el próximo evento basado en la lógica actual
-                 # (Para simplificar, usamos la lógica de update_calendar_event_for_plant que ya hace todo)
-                 update_calendar_event_for_plant(planta)
-                 count += 1
-        except Exception as e:
-            # Capturamos el mensaje de error para diagnóstico
-            error_msg = f"Planta {planta.id}: {str(e)}"
-            logger.warning(f"Error recalculando evento: {error_msg}")
-            errores.append(error_msg)
+    eventos, errores = sincronizar_eventos(user, plantas_con_evento, calculos)
+    for error_msg in errores:
+        logger.warning(f"Error recalculando evento: {error_msg}")
             
-    return count, errores
+    return len(eventos), errores
 
 
 def populate_missing_events(user):
@@ -327,31 +387,21 @@ def populate_missing_events(user):
     Ideal para llamar justo después de que el usuario vincula su cuenta.
     """
     from plantas.models import Planta
+    from plantas.services.riego_calculator import calcular_riego_lote
+    from notificaciones.services.calendar_batch import sincronizar_eventos
     
     # 1. Buscamos plantas sin evento
-    plantas_sin_evento = Planta.objects.filter(
+    plantas_sin_evento = list(Planta.objects.filter(
         usuario=user,
         google_calendar_event_id__isnull=True
-    )
-    
-    count = 0
-    errores = []
+    ))
+    calculos = calcular_riego_lote(plantas_sin_evento)
     
-    logger.info(f"Buscando eventos faltantes para {user.username}... Encontradas {plantas_sin_evento.count()} plantas")
-
-    for planta in plantas_sin_evento:
-        try:
-            # 2. Usamos update_calendar_event_for_plant que ya tiene la lógica de:
-            # - Calcular fecha
-            # - Borrar anterior (aquí no habrá, pero no importa)
-            # - Crear nuevo
-            # - Guardar ID
-            evento = update_calendar_event_for_plant(planta)
-            if evento:
-                count += 1
-        except Exception as e:
-            msg = f"Error creando evento inicial para {planta.nombre_personalizado}: {e}"
-            logger.error(msg)
-            errores.append(msg)
+    logger.info(f"Buscando eventos faltantes para {user.username}... Encontradas {len(plantas_sin_evento)} plantas")
+
+    # 2. Creamos todos los eventos en lote y guardamos sus IDs
+    eventos, errores = sincronizar_eventos(user, plantas_sin_evento, calculos)
+    for msg in errores:
+        logger.error(f"Error creando evento inicial: {msg}")
             
-    return count, errores
\ No newline at end of file
+    return len(eventos), errores
@@ -0,0 +1,175 @@
+"""
+Refresco de tokens OAuth de Google Calendar con single-flight por usuario.
+
+Cuando vence el access token, la señal de Planta, el recálculo en segundo
+plano y el cron lo pedían a la vez: cada uno llamaba a creds.refresh() y
+hacía profile.save() del Profile completo, con refrescos redundantes y
+carreras sobre google_refresh_token. Acá:
+
+- Se refresca proactivamente MARGEN_REFRESCO antes de google_token_expiry
+  (o si no se conoce el vencimiento), antes del umbral propio de google-auth.
+- Un solo refresco por usuario a la vez: un lock por usuario dentro del
+  proceso y un lock cache.add entre procesos (requiere un cache compartido,
+  ver settings.CACHES). Quien espera relee los tokens que dejó el primero en
+  lugar de refrescar de nuevo.
+- El request al token endpoint no corre dentro de una transacción: después
+  se escriben sólo los campos de token en una transacción corta.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from google.auth.transport import requests as google_requests
+from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URI = 'https://oauth2.googleapis.com/token'
+# Se refresca si faltan menos de estos minutos (google-auth usa 3m45s)
+MARGEN_REFRESCO = timedelta(minutes=5)
+CAMPOS_TOKEN = ['google_access_token', 'google_refresh_token', 'google_token_expiry']
+PREFIJO_LOCK = 'google_token_refresh'
+ESPERA_LOCK_SEGUNDOS = 15
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+_metricas = {'refrescos': 0, 'reutilizados': 0, 'errores': 0}
+_metricas_lock = threading.Lock()
+
+
+def _lock_de(user_id):
+    with _locks_lock:
+        return _locks.setdefault(user_id, threading.Lock())
+
+
+def _contar(metrica):
+    with _metricas_lock:
+        _metricas[metrica] += 1
+
+
+def obtener_metricas():
+    """Copia de los contadores de refrescos hechos, reutilizados (otro ya había refrescado) y errores."""
+    with _metricas_lock:
+        return dict(_metricas)
+
+
+def credenciales(profile):
+    """Credentials de google-auth con los tokens y el vencimiento del perfil."""
+    expiry = profile.google_token_expiry
+    if expiry is not None and timezone.is_aware(expiry):
+        # google-auth compara contra utcnow() naive
+        expiry = timezone.make_naive(expiry, dt_timezone.utc)
+    return Credentials(
+        token=profile.google_access_token,
+        refresh_token=profile.google_refresh_token,
+        token_uri=TOKEN_URI,
+        client_id=settings.GOOGLE_CLIENT_ID,
+        client_secret=settings.GOOGLE_CLIENT_SECRET,
+        expiry=expiry,
+    )
+
+
+def necesita_refresco(profile, ahora=None):
+    """Si el access token vence (o no se sabe cuándo vence) dentro de MARGEN_REFRESCO."""
+    if not profile.google_refresh_token:
+        return False
+    if not profile.google_access_token or profile.google_token_expiry is None:
+        return True
+    return profile.google_token_expiry - (ahora or timezone.now()) < MARGEN_REFRESCO
+
+
+def _copiar_tokens(origen, destino):
+    for campo in CAMPOS_TOKEN:
+        setattr(destino, campo, getattr(origen, campo))
+
+
+def _releer_tokens(profile):
+    from notificaciones.models import Profile
+
+    return Profile.objects.only('id', *CAMPOS_TOKEN).get(pk=profile.pk)
+
+
+def _esperar_refresco_ajeno(profile):
+    """Espera (hasta ESPERA_LOCK_SEGUNDOS) a que otro proceso deje el token vigente."""
+    limite = time.monotonic() + ESPERA_LOCK_SEGUNDOS
+    while time.monotonic() < limite:
+        time.sleep(0.2)
+        actual = _releer_tokens(profile)
+        if not necesita_refresco(actual):
+            return actual
+    return None
+
+
+def asegurar_token_vigente(user):
+    """
+    Deja vigente el access token del perfil del usuario, refrescándolo si hace falta.
+
+    Returns:
+        El Profile del usuario con los tokens actualizados en memoria
+
+    Raises:
+        google.auth.exceptions.RefreshError: Si Google rechaza el refresh token
+    """
+    from notificaciones.models import Profile
+
+    profile = user.profile
+    if not necesita_refresco(profile):
+        return profile
+
+    with _lock_de(user.id):
+        # Quizás otro thread u otro proceso ya lo refrescó mientras esperábamos
+        actual = _releer_tokens(profile)
+        if not necesita_refresco(actual):
+            _copiar_tokens(actual, profile)
+            _contar('reutilizados')
+            return profile
+
+        clave_lock = f'{PREFIJO_LOCK}:{user.id}'
+        tengo_lock = cache.add(clave_lock, 1, timeout=ESPERA_LOCK_SEGUNDOS)
+        try:
+            if not tengo_lock:
+                # Otro proceso está refrescando: usar su token en lugar de pedir otro
+                ajeno = _esperar_refresco_ajeno(profile)
+                if ajeno is not None:
+                    _copiar_tokens(ajeno, profile)
+                    _contar('reutilizados')
+                    return profile
+
+            # El request HTTP al token endpoint va sin transacción ni locks de BD
+            logger.info(f"Refrescando token de Google para {user.username}")
+            creds = credenciales(actual)
+            try:
+                creds.refresh(google_requests.Request())
+            except Exception:
+                _contar('errores')
+                raise
+
+            campos = {
+                'google_access_token': creds.token,
+                'google_token_expiry': creds.expiry.replace(tzinfo=dt_timezone.utc) if creds.expiry else None,
+            }
+            # Google a veces devuelve un nuevo refresh_token, aunque no siempre.
+            if creds.refresh_token and creds.refresh_token != actual.google_refresh_token:
+                campos['google_refresh_token'] = creds.refresh_token
+
+            # Escritura corta: sólo los campos de token, salvo que otro proceso ya haya
+            # guardado un token vigente (no pisar su refresh token)
+            with transaction.atomic():
+                fila = Profile.objects.select_for_update().only('id', *CAMPOS_TOKEN).get(pk=profile.pk)
+                if necesita_refresco(fila):
+                    Profile.objects.filter(pk=profile.pk).update(**campos)
+                    for campo, valor in campos.items():
+                        setattr(fila, campo, valor)
+            _copiar_tokens(fila, profile)
+            _contar('refrescos')
+        finally:
+            if tengo_lock:
+                cache.delete(clave_lock)
+    return profile
@@ -50,7 +50,11 @@ def update_event_on_planta_save(sender, instance, created, **kwargs):
     """
     # Evitar recursión infinita o reacciones a actualizaciones internas:
     # Si la actualización es SOLO del campo google_calendar_event_id, no hacemos nada.
-    if kwargs.get('update_fields') and 'google_calendar_event_id' in kwargs['update_fields']:
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'google_calendar_event_id' in update_fields:
+        return
+    # Tampoco si sólo se persistió la programación calculada (cron outdoor, config indoor)
+    if update_fields and set(update_fields) <= set(Planta.CAMPOS_PROGRAMACION):
         return
 
     _update_or_create_next_watering_event(instance)
@@ -1,3 +1,513 @@
-from django.test import TestCase
+import json
+import threading
+import time as reloj
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+import httplib2
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+
+from plantas.models import Planta
+from .models import Profile, Tarea
+from .services import calendar_batch, calendar_clients, cola_tareas, google_calendar, google_tokens
+
+
+def error_http(status, razon=None):
+    """HttpError como los que devuelve googleapiclient (con `reason` en error_details)."""
+    contenido = {'error': {'code': status, 'message': 'error', 'errors': [{'reason': razon}] if razon else []}}
+    return HttpError(httplib2.Response({'status': status}), json.dumps(contenido).encode())
+
+
+class RequestFalso:
+    """Request sin ejecutar de la Calendar API: su resultado lo decide el servicio falso."""
+
+    def __init__(self, servicio, metodo, parametros):
+        self.servicio = servicio
+        self.metodo = metodo
+        self.parametros = parametros
+
+    def execute(self):
+        self.servicio.llamadas.append(self.metodo)
+        return self.servicio.responder(self)
+
+
+class LoteFalso:
+    def __init__(self, servicio, callback):
+        self.servicio = servicio
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.servicio.lotes.append([request.metodo for _, request in self.requests])
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, self.servicio.responder(request), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+
+class EventosFalsos:
+    def __init__(self, servicio):
+        self.servicio = servicio
+
+    def insert(self, **parametros):
+        return RequestFalso(self.servicio, 'insert', parametros)
+
+    def patch(self, **parametros):
+        return RequestFalso(self.servicio, 'patch', parametros)
+
+    def delete(self, **parametros):
+        return RequestFalso(self.servicio, 'delete', parametros)
+
+
+class ServicioFalso:
+    """
+    Cliente de Calendar en memoria. Guarda los eventos creados, las llamadas
+    individuales y los lotes; `responder` se puede reemplazar en cada test.
+    """
+
+    def __init__(self):
+        self.eventos = {}
+        self.llamadas = []
+        self.lotes = []
+        self._contador = 0
+
+    def events(self):
+        return EventosFalsos(self)
+
+    def new_batch_http_request(self, callback):
+        return LoteFalso(self, callback)
+
+    def responder(self, request):
+        parametros = request.parametros
+        if request.metodo == 'insert':
+            self._contador += 1
+            evento = {'id': f'evento{self._contador}', 'status': 'confirmed', **parametros['body']}
+            self.eventos[evento['id']] = evento
+            return evento
+        if parametros['eventId'] not in self.eventos:
+            raise error_http(404)
+        if request.metodo == 'delete':
+            del self.eventos[parametros['eventId']]
+            return ''
+        self.eventos[parametros['eventId']].update(parametros['body'])
+        return self.eventos[parametros['eventId']]
+
+
+@mock.patch.object(calendar_batch, 'BACKOFF_BASE_SEGUNDOS', 0)
+class EjecutarLoteTests(SimpleTestCase):
+    """ejecutar_lote agrupa en batches, mapea resultados por clave y reintenta sólo lo transitorio."""
+
+    def test_mapea_resultados_por_clave_en_tandas(self):
+        servicio = ServicioFalso()
+        operaciones = [
+            (f'planta{i}', servicio.events().insert(calendarId='primary', body={'summary': str(i)}))
+            for i in range(calendar_batch.LIMITE_LOTE + 10)
+        ]
+        resultados = calendar_batch.ejecutar_lote(servicio, operaciones)
+
+        self.assertEqual([len(lote) for lote in servicio.lotes], [calendar_batch.LIMITE_LOTE, 10])
+        self.assertEqual(set(resultados), {clave for clave, _ in operaciones})
+        for i in range(len(operaciones)):
+            evento, error = resultados[f'planta{i}']
+            self.assertIsNone(error)
+            self.assertEqual(evento['summary'], str(i))
+
+    def test_reintenta_solo_errores_transitorios(self):
+        servicio = ServicioFalso()
+        intentos = {}
+        errores = {
+            'caida': [error_http(503)],
+            'cuota': [error_http(403, 'rateLimitExceeded'), error_http(429)],
+            'prohibida': [error_http(403, 'forbidden')],
+            'invalida': [error_http(400)],
+        }
+
+        def responder(request):
+            clave = request.parametros['body']['summary']
+            intentos[clave] = intentos.get(clave, 0) + 1
+            pendientes = errores.get(clave, [])
+            if len(pendientes) >= intentos[clave]:
+                raise pendientes[intentos[clave] - 1]
+            return {'id': clave}
+
+        servicio.responder = responder
+        claves = ['ok', 'caida', 'cuota', 'prohibida', 'invalida']
+        resultados = calendar_batch.ejecutar_lote(servicio, [
+            (clave, servicio.events().insert(calendarId='primary', body={'summary': clave})) for clave in claves
+        ])
+
+        self.assertEqual(intentos, {'ok': 1, 'caida': 2, 'cuota': 3, 'prohibida': 1, 'invalida': 1})
+        for clave in ('ok', 'caida', 'cuota'):
+            self.assertEqual(resultados[clave], ({'id': clave}, None))
+        self.assertEqual(resultados['prohibida'][1].resp.status, 403)
+        self.assertEqual(resultados['invalida'][1].resp.status, 400)
+
+    def test_se_rinde_tras_max_reintentos(self):
+        servicio = ServicioFalso()
+        servicio.responder = mock.Mock(side_effect=error_http(500))
+        resultados = calendar_batch.ejecutar_lote(servicio, [
+            ('planta', servicio.events().insert(calendarId='primary', body={}))
+        ])
+        self.assertEqual(servicio.responder.call_count, calendar_batch.MAX_REINTENTOS + 1)
+        self.assertEqual(resultados['planta'][1].resp.status, 500)
+
+    def test_falla_del_round_trip_completo(self):
+        servicio = ServicioFalso()
+        ejecutar = LoteFalso.execute
+        fallas = [ConnectionError('reset')]
+
+        def execute(lote):
+            if fallas:
+                raise fallas.pop()
+            return ejecutar(lote)
+
+        with mock.patch.object(LoteFalso, 'execute', execute):
+            resultados = calendar_batch.ejecutar_lote(servicio, [
+                (i, servicio.events().insert(calendarId='primary', body={})) for i in range(3)
+            ])
+        self.assertTrue(all(error is None for _, error in resultados.values()))
+        self.assertEqual(len(servicio.eventos), 3)
+
+
+class SincronizacionEventosTests(TestCase):
+    """Eventos de riego: se omiten los que no cambiaron y se recrean los borrados en Google."""
+
+    def setUp(self):
+        self.servicio = ServicioFalso()
+        parche = mock.patch.object(google_calendar, 'get_user_calendar_service', return_value=self.servicio)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+        usuario = User.objects.create_user('calendar', password='x')
+        self.plantas = [
+            Planta.objects.create(
+                usuario=usuario, nombre_personalizado=f'Planta {i}', tamano_planta='Mediana',
+                tamano_maceta_litros=10, fecha_ultimo_riego=date.today(),
+            )
+            for i in range(3)
+        ]
+        Profile.objects.filter(user=usuario).update(google_access_token='token', google_refresh_token='refresh')
+        self.user = User.objects.get(pk=usuario.pk)
+
+    def _planta(self, indice=0):
+        return Planta.objects.select_related('usuario__profile').get(pk=self.plantas[indice].pk)
+
+    def test_evento_sin_cambios_no_llama_a_la_api(self):
+        evento = google_calendar.update_calendar_event_for_plant(self._planta())
+        self.assertEqual(self.servicio.llamadas, ['insert'])
+        planta = self._planta()
+        self.assertEqual(planta.google_calendar_event_id, evento['id'])
+        self.assertTrue(planta.google_calendar_sync_hash)
+
+        self.servicio.llamadas.clear()
+        self.assertEqual(google_calendar.update_calendar_event_for_plant(planta), {'id': evento['id']})
+        self.assertEqual(self.servicio.llamadas, [])
+
+    def test_cambio_del_evento_hace_patch(self):
+        google_calendar.update_calendar_event_for_plant(self._planta())
+        self.servicio.llamadas.clear()
+        Planta.objects.filter(pk=self.plantas[0].pk).update(proxima_fecha_riego=date.today() + timedelta(days=9))
+
+        evento = google_calendar.update_calendar_event_for_plant(self._planta())
+        self.assertEqual(self.servicio.llamadas, ['patch'])
+        self.assertEqual(evento['id'], self._planta().google_calendar_event_id)
+
+    def test_evento_borrado_en_google_se_recrea(self):
+        anterior = google_calendar.update_calendar_event_for_plant(self._planta())['id']
+        self.servicio.eventos.clear()
+        self.servicio.llamadas.clear()
+        Planta.objects.filter(pk=self.plantas[0].pk).update(proxima_fecha_riego=date.today() + timedelta(days=9))
+
+        evento = google_calendar.update_calendar_event_for_plant(self._planta())
+        self.assertEqual(self.servicio.llamadas, ['patch', 'insert'])
+        self.assertNotEqual(evento['id'], anterior)
+        self.assertEqual(self._planta().google_calendar_event_id, evento['id'])
+
+    def test_usa_la_fecha_y_el_motivo_programados(self):
+        fecha = date.today() + timedelta(days=12)
+        Planta.objects.filter(pk=self.plantas[0].pk).update(proxima_fecha_riego=fecha, motivo_riego='Lluvia intensa')
+        evento = google_calendar.update_calendar_event_for_plant(self._planta())
+        self.assertTrue(evento['start']['dateTime'].startswith(fecha.isoformat()))
+        self.assertIn('Nota: Lluvia intensa', evento['description'])
+
+    def test_la_nota_del_motivo_no_cambia_la_huella(self):
+        google_calendar.update_calendar_event_for_plant(self._planta(), motivo='Calor')
+        self.servicio.llamadas.clear()
+        google_calendar.update_calendar_event_for_plant(self._planta(), motivo='Otro texto')
+        self.assertEqual(self.servicio.llamadas, [])
+
+    def test_sincronizacion_en_lote(self):
+        creados, errores = google_calendar.populate_missing_events(self.user)
+        self.assertEqual((creados, errores), (3, []))
+        self.assertEqual(self.servicio.lotes, [['insert'] * 3])
+
+        # Sin cambios: ni un request
+        self.servicio.lotes.clear()
+        self.assertEqual(google_calendar.recalculate_all_future_events(self.user), (0, []))
+        self.assertEqual(self.servicio.lotes, [])
+
+        # Nueva hora preferida: patch en lote; el evento borrado en Google se recrea
+        Profile.objects.filter(user=self.user).update(google_calendar_event_time=time(20, 0))
+        borrado = self._planta(1).google_calendar_event_id
+        del self.servicio.eventos[borrado]
+        actualizados, errores = google_calendar.recalculate_all_future_events(User.objects.get(pk=self.user.pk))
+        self.assertEqual((actualizados, errores), (3, []))
+        self.assertEqual(self.servicio.lotes, [['patch'] * 3, ['insert']])
+        self.assertNotEqual(self._planta(1).google_calendar_event_id, borrado)
+        for indice in range(3):
+            evento = self.servicio.eventos[self._planta(indice).google_calendar_event_id]
+            self.assertIn('T20:00:00', evento['start']['dateTime'])
+
+
+class RefrescoTokenTests(TransactionTestCase):
+    """asegurar_token_vigente refresca una sola vez por usuario aunque lo pidan varios a la vez."""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('tokens', password='x')
+        Profile.objects.filter(user=self.usuario).update(
+            google_access_token='viejo', google_refresh_token='refresh',
+            google_token_expiry=timezone.now() + timedelta(minutes=2), calendar_id='mi-calendario',
+        )
+        self.refrescos = []
+
+    def _refrescar(self, credenciales, request):
+        self.refrescos.append(credenciales.refresh_token)
+        reloj.sleep(0.2)
+        credenciales.token = 'nuevo'
+        credenciales.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def _usuario(self):
+        return User.objects.select_related('profile').get(pk=self.usuario.pk)
+
+    def test_un_solo_refresco_con_varios_threads(self):
+        usuarios = [self._usuario() for _ in range(6)]
+        antes = google_tokens.obtener_metricas()
+
+        with mock.patch.object(Credentials, 'refresh', lambda creds, request: self._refrescar(creds, request)):
+            threads = [
+                threading.Thread(target=google_tokens.asegurar_token_vigente, args=(usuario,))
+                for usuario in usuarios
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(self.refrescos, ['refresh'])
+        self.assertTrue(all(usuario.profile.google_access_token == 'nuevo' for usuario in usuarios))
+        despues = google_tokens.obtener_metricas()
+        self.assertEqual(despues['refrescos'] - antes['refrescos'], 1)
+        self.assertEqual(despues['reutilizados'] - antes['reutilizados'], 5)
+
+        profile = Profile.objects.get(user=self.usuario)
+        self.assertEqual(profile.google_access_token, 'nuevo')
+        self.assertEqual(profile.google_refresh_token, 'refresh')
+        self.assertGreater(profile.google_token_expiry, timezone.now() + timedelta(minutes=55))
+        # Sólo se escriben los campos de token
+        self.assertEqual(profile.calendar_id, 'mi-calendario')
+        self.assertIsNone(cache.get(f'{google_tokens.PREFIJO_LOCK}:{self.usuario.pk}'))
+
+    def test_token_vigente_no_se_refresca(self):
+        Profile.objects.filter(user=self.usuario).update(google_token_expiry=timezone.now() + timedelta(hours=1))
+        with mock.patch.object(Credentials, 'refresh') as refresh:
+            profile = google_tokens.asegurar_token_vigente(self._usuario())
+        refresh.assert_not_called()
+        self.assertEqual(profile.google_access_token, 'viejo')
+
+    def test_usa_el_token_que_refresca_otro_proceso(self):
+        cache.add(f'{google_tokens.PREFIJO_LOCK}:{self.usuario.pk}', 1)
+
+        def otro_proceso_termina(segundos):
+            Profile.objects.filter(user=self.usuario).update(
+                google_access_token='ajeno', google_token_expiry=timezone.now() + timedelta(hours=1)
+            )
+
+        with mock.patch.object(Credentials, 'refresh') as refresh, \
+                mock.patch.object(google_tokens.time, 'sleep', otro_proceso_termina):
+            profile = google_tokens.asegurar_token_vigente(self._usuario())
+        refresh.assert_not_called()
+        self.assertEqual(profile.google_access_token, 'ajeno')
+
+    def test_error_de_refresco_libera_el_lock(self):
+        antes = google_tokens.obtener_metricas()['errores']
+        with mock.patch.object(Credentials, 'refresh', side_effect=RefreshError('invalid_grant')):
+            with self.assertRaises(RefreshError):
+                google_tokens.asegurar_token_vigente(self._usuario())
+        self.assertEqual(google_tokens.obtener_metricas()['errores'], antes + 1)
+        self.assertIsNone(cache.get(f'{google_tokens.PREFIJO_LOCK}:{self.usuario.pk}'))
+        self.assertEqual(Profile.objects.get(user=self.usuario).google_access_token, 'viejo')
+
+
+class ColaTareasTests(TestCase):
+    """encolar/reclamar/ejecutar de la cola persistente de Calendar."""
+
+    def setUp(self):
+        self.handler = mock.Mock(return_value={'eventos_actualizados': 3})
+        parche = mock.patch.dict(cola_tareas.HANDLERS, {'recalcular_eventos': self.handler})
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_encolar_no_duplica_pendientes_con_la_misma_clave(self):
+        primera = cola_tareas.encolar('recalcular_eventos', {'user_id': 1}, clave='recalcular_eventos:1')
+        segunda = cola_tareas.encolar('recalcular_eventos', {'user_id': 1}, clave='recalcular_eventos:1')
+        self.assertEqual(primera.pk, segunda.pk)
+        cola_tareas.encolar('recalcular_eventos', {'user_id': 2}, clave='recalcular_eventos:2')
+        self.assertEqual(Tarea.objects.count(), 2)
+
+        with self.assertRaises(ValueError):
+            cola_tareas.encolar('desconocida')
+
+    def test_reclamar_entrega_cada_tarea_a_un_solo_worker(self):
+        tarea = cola_tareas.encolar('recalcular_eventos', {'user_id': 1})
+        cola_tareas.encolar('recalcular_eventos', {'user_id': 2}, demora_segundos=3600)
+
+        reclamadas = cola_tareas.reclamar('worker-a', cantidad=5)
+        self.assertEqual([t.pk for t in reclamadas], [tarea.pk])
+        self.assertEqual(reclamadas[0].estado, 'en_curso')
+        self.assertEqual(reclamadas[0].worker, 'worker-a')
+        self.assertEqual(reclamadas[0].intentos, 1)
+        self.assertEqual(cola_tareas.reclamar('worker-b', cantidad=5), [])
+
+    def test_lease_vencido_se_reclama_o_se_marca_error(self):
+        retomable = cola_tareas.encolar('recalcular_eventos', {'user_id': 1})
+        agotada = cola_tareas.encolar('recalcular_eventos', {'user_id': 2}, max_intentos=1)
+        cola_tareas.reclamar('worker-a', cantidad=2)
+        Tarea.objects.update(lease_hasta=timezone.now() - timedelta(seconds=1))
+
+        reclamadas = cola_tareas.reclamar('worker-b', cantidad=5)
+        self.assertEqual([t.pk for t in reclamadas], [retomable.pk])
+        self.assertEqual(reclamadas[0].worker, 'worker-b')
+        self.assertEqual(reclamadas[0].intentos, 2)
+
+        agotada.refresh_from_db()
+        self.assertEqual(agotada.estado, 'error')
+        self.assertIsNotNone(agotada.terminada)
+
+    def test_ejecutar_guarda_el_resultado(self):
+        cola_tareas.encolar('recalcular_eventos', {'user_id': 1})
+        tarea, = cola_tareas.reclamar('worker-a')
+        self.assertEqual(cola_tareas.ejecutar(tarea), 'ok')
+
+        tarea.refresh_from_db()
+        self.handler.assert_called_once_with({'user_id': 1})
+        self.assertEqual(tarea.resultado, {'eventos_actualizados': 3})
+        self.assertIsNone(tarea.lease_hasta)
+        self.assertIsNotNone(tarea.terminada)
+
+    def test_ejecutar_reintenta_con_backoff_hasta_max_intentos(self):
+        self.handler.side_effect = cola_tareas.TareaIncompleta('2 eventos con error')
+        cola_tareas.encolar('recalcular_eventos', {'user_id': 1}, max_intentos=2)
+
+        tarea, = cola_tareas.reclamar('worker-a')
+        antes = timezone.now()
+        self.assertEqual(cola_tareas.ejecutar(tarea), 'pendiente')
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.intentos, 1)
+        self.assertEqual(tarea.worker, '')
+        self.assertIn('TareaIncompleta', tarea.ultimo_error)
+        demora = (tarea.disponible_en - antes).total_seconds()
+        self.assertGreaterEqual(demora, 24)
+        self.assertLessEqual(demora, 37)
+
+        Tarea.objects.update(disponible_en=timezone.now())
+        tarea, = cola_tareas.reclamar('worker-a')
+        self.assertEqual(cola_tareas.ejecutar(tarea), 'error')
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.intentos, 2)
+        self.assertIsNotNone(tarea.terminada)
+
+    def test_reintento_con_otra_pendiente_igual_se_cancela(self):
+        self.handler.side_effect = RuntimeError('boom')
+        cola_tareas.encolar('recalcular_eventos', {'user_id': 1}, clave='recalcular_eventos:1')
+        tarea, = cola_tareas.reclamar('worker-a')
+        # Mientras corría, la vista encoló otra con la misma clave
+        nueva = cola_tareas.encolar('recalcular_eventos', {'user_id': 1}, clave='recalcular_eventos:1')
+        self.assertNotEqual(nueva.pk, tarea.pk)
+
+        self.assertEqual(cola_tareas.ejecutar(tarea), 'cancelada')
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, 'cancelada')
+        self.assertIn('misma clave', tarea.ultimo_error)
+        self.assertEqual(Tarea.objects.get(pk=nueva.pk).estado, 'pendiente')
+
+
+class ClientesCalendarTests(SimpleTestCase):
+    """LRU por proceso de clientes de Calendar: reutilización, invalidación y tope."""
+
+    def setUp(self):
+        calendar_clients.limpiar()
+        self.addCleanup(calendar_clients.limpiar)
+        parche = mock.patch.object(calendar_clients, '_construir', side_effect=lambda credenciales: object())
+        self.construir = parche.start()
+        self.addCleanup(parche.stop)
+
+    def _obtener(self, user_id, tokens=('access', 'refresh')):
+        return calendar_clients.obtener(user_id, tokens, lambda: f'credenciales-{user_id}')[1]
+
+    def _delta(self, antes):
+        despues = calendar_clients.obtener_metricas()
+        return {clave: despues[clave] - antes[clave] for clave in ('hits', 'misses', 'invalidaciones', 'descartes')}
+
+    def test_reutiliza_el_cliente_mientras_no_cambien_los_tokens(self):
+        antes = calendar_clients.obtener_metricas()
+        servicio = self._obtener(1)
+        self.assertIs(self._obtener(1), servicio)
+        self.assertEqual(self.construir.call_count, 1)
+        # Token refrescado o cuenta re-vinculada: cliente nuevo
+        self.assertIsNot(self._obtener(1, ('otro access', 'refresh')), servicio)
+        self.assertEqual(self._delta(antes), {'hits': 1, 'misses': 2, 'invalidaciones': 0, 'descartes': 0})
+
+    def test_invalidar(self):
+        servicio = self._obtener(1)
+        antes = calendar_clients.obtener_metricas()
+        calendar_clients.invalidar(1)
+        calendar_clients.invalidar(1)
+        self.assertIsNot(self._obtener(1), servicio)
+        self.assertEqual(self._delta(antes)['invalidaciones'], 1)
+
+    @override_settings(GOOGLE_CALENDAR_CLIENTS_MAX=2)
+    def test_lru_acotado(self):
+        servicios = {user_id: self._obtener(user_id) for user_id in (1, 2)}
+        self._obtener(1)  # el 2 pasa a ser el menos usado
+        antes = calendar_clients.obtener_metricas()
+        self._obtener(3)
+        self.assertEqual(calendar_clients.obtener_metricas()['clientes'], 2)
+        self.assertEqual(self._delta(antes)['descartes'], 1)
+        self.assertIs(self._obtener(1), servicios[1])
+        self.assertIsNot(self._obtener(2), servicios[2])
+
+
+class ServicioCalendarTests(TestCase):
+    """get_user_calendar_service arma el cliente desde el discovery estático y lo cachea."""
+
+    def setUp(self):
+        calendar_clients.limpiar()
+        self.addCleanup(calendar_clients.limpiar)
+        self.user = User.objects.create_user('cliente_calendar', password='x')
+        self.user.profile.google_access_token = 'access'
+        self.user.profile.google_refresh_token = 'refresh'
+        self.user.profile.google_token_expiry = timezone.now() + timedelta(hours=1)
+        self.user.profile.save()
+
+    def test_cliente_cacheado_por_usuario(self):
+        with mock.patch('googleapiclient.discovery.build') as build:
+            servicio = google_calendar.get_user_calendar_service(self.user)
+            self.assertIs(google_calendar.get_user_calendar_service(self.user), servicio)
+        build.assert_not_called()
+        self.assertEqual(calendar_clients.documento_discovery()['name'], 'calendar')
+        self.assertTrue(hasattr(servicio.events(), 'patch'))
+
+        Profile.objects.filter(user=self.user).update(google_access_token='nuevo')
+        self.user.profile.refresh_from_db()
+        self.assertIsNot(google_calendar.get_user_calendar_service(self.user), servicio)
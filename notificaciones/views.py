@@ -11,6 +11,7 @@ from django_ratelimit.decorators import ratelimit
 from django.utils.decorators import method_decorator
 from datetime import datetime
 from .services.google_calendar import get_oauth_flow
+from .services import calendar_clients
 from .models import Profile
 from django.contrib.auth.models import User
 from plantas.models import AuditLog
@@ -128,25 +129,21 @@ def google_calendar_callback(request):
     profile.google_refresh_token = credentials.refresh_token
     profile.google_token_expiry = credentials.expiry
     profile.save()
+    # Tokens nuevos: descartar el cliente de Calendar cacheado con los anteriores
+    calendar_clients.invalidar(request.user.id)
     
     # Registrar auditoría
     AuditLog.log(request.user, 'CALENDAR_LINK', request)
     logger.info(f"Google Calendar vinculado para usuario: {request.user.username}")
     
-    # --- NUEVO: Rellenar eventos faltantes en background ---
-    import threading
-    from .services.google_calendar import populate_missing_events
+    # Rellenar eventos faltantes en background: lo ejecuta el worker (run_worker)
+    from .services.cola_tareas import encolar
     
-    def run_population(user_inst):
-        try:
-            logger.info(f"Iniciando población de eventos de calendar para {user_inst.username}")
-            count, errs = populate_missing_events(user_inst)
-            logger.info(f"Población finalizada para {user_inst.username}: {count} eventos creados, {len(errs)} errores")
-        except Exception as e:
-            logger.error(f"Error en población de eventos para {user_inst.username}: {e}")
-
-    t = threading.Thread(target=run_population, args=(request.user,))
-    t.daemon = True
-    t.start()
+    encolar(
+        'poblar_eventos',
+        {'user_id': request.user.id},
+        clave=f'poblar_eventos:{request.user.id}',
+    )
+    logger.info(f"Población de eventos de calendar encolada para {request.user.username}")
     
     return redirect('/dashboard/')
@@ -1,12 +1,38 @@
 from django.contrib import admin
-from .models import Planta, Riego
+from .models import Planta, Riego, GeocodeCache, CronRun
 
 
 @admin.register(Planta)
 class PlantaAdmin(admin.ModelAdmin):
     list_display = ("id", "usuario", "nombre_personalizado", "tipo_planta", "tamano_planta",
-                    "tamano_maceta_litros", "fecha_ultimo_riego", "en_floracion")
+                    "tamano_maceta_litros", "fecha_ultimo_riego", "proxima_fecha_riego", "en_floracion")
 
 @admin.register(Riego)
 class RiegoAdmin(admin.ModelAdmin):
-    list_display = ("id", "planta", "fecha", "cantidad_agua_ml")
\ No newline at end of file
+    list_display = ("id", "planta", "fecha", "cantidad_agua_ml")
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ("consulta", "direccion_formateada", "latitud", "longitud", "hits", "ultimo_uso", "creado_en")
+    search_fields = ("consulta", "direccion_formateada")
+    ordering = ("-ultimo_uso",)
+
+    def changelist_view(self, request, extra_context=None):
+        # Hit ratio global en el título del listado
+        from .services.geocoding import tasa_de_hits
+
+        tasa = tasa_de_hits()
+        extra_context = extra_context or {}
+        if tasa['tasa'] is not None:
+            extra_context['title'] = (
+                f"Cache de Geocoding — hit ratio {tasa['tasa']:.1%} "
+                f"({tasa['hits']} hits / {tasa['misses']} misses)"
+            )
+        return super().changelist_view(request, extra_context=extra_context)
+
+@admin.register(CronRun)
+class CronRunAdmin(admin.ModelAdmin):
+    list_display = ("inicio", "comando", "worker", "estado", "duracion_s", "localidades_procesadas",
+                    "localidades_error", "eventos_actualizados", "regresiones")
+    list_filter = ("comando", "estado")
+    readonly_fields = ("reporte",)
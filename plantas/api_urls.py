@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (PlantaViewSet, RiegoViewSet, RegisterView, WeatherDataView, 
                     ConfiguracionUsuarioView, LocalidadUsuarioView, LocalidadClimaView, 
-                    TriggerRecalculoOutdoorView)
+                    LocalidadClimaHistorialView, TriggerRecalculoOutdoorView)
 from .viewsets import AuditLogViewSet
 from notificaciones.api.views import UpdateCalendarTimeView
 
@@ -17,6 +17,7 @@ urlpatterns = [
     path('configuracion-usuario/', ConfiguracionUsuarioView.as_view(), name='configuracion-usuario'),
     path('localidad-outdoor/', LocalidadUsuarioView.as_view(), name='localidad-outdoor'),
     path('localidad-outdoor/clima/', LocalidadClimaView.as_view(), name='localidad-outdoor-clima'),
+    path('localidad-outdoor/clima/historial/', LocalidadClimaHistorialView.as_view(), name='localidad-outdoor-clima-historial'),
     path('recalcular-outdoor/', TriggerRecalculoOutdoorView.as_view(), name='recalcular-outdoor'),
     path('configuracion-calendario/', UpdateCalendarTimeView.as_view(), name='configuracion-calendario'),
     path('', include(router.urls)),
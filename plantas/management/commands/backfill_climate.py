@@ -0,0 +1,121 @@
+"""
+Management command para completar días de clima que el cron no procesó.
+
+Busca huecos en RegistroClima por localidad, consulta el clima histórico de todo
+el rango con un request por celda de grilla, inserta los registros faltantes y
+re-aplica el clima a las plantas outdoor en orden de fecha.
+
+Uso:
+    # Últimos 7 días (hasta ayer)
+    python manage.py backfill_climate
+
+    # Un rango puntual
+    python manage.py backfill_climate --desde 2026-03-01 --hasta 2026-03-10
+
+    # Sólo mostrar los huecos, sin consultar ni guardar nada
+    python manage.py backfill_climate --dry-run
+
+    # Contra un proveedor local (ej: un stub para pruebas)
+    WEATHER_HISTORY_URL=http://localhost:8001/v1/forecast python manage.py backfill_climate
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from plantas.services.weather_service import localidades_con_plantas_outdoor
+from plantas.services.clima_historico import completar_huecos, detectar_huecos, DIAS_DEFAULT
+from plantas.services import http_client
+from datetime import date, datetime, timedelta
+
+
+class Command(BaseCommand):
+    help = 'Completa los días sin registro de clima con datos históricos y recalcula los riegos outdoor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=DIAS_DEFAULT,
+            help=f'Días hacia atrás a revisar si no se indica --desde (default: {DIAS_DEFAULT})',
+        )
+        parser.add_argument(
+            '--desde',
+            default=None,
+            help='Primera fecha a revisar (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--hasta',
+            default=None,
+            help='Última fecha a revisar (YYYY-MM-DD, default: ayer)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Requests simultáneos al proveedor de clima histórico (default: 1)',
+        )
+        parser.add_argument(
+            '--sin-calendario',
+            action='store_true',
+            help='No actualizar Google Calendar con las fechas recalculadas',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Sólo muestra los huecos encontrados',
+        )
+
+    def handle(self, *args, **options):
+        hasta = self._fecha(options['hasta'], '--hasta') or date.today() - timedelta(days=1)
+        desde = self._fecha(options['desde'], '--desde') or hasta - timedelta(days=max(1, options['dias']) - 1)
+        if desde > hasta:
+            raise CommandError('--desde debe ser anterior o igual a --hasta')
+
+        start_time = datetime.now()
+        http_client.reiniciar_metricas()
+        http_client.ajustar_pool(max(1, options['concurrency']))
+        self.stdout.write(self.style.SUCCESS(f'\n🕰️  Backfill de clima outdoor: {desde} → {hasta}'))
+
+        localidades = list(localidades_con_plantas_outdoor().select_related('user', 'user__profile'))
+
+        if options['dry_run']:
+            huecos = detectar_huecos(localidades, desde, hasta)
+            nombres = {localidad.id: localidad.nombre_localidad for localidad in localidades}
+            for localidad_id, fechas in huecos.items():
+                self.stdout.write(f'  • {nombres[localidad_id]}: {len(fechas)} días ({fechas[0]} → {fechas[-1]})')
+            self.stdout.write(f'\n📍 {len(huecos)} localidades con huecos, {sum(len(f) for f in huecos.values())} días faltantes\n')
+            return
+
+        resumen = completar_huecos(
+            localidades, desde, hasta,
+            concurrencia=options['concurrency'],
+            actualizar_calendario=not options['sin_calendario'],
+        )
+
+        duration = (datetime.now() - start_time).total_seconds()
+        self.stdout.write(self.style.SUCCESS(f'\n✅ Backfill completado en {duration:.2f} segundos'))
+        self.stdout.write(f'\n📊 Resumen:')
+        self.stdout.write(f'   • Localidades con huecos: {resumen["localidades_con_huecos"]}')
+        self.stdout.write(f'   • Días faltantes: {resumen["dias_faltantes"]}')
+        self.stdout.write(f'   • Consultas al proveedor histórico: {resumen["consultas"]} (una por celda de grilla)')
+        self.stdout.write(f'   • Registros de clima creados: {resumen["registros_creados"]}')
+        self.stdout.write(f'   • Plantas con programación modificada: {resumen["plantas_recalculadas"]}')
+        self.stdout.write(f'   • Eventos de Calendar actualizados: {resumen["eventos_actualizados"]}')
+        for endpoint, metrica in http_client.obtener_metricas().items():
+            self.stdout.write(
+                f'   • HTTP {endpoint}: {metrica["llamadas"]} requests, {metrica["errores"]} errores, '
+                f'promedio {metrica["promedio_s"] * 1000:.0f} ms'
+            )
+        if resumen['errores']:
+            self.stdout.write(self.style.WARNING(f'   • Celdas con error: {resumen["errores"]}'))
+        self.stdout.write('')
+
+    def _fecha(self, valor, opcion):
+        if not valor:
+            return None
+        try:
+            fecha = parse_date(valor)
+        except ValueError:
+            fecha = None
+        if fecha is None:
+            raise CommandError(f'{opcion} debe tener formato YYYY-MM-DD')
+        return fecha
@@ -0,0 +1,73 @@
+"""
+Management command para compactar el historial de clima.
+
+Resume en ResumenClima (semanal y mensual) los RegistroClima diarios anteriores
+al horizonte de retención y después los elimina. El horizonte es
+settings.CLIMA_RETENCION_DIAS, alineado al inicio de mes.
+
+Uso:
+    # Con la retención configurada
+    python manage.py compact_climate_history
+
+    # Conservar sólo 6 meses de diarios
+    python manage.py compact_climate_history --dias 180
+
+    # Sólo mostrar cuántos registros se compactarían
+    python manage.py compact_climate_history --dry-run
+
+    # Reconstruir los resúmenes de todo el historial diario existente
+    python manage.py compact_climate_history --rebuild
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from plantas.models import RegistroClima
+from plantas.services.clima_resumen import compactar_historial, recalcular_periodo, inicio_periodo, PERIODOS
+from datetime import datetime
+
+
+class Command(BaseCommand):
+    help = 'Resume y elimina los registros diarios de clima anteriores al horizonte de retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=None,
+            help='Días de registros diarios a conservar (default: settings.CLIMA_RETENCION_DIAS)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Sólo muestra cuántos registros se compactarían',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recalcula antes los resúmenes de todos los períodos con registros diarios',
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] is not None and options['dias'] < 0:
+            raise CommandError('--dias no puede ser negativo')
+
+        start_time = datetime.now()
+
+        if options['rebuild']:
+            fechas = set(RegistroClima.objects.order_by().values_list('fecha', flat=True).distinct())
+            periodos = sorted({(periodo, inicio_periodo(fecha, periodo)) for fecha in fechas for periodo in PERIODOS})
+            resumenes = sum(recalcular_periodo(periodo, inicio) for periodo, inicio in periodos)
+            self.stdout.write(f'🔁 Resúmenes reconstruidos: {resumenes} ({len(periodos)} períodos)')
+
+        resumen = compactar_historial(dias=options['dias'], dry_run=options['dry_run'])
+
+        duration = (datetime.now() - start_time).total_seconds()
+        if options['dry_run']:
+            self.stdout.write(
+                f'\n🗜️  Se compactarían {resumen["registros_compactados"]} registros diarios anteriores a {resumen["corte"]}\n'
+            )
+            return
+        self.stdout.write(self.style.SUCCESS(f'\n🗜️  Historial de clima compactado en {duration:.2f} segundos'))
+        self.stdout.write(f'   • Corte: {resumen["corte"]}')
+        self.stdout.write(f'   • Registros diarios eliminados: {resumen["registros_compactados"]}')
+        self.stdout.write(f'   • Resúmenes actualizados: {resumen["resumenes_actualizados"]}')
+        self.stdout.write('')
@@ -0,0 +1,48 @@
+"""
+Management command para podar el cache de geocoding (GeocodeCache) en orden LRU.
+
+Uso:
+    # Conservar las 5000 consultas usadas más recientemente
+    python manage.py prune_geocode_cache
+
+    # Además, borrar las que no se usan hace más de 180 días
+    python manage.py prune_geocode_cache --max-entries 2000 --unused-days 180
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from plantas.models import GeocodeCache
+from plantas.services.geocoding import podar, tasa_de_hits
+
+MAX_ENTRADAS_DEFAULT = 5000
+
+
+class Command(BaseCommand):
+    help = 'Poda el cache de geocoding, eliminando las consultas usadas menos recientemente'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-entries',
+            type=int,
+            default=MAX_ENTRADAS_DEFAULT,
+            help=f'Cantidad máxima de entradas a conservar (default: {MAX_ENTRADAS_DEFAULT})',
+        )
+        parser.add_argument(
+            '--unused-days',
+            type=int,
+            default=None,
+            help='Eliminar también las entradas sin uso en los últimos N días',
+        )
+
+    def handle(self, *args, **options):
+        if options['max_entries'] < 0 or (options['unused_days'] is not None and options['unused_days'] < 0):
+            raise CommandError('--max-entries y --unused-days no pueden ser negativos')
+
+        tasa = tasa_de_hits()
+        antes = GeocodeCache.objects.count()
+        eliminadas = podar(max_entradas=options['max_entries'], dias_sin_uso=options['unused_days'])
+
+        self.stdout.write(self.style.SUCCESS(f'\n🧹 Cache de geocoding podado: {eliminadas} entradas eliminadas'))
+        self.stdout.write(f'   • Entradas: {antes} → {antes - eliminadas}')
+        if tasa['tasa'] is not None:
+            self.stdout.write(f'   • Hit ratio antes de podar: {tasa["tasa"]:.1%} ({tasa["hits"]} hits / {tasa["misses"]} misses)')
+        self.stdout.write('')
@@ -8,15 +8,63 @@ Uso:
     
     # Con verbose output
     python manage.py update_outdoor_climate --verbose
+    
+    # Consultando el clima de hasta 8 localidades en paralelo y con 4 workers de Calendar
+    python manage.py update_outdoor_climate --concurrency 8 --calendar-concurrency 4
+    
+    # Con un máximo de 500 consultas a la Weather API, clima actual + pronóstico (prioriza riegos más próximos)
+    python manage.py update_outdoor_climate --max-api-calls 500
+    
+    # Reanudando una corrida interrumpida (saltea lo ya hecho hoy, sin repetir consultas)
+    python manage.py update_outdoor_climate --resume
+    
+    # Repartido en 4 procesos fijos (cada uno con su parte de las celdas de grilla)
+    python manage.py update_outdoor_climate --shard 0/4
+    
+    # Workers dinámicos: cada uno reclama lotes pendientes hasta terminar (implica --resume)
+    python manage.py update_outdoor_climate --claim
+    
+    # Reporte de métricas por fase en JSON ("-" = stdout); siempre se guarda también en CronRun
+    python manage.py update_outdoor_climate --report-json /tmp/outdoor.json
+
+El trabajo corre en un pipeline por etapas (ver plantas.services.outdoor_pipeline).
+
+Progreso: cada RegistroClima del día funciona como checkpoint de su localidad.
+- Existe el registro: el clima ya se consultó.
+- riegos_recalculados: las plantas ya se recalcularon y guardaron (se marca en
+  la misma transacción que el bulk_update de plantas de cada lote).
+- calendario_actualizado: Google Calendar ya se actualizó para esa localidad.
+Volver a correr es seguro: el ajuste se aplica sobre el cálculo base, no se acumula.
 """
 
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from plantas.models import LocalidadUsuario, Planta
-from plantas.services.weather_service import obtener_y_guardar_clima
-from plantas.services.outdoor_calculator import recalcular_fecha_riego_outdoor
-from notificaciones.services.google_calendar import update_calendar_event_for_plant
-from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
+from plantas.models import LocalidadUsuario, RegistroClima, PronosticoClima
+from plantas.services.weather_service import (
+    localidades_con_plantas_outdoor, aplicar_presupuesto_consultas, dias_pronostico
+)
+from plantas.services.outdoor_pipeline import PipelineOutdoor, TAMANO_COLA_DEFAULT
+from plantas.services import http_client, weather_cache
+from plantas.services.cron_metricas import armar_reporte, guardar_corrida
+from plantas.services.reparto_trabajo import (
+    parsear_shard, ids_del_shard, id_worker_default, ReclamosWorker, LEASE_MINUTOS_DEFAULT
+)
+from django.db.models import F, Exists, OuterRef
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from datetime import date, datetime
+from itertools import islice
+import json
+import sys
+
+
+def _en_lotes(iterable, tamano):
+    """Parte un iterable en listas de hasta `tamano` elementos."""
+    iterador = iter(iterable)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
 
 
 class Command(BaseCommand):
@@ -28,81 +76,196 @@ class Command(BaseCommand):
             action='store_true',
             help='Muestra output detallado de la ejecución',
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Cantidad máxima de consultas simultáneas a la Weather API (default: 1, secuencial)',
+        )
+        parser.add_argument(
+            '--calendar-concurrency',
+            type=int,
+            default=1,
+            help='Workers que actualizan Google Calendar en paralelo con el resto del pipeline (default: 1)',
+        )
+        parser.add_argument(
+            '--queue-size',
+            type=int,
+            default=TAMANO_COLA_DEFAULT,
+            help=f'Lotes en espera entre etapas del pipeline (default: {TAMANO_COLA_DEFAULT})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Localidades procesadas por lote (lecturas y escrituras en BD agrupadas) (default: 200)',
+        )
+        parser.add_argument(
+            '--max-api-calls',
+            type=int,
+            default=None,
+            help='Presupuesto de consultas a la Weather API (clima actual + pronóstico) en esta corrida; prioriza las plantas con riego más próximo',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Reanuda la corrida de hoy: saltea localidades terminadas y reutiliza el clima ya guardado',
+        )
+        parser.add_argument(
+            '--shard',
+            default=None,
+            help='Procesa sólo la parte i de n (formato i/n, ej: 0/4), repartida por celda de grilla',
+        )
+        parser.add_argument(
+            '--claim',
+            action='store_true',
+            help='Reclama lotes de localidades pendientes con lease, para correr varios workers en paralelo',
+        )
+        parser.add_argument(
+            '--worker-id',
+            default=None,
+            help='Identificador del worker en modo --claim (default: host-pid)',
+        )
+        parser.add_argument(
+            '--lease-minutes',
+            type=int,
+            default=LEASE_MINUTOS_DEFAULT,
+            help=f'Duración del reclamo de un lote en modo --claim; se renueva cuando cada etapa lo toma (default: {LEASE_MINUTOS_DEFAULT})',
+        )
+        parser.add_argument(
+            '--report-json',
+            default=None,
+            metavar='PATH',
+            help='Escribe el reporte de métricas por fase en JSON en PATH ("-" = stdout)',
+        )
 
     def handle(self, *args, **options):
-        verbose = options['verbose']
+        self.verbose = options['verbose']
+        concurrency = max(1, options['concurrency'])
+        batch_size = max(1, options['batch_size'])
+        max_api_calls = options['max_api_calls']
+        claim = options['claim']
+        # Los workers reclaman lo pendiente de hoy: siempre reanudan
+        self.resume = options['resume'] or claim
+        self.hoy = date.today()
+        shard = None
+        if options['shard']:
+            try:
+                shard = parsear_shard(options['shard'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        
+        # Con --report-json - el stdout queda sólo para el JSON: el progreso va a stderr
+        # (el stream de --stderr/call_command o sys.stderr, sin el estilo de error de self.stderr)
+        self.salida_json = self.stdout
+        if options['report_json'] == '-':
+            self.stdout = OutputWrapper(options.get('stderr') or sys.stderr)
         
         start_time = datetime.now()
+        inicio_corrida = timezone.now()
+        http_client.reiniciar_metricas()
+        # Una conexión keep-alive por consulta simultánea a la Weather API
+        http_client.ajustar_pool(concurrency)
         self.stdout.write(self.style.SUCCESS(f'\n🌤️  Iniciando actualización de clima outdoor - {start_time.strftime("%Y-%m-%d %H:%M:%S")}'))
         
-        # === PASO 1: Obtener todas las localidades activas ===
-        localidades_activas = LocalidadUsuario.objects.filter(activo=True)
+        # === PASO 1: Obtener las localidades activas que tienen plantas outdoor ===
+        localidades_activas = localidades_con_plantas_outdoor().select_related('user', 'user__profile')
+        total_activas = LocalidadUsuario.objects.filter(activo=True).count()
+        completadas = 0
+        con_clima_hoy = frozenset()
+        reclamos = None
+        
+        if shard:
+            localidades_activas = localidades_activas.filter(id__in=ids_del_shard(localidades_activas, *shard))
+            self.stdout.write(f'   ⧉ Shard {shard[0]}/{shard[1]}')
+        
+        if self.resume:
+            # Saltear las localidades que hoy ya completaron todos los pasos
+            registros_hoy = RegistroClima.objects.filter(localidad_id=OuterRef('pk'), fecha=self.hoy)
+            terminadas = registros_hoy.filter(riegos_recalculados=True, calendario_actualizado=True)
+            completadas = localidades_activas.filter(Exists(terminadas)).count()
+            localidades_activas = localidades_activas.exclude(Exists(terminadas))
+            con_clima_hoy = frozenset(localidades_activas.filter(Exists(registros_hoy)).values_list('id', flat=True))
+            self.stdout.write(f'   ↻ Reanudando: {completadas} localidades ya completadas hoy, {len(con_clima_hoy)} con clima ya guardado')
+        
+        if claim:
+            # Los lotes se reclaman a medida que se procesan (otros workers toman el resto)
+            worker = options['worker_id'] or id_worker_default()
+            reclamos = ReclamosWorker(self.hoy, worker, options['lease_minutes'])
+            localidades = None
+            total_localidades = localidades_activas.count()
+            omitidas_presupuesto = 0
+            self.stdout.write(f'   ⚑ Worker {worker}: reclamando lotes de {batch_size} (lease {options["lease_minutes"]} min)')
+        elif max_api_calls is not None:
+            # Con presupuesto: primero las localidades con el riego más próximo (o sin calcular)
+            priorizadas = localidades_activas.order_by(F('proximo_riego').asc(nulls_first=True), 'id')
+            con_pronostico_hoy = frozenset()
+            if self.resume:
+                con_pronostico_hoy = frozenset(PronosticoClima.objects.filter(
+                    localidad_id__in=localidades_activas.values('id'), emitido=self.hoy
+                ).values_list('localidad_id', flat=True))
+            seleccionadas, omitidas = aplicar_presupuesto_consultas(
+                priorizadas, max_api_calls, con_clima_hoy, dias_pronostico(), con_pronostico_hoy
+            )
+            # Todas las seleccionadas se consultan: se reordenan por coordenadas para no partir celdas entre lotes
+            localidades = sorted(seleccionadas, key=lambda l: (l.latitud, l.longitud, l.id))
+            total_localidades = len(seleccionadas)
+            omitidas_presupuesto = len(omitidas)
+        else:
+            # Ordenadas por coordenadas para que las de una misma celda caigan en el mismo lote
+            localidades = localidades_activas.order_by('latitud', 'longitud', 'id').iterator(chunk_size=batch_size)
+            total_localidades = localidades_activas.count()
+            omitidas_presupuesto = 0
+        
+        sin_plantas = total_activas - total_localidades - omitidas_presupuesto - completadas
+        if sin_plantas > 0 and not shard:
+            self.stdout.write(f'   ↷ {sin_plantas} localidades activas sin plantas outdoor omitidas')
+        if omitidas_presupuesto:
+            self.stdout.write(self.style.WARNING(f'   ↷ {omitidas_presupuesto} localidades omitidas por presupuesto de Weather API ({max_api_calls} consultas)'))
+        
+        pipeline = PipelineOutdoor(
+            hoy=self.hoy,
+            resume=self.resume,
+            concurrencia_clima=concurrency,
+            concurrencia_calendario=options['calendar_concurrency'],
+            tamano_cola=options['queue_size'],
+            reporte=self._reporte,
+            reclamos=reclamos,
+        )
+        # Identificación de la corrida en CronRun (worker o shard cuando se reparte)
+        worker_corrida = worker if claim else (options['shard'] or '')
+        opciones_corrida = {
+            'concurrency': concurrency, 'calendar_concurrency': options['calendar_concurrency'],
+            'batch_size': batch_size, 'queue_size': options['queue_size'], 'max_api_calls': max_api_calls,
+            'resume': self.resume, 'shard': options['shard'], 'claim': claim,
+        }
         
-        if not localidades_activas.exists():
-            self.stdout.write(self.style.WARNING('⚠️  No hay localidades outdoor activas configuradas'))
+        if not total_localidades:
+            self.stdout.write(self.style.WARNING('⚠️  No hay localidades outdoor para procesar en esta corrida'))
+            # También queda registrada (con cero localidades) para el historial de CronRun
+            fin_corrida = timezone.now()
+            reporte = armar_reporte(pipeline, inicio_corrida, fin_corrida, opciones_corrida, 0)
+            guardar_corrida('update_outdoor_climate', reporte, inicio_corrida, fin_corrida, 'ok', worker_corrida)
+            self._escribir_reporte_json(reporte, options['report_json'])
             return
         
-        self.stdout.write(f'\n📍 Encontradas {localidades_activas.count()} localidades activas')
+        self.stdout.write(f'\n📍 Encontradas {total_localidades} localidades a procesar (concurrencia: {concurrency}, lote: {batch_size})')
         
-        localidades_procesadas = 0
-        localidades_error = 0
-        plantas_actualizadas = 0
+        # === PASO 2: Procesar las localidades por lotes (pipeline clima → BD → Calendar) ===
+        if claim:
+            lotes = self._lotes_reclamados(
+                pipeline, reclamos, localidades_activas.order_by('latitud', 'longitud', 'id'), batch_size, max_api_calls
+            )
+        else:
+            lotes = _en_lotes(localidades, batch_size)
         
-        # === PASO 2: Procesar cada localidad ===
-        for localidad in localidades_activas:
-            try:
-                if verbose:
-                    self.stdout.write(f'\n  → Procesando: {localidad.nombre_localidad}')
-                
-                # Obtener y guardar clima actual
-                registro_clima = obtener_y_guardar_clima(localidad)
-                
-                if not registro_clima:
-                    self.stdout.write(self.style.ERROR(f'    ✗ Error al obtener clima para {localidad.nombre_localidad}'))
-                    localidades_error += 1
-                    continue
-                
-                if verbose:
-                    self.stdout.write(f'    ✓ Clima actualizado: {registro_clima.temperatura_max}°C, {registro_clima.precipitacion_mm}mm lluvia')
-                
-                localidades_procesadas += 1
-                
-                # === PASO 3: Recalcular riegos para plantas outdoor de este usuario ===
-                plantas_outdoor = Planta.objects.filter(
-                    usuario=localidad.user,
-                    tipo_cultivo='outdoor'
-                )
-                
-                for planta in plantas_outdoor:
-                    try:
-                        # Recalcular fecha de riego basándose en el clima
-                        resultado = recalcular_fecha_riego_outdoor(planta, registro_clima)
-                        
-                        if verbose:
-                            self.stdout.write(f'    ✓ Planta "{planta.nombre_personalizado}": {resultado["dias_restantes"]} días hasta riego')
-                            if resultado.get('reseteo_por_lluvia'):
-                                self.stdout.write(f'      🌧️  Riego reseteado por lluvia intensa')
-                        
-                        # === PASO 4: Actualizar Google Calendar si está vinculado ===
-                        if planta.google_calendar_event_id:
-                            try:
-                                update_calendar_event_for_plant(planta)
-                                if verbose:
-                                    self.stdout.write(f'      📅 Google Calendar actualizado')
-                            except Exception as e:
-                                if verbose:
-                                    self.stdout.write(self.style.WARNING(f'      ⚠️  No se pudo actualizar Calendar: {str(e)}'))
-                        
-                        plantas_actualizadas += 1
-                        
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f'    ✗ Error al recalcular planta "{planta.nombre_personalizado}": {str(e)}'))
-                        continue
-                
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  ✗ Error al procesar localidad: {str(e)}'))
-                localidades_error += 1
-                continue
+        try:
+            pipeline.ejecutar(lotes)
+        except Exception:
+            fin_corrida = timezone.now()
+            reporte = armar_reporte(pipeline, inicio_corrida, fin_corrida, opciones_corrida, total_localidades)
+            guardar_corrida('update_outdoor_climate', reporte, inicio_corrida, fin_corrida, 'error', worker_corrida)
+            raise
         
         # === RESUMEN FINAL ===
         end_time = datetime.now()
@@ -110,8 +273,102 @@ class Command(BaseCommand):
         
         self.stdout.write(self.style.SUCCESS(f'\n✅ Actualización completada en {duration:.2f} segundos'))
         self.stdout.write(f'\n📊 Resumen:')
-        self.stdout.write(f'   • Localidades procesadas: {localidades_procesadas}/{localidades_activas.count()}')
-        self.stdout.write(f'   • Plantas actualizadas: {plantas_actualizadas}')
-        if localidades_error > 0:
-            self.stdout.write(self.style.WARNING(f'   • Errores: {localidades_error}'))
+        self.stdout.write(f'   • Localidades procesadas: {pipeline.localidades_procesadas}/{total_localidades}')
+        self.stdout.write(
+            f'   • Plantas recalculadas: {pipeline.plantas_actualizadas} '
+            f'({pipeline.plantas_cambiadas} con cambios, {pipeline.plantas_sin_cambios} sin cambios)'
+        )
+        self.stdout.write(
+            f'   • Eventos de Calendar actualizados: {pipeline.eventos_actualizados} '
+            f'({pipeline.eventos_omitidos} omitidos por fecha sin cambios)'
+        )
+        self.stdout.write(f'   • Consultas a Weather API: {pipeline.consultas_api} (una por celda de grilla sin clima en cache)')
+        if pipeline.dias_pronostico:
+            self.stdout.write(
+                f'   • Pronóstico ({pipeline.dias_pronostico} días): {pipeline.consultas_pronostico} consultas (celdas sin pronóstico en cache), '
+                f'{pipeline.pronosticos_cambiados} días con ajuste distinto al pronóstico anterior, '
+                f'{pipeline.riegos_postergados} riegos postergados por lluvia pronosticada'
+            )
+        if pipeline.latencias:
+            promedio = sum(latencia for latencia, _ in pipeline.latencias) / len(pipeline.latencias)
+            maxima, localidad_lenta = max(pipeline.latencias)
+            self.stdout.write(f'   • Latencia Weather API: promedio {promedio * 1000:.0f} ms, máxima {maxima * 1000:.0f} ms ({localidad_lenta})')
+        for endpoint, metrica in http_client.obtener_metricas().items():
+            self.stdout.write(
+                f'   • HTTP {endpoint}: {metrica["llamadas"]} requests, {metrica["errores"]} errores, '
+                f'promedio {metrica["promedio_s"] * 1000:.0f} ms'
+            )
+        cache_clima = weather_cache.obtener_metricas()
+        self.stdout.write(
+            f'   • Cache de clima: {cache_clima["hits"]} hits, {cache_clima["misses"]} misses, '
+            f'{cache_clima["esperas"]} esperas por single-flight'
+        )
+        for etapa in pipeline.etapas.values():
+            self.stdout.write(
+                f'   • Etapa {etapa.nombre} (x{etapa.concurrencia}): {etapa.items} items, '
+                f'{etapa.throughput:.1f}/s, activa {etapa.duracion_s:.2f} s, '
+                f'cola de entrada máx. {etapa.cola_max} (prom. {etapa.cola_promedio:.1f})'
+            )
+        for nombre, metrica in pipeline.fases.items():
+            fase = metrica.resumen()
+            if not fase['cantidad']:
+                continue
+            self.stdout.write(
+                f'   • Fase {nombre}: {fase["cantidad"]} items, total {fase["total_s"]:.2f} s, '
+                f'p50 {fase["p50_ms"]} ms, p90 {fase["p90_ms"]} ms, máx. {fase["max_ms"]} ms, {fase["errores"]} errores'
+            )
+        if pipeline.localidades_perdidas:
+            self.stdout.write(self.style.WARNING(
+                f'   • Localidades perdidas por lease vencido (las procesa otro worker): {pipeline.localidades_perdidas}'
+            ))
+        if pipeline.localidades_error > 0:
+            self.stdout.write(self.style.WARNING(f'   • Errores: {pipeline.localidades_error}'))
+        
+        # === REPORTE DE MÉTRICAS (JSON + CronRun) ===
+        fin_corrida = timezone.now()
+        reporte = armar_reporte(pipeline, inicio_corrida, fin_corrida, opciones_corrida, total_localidades)
+        con_errores = pipeline.localidades_error or pipeline.fases['calendario'].errores
+        corrida = guardar_corrida(
+            'update_outdoor_climate', reporte, inicio_corrida, fin_corrida,
+            'parcial' if con_errores else 'ok', worker_corrida,
+        )
+        for regresion in reporte.get('regresiones', []):
+            self.stdout.write(self.style.WARNING(
+                f'   • Regresión: {regresion["metrica"]} = {regresion["valor"]} '
+                f'({regresion["factor"]}x la mediana de las últimas corridas, {regresion["mediana"]})'
+            ))
+        if corrida is not None:
+            self.stdout.write(f'   • Métricas guardadas en CronRun #{corrida.id}')
+        self._escribir_reporte_json(reporte, options['report_json'])
         self.stdout.write('')
+
+    def _escribir_reporte_json(self, reporte, destino):
+        """Escribe el reporte en el archivo `destino` o, con "-", solo en stdout."""
+        if not destino:
+            return
+        contenido = json.dumps(reporte, cls=DjangoJSONEncoder, ensure_ascii=False, indent=2)
+        if destino == '-':
+            self.salida_json.write(contenido)
+        else:
+            with open(destino, 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido)
+            self.stdout.write(f'   • Reporte JSON: {destino}')
+
+    def _reporte(self, mensaje, nivel='info'):
+        """Salida del pipeline: el detalle y los avisos de Calendar sólo con --verbose."""
+        if nivel in ('detalle', 'warning') and not self.verbose:
+            return
+        if nivel == 'error':
+            mensaje = self.style.ERROR(mensaje)
+        elif nivel == 'warning':
+            mensaje = self.style.WARNING(mensaje)
+        self.stdout.write(mensaje)
+
+    def _lotes_reclamados(self, pipeline, reclamos, localidades, batch_size, max_api_calls):
+        """Reclama lotes hasta que no quede trabajo pendiente (o se agote el presupuesto)."""
+        while max_api_calls is None or pipeline.consultas_api + pipeline.consultas_pronostico < max_api_calls:
+            lote = reclamos.reclamar(localidades, batch_size)
+            if not lote:
+                return
+            self._reporte(f'\n  ⚑ Lote reclamado: {len(lote)} localidades', 'detalle')
+            yield lote
@@ -0,0 +1,114 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:21
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+# Copia congelada de plantas.services.riego_calculator (sólo la frecuencia):
+# la migración no debe depender del código de la app, que puede cambiar después.
+SIZE_MAP = {'Pequeña': -1.0, 'pequeña': -1.0, 'Mediana': 0.0, 'mediana': 0.0, 'Grande': 1.0, 'grande': 1.0}
+
+
+def offset_temperatura(temperatura_externa):
+    """Ajuste de frecuencia (días) por temperatura."""
+    if temperatura_externa is None:
+        return 0.0
+    if temperatura_externa > 30:
+        return -2.0
+    if temperatura_externa > 28:
+        return -1.0
+    if temperatura_externa > 25:
+        return -0.5
+    if temperatura_externa < 12:
+        return 2.0
+    if temperatura_externa < 15:
+        return 1.0
+    if temperatura_externa < 18:
+        return 0.5
+    return 0.0
+
+
+def offset_humedad(humedad_externa):
+    """Ajuste de frecuencia (días) por humedad relativa."""
+    if humedad_externa is None:
+        return 0.0
+    if humedad_externa < 30:
+        return -1.0
+    if humedad_externa < 40:
+        return -0.5
+    if humedad_externa > 70:
+        return 1.0
+    if humedad_externa > 60:
+        return 0.5
+    return 0.0
+
+
+def frecuencia_riego(planta, temperatura_externa, humedad_externa):
+    """Frecuencia de riego en días (manual para 'Otras', heurística Cannabis para el resto)."""
+    if planta.categoria_botanica == 'Otras':
+        return planta.frecuencia_riego_manual or 3
+
+    litros = max(planta.tamano_maceta_litros, 0.1)
+    size = planta.tamano_planta
+    base = litros / 2.0 if litros > 0 else 2.0
+    ratio_offset = 0.0
+    if size in ['Grande', 'grande'] and litros < 10:
+        ratio_offset = -1.0
+    elif size in ['Pequeña', 'pequeña'] and litros > 15:
+        ratio_offset = 0.5
+    stage_offset = -1.0 if planta.en_floracion else 0.0
+    return int(max(2, min(7, round(
+        base + SIZE_MAP.get(size, 0.0) + ratio_offset + stage_offset
+        + offset_temperatura(temperatura_externa) + offset_humedad(humedad_externa), 0
+    ))))
+
+
+def backfill_programacion(apps, schema_editor):
+    """Calcula proxima_fecha_riego/frecuencia_riego_dias de las plantas existentes."""
+    Planta = apps.get_model('plantas', 'Planta')
+    ConfiguracionUsuario = apps.get_model('plantas', 'ConfiguracionUsuario')
+
+    configs = {
+        user_id: (temperatura, humedad)
+        for user_id, temperatura, humedad in ConfiguracionUsuario.objects.values_list(
+            'user_id', 'temperatura_promedio', 'humedad_relativa'
+        )
+    }
+
+    pendientes = []
+    for planta in Planta.objects.all().iterator(chunk_size=500):
+        clima = configs.get(planta.usuario_id, (None, None)) if planta.tipo_cultivo == 'indoor' else (None, None)
+        planta.frecuencia_riego_dias = frecuencia_riego(planta, *clima)
+        planta.proxima_fecha_riego = planta.fecha_ultimo_riego + timedelta(days=planta.frecuencia_riego_dias)
+        pendientes.append(planta)
+        if len(pendientes) >= 500:
+            Planta.objects.bulk_update(pendientes, ['proxima_fecha_riego', 'frecuencia_riego_dias'])
+            pendientes = []
+    if pendientes:
+        Planta.objects.bulk_update(pendientes, ['proxima_fecha_riego', 'frecuencia_riego_dias'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0011_add_categoria_botanica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planta',
+            name='frecuencia_riego_dias',
+            field=models.IntegerField(blank=True, help_text='Frecuencia de riego calculada en días', null=True),
+        ),
+        migrations.AddField(
+            model_name='planta',
+            name='proxima_fecha_riego',
+            field=models.DateField(blank=True, db_index=True, help_text='Fecha del próximo riego calculada (indexada para filtrar plantas a regar)', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='planta',
+            index=models.Index(fields=['usuario', 'proxima_fecha_riego'], name='plantas_pla_usuario_d3497f_idx'),
+        ),
+        migrations.RunPython(backfill_programacion, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:28
+
+from django.db import migrations, models
+
+
+# Copia congelada de plantas.services.outdoor_calculator.calcular_ajuste_por_clima:
+# la migración no debe depender del código de la app, que puede cambiar después.
+def calcular_ajuste_por_clima(clima_dia):
+    """Ajuste en días del próximo riego según el clima del día (ver outdoor_calculator)."""
+    temp_max = clima_dia.get('temperatura_max', 25)
+    humedad = clima_dia.get('humedad_promedio', 50)
+    precipitacion = clima_dia.get('precipitacion_mm', 0)
+    viento = clima_dia.get('velocidad_viento_kmh', 0)
+
+    ajuste_dias = 0
+    motivos = []
+
+    if precipitacion > 15:
+        return {
+            'ajuste_dias': 0,
+            'resetear_riego': True,
+            'motivo': f"Lluvia intensa ({precipitacion:.1f}mm) - se considera como riego",
+        }
+    elif precipitacion > 5:
+        ajuste_dias += 1
+        motivos.append(f"Lluvia moderada ({precipitacion:.1f}mm) +1 día")
+    elif precipitacion > 2:
+        ajuste_dias += 0.5
+        motivos.append(f"Lluvia leve ({precipitacion:.1f}mm) +0.5 días")
+
+    if temp_max > 35:
+        ajuste_dias -= 2
+        motivos.append(f"Calor extremo ({temp_max:.1f}°C) -2 días")
+    elif temp_max > 30:
+        ajuste_dias -= 1
+        motivos.append(f"Calor alto ({temp_max:.1f}°C) -1 día")
+    elif temp_max > 25:
+        ajuste_dias -= 0.5
+        motivos.append(f"Temperatura alta ({temp_max:.1f}°C) -0.5 días")
+    elif temp_max < 15:
+        ajuste_dias += 0.5
+        motivos.append(f"Temperatura baja ({temp_max:.1f}°C) +0.5 días")
+
+    if humedad < 30:
+        ajuste_dias -= 0.5
+        motivos.append(f"Humedad baja ({humedad:.1f}%) -0.5 días")
+    elif humedad > 80:
+        ajuste_dias += 0.5
+        motivos.append(f"Humedad alta ({humedad:.1f}%) +0.5 días")
+
+    if viento > 25:
+        ajuste_dias -= 0.5
+        motivos.append(f"Viento fuerte ({viento:.1f}km/h) -0.5 días")
+
+    if not motivos:
+        motivos.append("Condiciones normales - sin ajuste")
+
+    return {
+        'ajuste_dias': max(-3, min(3, ajuste_dias)),
+        'resetear_riego': False,
+        'motivo': '; '.join(motivos),
+    }
+
+
+def backfill_ajuste(apps, schema_editor):
+    """Calcula y guarda el ajuste de riego de los registros de clima existentes."""
+    RegistroClima = apps.get_model('plantas', 'RegistroClima')
+
+    pendientes = []
+    for registro in RegistroClima.objects.all().iterator(chunk_size=500):
+        resultado = calcular_ajuste_por_clima({
+            'temperatura_max': registro.temperatura_max,
+            'temperatura_min': registro.temperatura_min,
+            'humedad_promedio': registro.humedad_promedio,
+            'precipitacion_mm': registro.precipitacion_mm,
+            'velocidad_viento_kmh': registro.velocidad_viento_kmh,
+        })
+        registro.ajuste_dias = resultado['ajuste_dias']
+        registro.resetear_riego = resultado['resetear_riego']
+        registro.motivo_ajuste = resultado['motivo']
+        pendientes.append(registro)
+        if len(pendientes) >= 500:
+            RegistroClima.objects.bulk_update(pendientes, ['ajuste_dias', 'resetear_riego', 'motivo_ajuste'])
+            pendientes = []
+    if pendientes:
+        RegistroClima.objects.bulk_update(pendientes, ['ajuste_dias', 'resetear_riego', 'motivo_ajuste'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0012_planta_proxima_fecha_riego'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroclima',
+            name='ajuste_dias',
+            field=models.FloatField(blank=True, help_text='Días a ajustar el próximo riego (negativo = adelantar)', null=True),
+        ),
+        migrations.AddField(
+            model_name='registroclima',
+            name='motivo_ajuste',
+            field=models.CharField(blank=True, default='', help_text='Explicación del ajuste', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='registroclima',
+            name='resetear_riego',
+            field=models.BooleanField(default=False, help_text='Si la lluvia del día cuenta como riego'),
+        ),
+        migrations.RunPython(backfill_ajuste, migrations.RunPython.noop),
+    ]
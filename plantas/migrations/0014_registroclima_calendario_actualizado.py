@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0013_registroclima_ajuste'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroclima',
+            name='calendario_actualizado',
+            field=models.BooleanField(default=False, help_text='Si ya se actualizó Google Calendar con este registro'),
+        ),
+    ]
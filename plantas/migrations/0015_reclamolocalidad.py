@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0014_registroclima_calendario_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReclamoLocalidad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('worker', models.CharField(max_length=100)),
+                ('expira_en', models.DateTimeField(help_text='Pasado este momento otro worker puede reclamar la localidad')),
+                ('localidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reclamos', to='plantas.localidadusuario')),
+            ],
+            options={
+                'verbose_name': 'Reclamo de Localidad',
+                'verbose_name_plural': 'Reclamos de Localidades',
+                'unique_together': {('localidad', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:35
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0015_reclamolocalidad'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registroclima',
+            name='fecha',
+            field=models.DateField(default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0016_registroclima_fecha_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consulta', models.CharField(help_text='Texto buscado, normalizado', max_length=255, unique=True)),
+                ('latitud', models.FloatField()),
+                ('longitud', models.FloatField()),
+                ('direccion_formateada', models.CharField(max_length=255)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_uso', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Geocoding cacheado',
+                'verbose_name_plural': 'Cache de Geocoding',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0017_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PronosticoClima',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temperatura_max', models.FloatField(help_text='Temperatura máxima del día (°C)')),
+                ('temperatura_min', models.FloatField(help_text='Temperatura mínima del día (°C)')),
+                ('humedad_promedio', models.FloatField(help_text='Humedad relativa promedio (%)')),
+                ('precipitacion_mm', models.FloatField(default=0, help_text='Precipitación en milímetros')),
+                ('velocidad_viento_kmh', models.FloatField(default=0, help_text='Velocidad del viento (km/h)')),
+                ('ajuste_dias', models.FloatField(blank=True, help_text='Días a ajustar el próximo riego (negativo = adelantar)', null=True)),
+                ('resetear_riego', models.BooleanField(default=False, help_text='Si la lluvia del día cuenta como riego')),
+                ('motivo_ajuste', models.CharField(blank=True, default='', help_text='Explicación del ajuste', max_length=255)),
+                ('fecha', models.DateField(help_text='Día pronosticado')),
+                ('emitido', models.DateField(help_text='Día en que se obtuvo el pronóstico')),
+                ('localidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pronosticos', to='plantas.localidadusuario')),
+            ],
+            options={
+                'verbose_name': 'Pronóstico de Clima',
+                'verbose_name_plural': 'Pronósticos de Clima',
+                'ordering': ['fecha'],
+                'unique_together': {('localidad', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0018_pronosticoclima'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planta',
+            name='motivo_riego',
+            field=models.CharField(blank=True, default='', help_text='Motivo de la última programación outdoor (clima o pronóstico)', max_length=255),
+        ),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:46
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copia congelada de plantas.services.clima_resumen: la migración no debe
+# depender del código de la app, que puede cambiar después.
+PERIODOS = ('semana', 'mes')
+
+
+def inicio_periodo(fecha, periodo):
+    """Primer día del período que contiene `fecha` (lunes de la semana o día 1 del mes)."""
+    if periodo == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    return fecha.replace(day=1)
+
+
+def backfill_resumenes(apps, schema_editor):
+    """Arma los resúmenes semanal/mensual del historial diario existente."""
+    RegistroClima = apps.get_model('plantas', 'RegistroClima')
+    ResumenClima = apps.get_model('plantas', 'ResumenClima')
+
+    acumulados = {}
+    for registro in RegistroClima.objects.order_by().iterator(chunk_size=500):
+        for periodo in PERIODOS:
+            clave = (registro.localidad_id, periodo, inicio_periodo(registro.fecha, periodo))
+            acumulado = acumulados.setdefault(clave, {
+                'dias': 0, 'temperatura_max': registro.temperatura_max, 'temperatura_min': registro.temperatura_min,
+                'media': 0.0, 'lluvia': 0.0, 'humedad': 0.0, 'viento': 0.0,
+            })
+            acumulado['dias'] += 1
+            acumulado['temperatura_max'] = max(acumulado['temperatura_max'], registro.temperatura_max)
+            acumulado['temperatura_min'] = min(acumulado['temperatura_min'], registro.temperatura_min)
+            acumulado['media'] += (registro.temperatura_max + registro.temperatura_min) / 2
+            acumulado['lluvia'] += registro.precipitacion_mm
+            acumulado['humedad'] += registro.humedad_promedio
+            acumulado['viento'] += registro.velocidad_viento_kmh
+
+    ResumenClima.objects.bulk_create([
+        ResumenClima(
+            localidad_id=localidad_id, periodo=periodo, inicio=inicio, dias=a['dias'],
+            temperatura_max=a['temperatura_max'], temperatura_min=a['temperatura_min'],
+            temperatura_media=a['media'] / a['dias'], precipitacion_total_mm=a['lluvia'],
+            humedad_media=a['humedad'] / a['dias'], viento_medio_kmh=a['viento'] / a['dias'],
+        )
+        for (localidad_id, periodo, inicio), a in acumulados.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0019_planta_motivo_riego'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenClima',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('semana', 'Semana'), ('mes', 'Mes')], max_length=10)),
+                ('inicio', models.DateField(help_text='Primer día del período (lunes o día 1 del mes)')),
+                ('dias', models.PositiveSmallIntegerField(help_text='Días con registro incluidos en el resumen')),
+                ('temperatura_max', models.FloatField(help_text='Máxima del período (°C)')),
+                ('temperatura_min', models.FloatField(help_text='Mínima del período (°C)')),
+                ('temperatura_media', models.FloatField(help_text='Promedio de las temperaturas medias diarias (°C)')),
+                ('precipitacion_total_mm', models.FloatField(help_text='Lluvia acumulada (mm)')),
+                ('humedad_media', models.FloatField(help_text='Humedad relativa promedio (%)')),
+                ('viento_medio_kmh', models.FloatField(help_text='Velocidad del viento promedio (km/h)')),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+                ('localidad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_clima', to='plantas.localidadusuario')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Clima',
+                'verbose_name_plural': 'Resúmenes de Clima',
+                'ordering': ['periodo', 'inicio'],
+                'unique_together': {('localidad', 'periodo', 'inicio')},
+            },
+        ),
+        migrations.RunPython(backfill_resumenes, migrations.RunPython.noop),
+    ]
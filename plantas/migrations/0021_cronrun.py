@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0020_resumenclima'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comando', models.CharField(max_length=100)),
+                ('worker', models.CharField(blank=True, default='', help_text='Worker o shard (corridas repartidas)', max_length=100)),
+                ('estado', models.CharField(choices=[('ok', 'OK'), ('parcial', 'Con errores'), ('error', 'Fallida')], default='ok', max_length=10)),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('duracion_s', models.FloatField()),
+                ('localidades_procesadas', models.IntegerField(default=0)),
+                ('localidades_error', models.IntegerField(default=0)),
+                ('eventos_actualizados', models.IntegerField(default=0)),
+                ('regresiones', models.IntegerField(default=0, help_text='Métricas más lentas que la mediana de corridas anteriores')),
+                ('reporte', models.JSONField(default=dict, help_text='Reporte completo (el mismo de --report-json)')),
+            ],
+            options={
+                'verbose_name': 'Corrida de Cron',
+                'verbose_name_plural': 'Corridas de Cron',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['comando', '-inicio'], name='plantas_cro_comando_f6af86_idx')],
+            },
+        ),
+    ]
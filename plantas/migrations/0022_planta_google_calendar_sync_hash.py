@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0021_cronrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planta',
+            name='google_calendar_sync_hash',
+            field=models.CharField(blank=True, default='', help_text='Huella (fecha, hora, agua, texto) del evento sincronizado; si no cambia, no se llama a Calendar', max_length=64),
+        ),
+    ]
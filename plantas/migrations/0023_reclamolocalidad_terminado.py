@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plantas', '0022_planta_google_calendar_sync_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reclamolocalidad',
+            name='terminado',
+            field=models.BooleanField(default=False, help_text='El worker terminó la localidad: el reclamo ya no vence en el día'),
+        ),
+    ]
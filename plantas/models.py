@@ -130,6 +130,16 @@ class ConfiguracionUsuario(models.Model):
     def __str__(self):
         return f"Config de {self.user.username}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # La próxima fecha de riego de las plantas indoor depende de esta configuración
+        from plantas.services.riego_calculator import reprogramar_plantas
+        reprogramar_plantas(
+            Planta.objects.filter(usuario_id=self.user_id, tipo_cultivo='indoor'),
+            self.temperatura_promedio,
+            self.humedad_relativa,
+        )
+
 
 class LocalidadUsuario(models.Model):
     """
@@ -150,13 +160,13 @@ class LocalidadUsuario(models.Model):
         return f"{self.user.username} - {self.nombre_localidad}"
 
 
-class RegistroClima(models.Model):
+class ClimaDiario(models.Model):
     """
-    Registro histórico de clima para análisis y recálculo de riegos.
-    """
-    localidad = models.ForeignKey(LocalidadUsuario, on_delete=models.CASCADE, related_name='registros_clima')
-    fecha = models.DateField(auto_now_add=True)
+    Datos meteorológicos de un día y el ajuste de riego que derivan.
     
+    Base común de RegistroClima (clima observado) y PronosticoClima (clima
+    pronosticado): en los dos el ajuste se calcula una vez al guardar.
+    """
     # Datos meteorológicos
     temperatura_max = models.FloatField(help_text="Temperatura máxima del día (°C)")
     temperatura_min = models.FloatField(help_text="Temperatura mínima del día (°C)")
@@ -164,8 +174,65 @@ class RegistroClima(models.Model):
     precipitacion_mm = models.FloatField(default=0, help_text="Precipitación en milímetros")
     velocidad_viento_kmh = models.FloatField(default=0, help_text="Velocidad del viento (km/h)")
     
-    # Control de procesamiento
+    # Ajuste de riego derivado del clima del día (se calcula una vez por registro)
+    ajuste_dias = models.FloatField(null=True, blank=True, help_text="Días a ajustar el próximo riego (negativo = adelantar)")
+    resetear_riego = models.BooleanField(default=False, help_text="Si la lluvia del día cuenta como riego")
+    motivo_ajuste = models.CharField(max_length=255, blank=True, default='', help_text="Explicación del ajuste")
+    
+    CAMPOS_AJUSTE = ['ajuste_dias', 'resetear_riego', 'motivo_ajuste']
+    
+    class Meta:
+        abstract = True
+    
+    def actualizar_ajuste(self):
+        """Calcula el ajuste de riego a partir de los datos meteorológicos (sin guardar)."""
+        from plantas.services.outdoor_calculator import calcular_ajuste_por_clima
+        
+        resultado = calcular_ajuste_por_clima({
+            'temperatura_max': self.temperatura_max,
+            'temperatura_min': self.temperatura_min,
+            'humedad_promedio': self.humedad_promedio,
+            'precipitacion_mm': self.precipitacion_mm,
+            'velocidad_viento_kmh': self.velocidad_viento_kmh,
+        })
+        self.ajuste_dias = resultado['ajuste_dias']
+        self.resetear_riego = resultado['resetear_riego']
+        self.motivo_ajuste = resultado['motivo']
+    
+    def ajuste(self):
+        """
+        Devuelve el ajuste persistido del registro; lo calcula si todavía no lo tiene.
+        
+        Returns:
+            dict con el mismo formato que calcular_ajuste_por_clima
+        """
+        if self.ajuste_dias is None:
+            self.actualizar_ajuste()
+        return {
+            'ajuste_dias': self.ajuste_dias,
+            'resetear_riego': self.resetear_riego,
+            'motivo': self.motivo_ajuste,
+        }
+    
+    def save(self, *args, **kwargs):
+        # El ajuste depende sólo del clima: mantenerlo sincronizado con los datos
+        self.actualizar_ajuste()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.CAMPOS_AJUSTE)
+        super().save(*args, **kwargs)
+
+
+class RegistroClima(ClimaDiario):
+    """
+    Registro histórico de clima para análisis y recálculo de riegos.
+    """
+    localidad = models.ForeignKey(LocalidadUsuario, on_delete=models.CASCADE, related_name='registros_clima')
+    fecha = models.DateField(default=date.today)
+    
+    # Control de procesamiento (checkpoints del cron, permiten reanudar con --resume)
     riegos_recalculados = models.BooleanField(default=False, help_text="Si ya se procesó este registro")
+    calendario_actualizado = models.BooleanField(default=False, help_text="Si ya se actualizó Google Calendar con este registro")
     
     class Meta:
         unique_together = ['localidad', 'fecha']
@@ -177,6 +244,157 @@ class RegistroClima(models.Model):
         return f"{self.localidad.nombre_localidad} - {self.fecha}"
 
 
+class PronosticoClima(ClimaDiario):
+    """
+    Pronóstico de un día futuro para una localidad, con su ajuste ya calculado.
+    
+    El cron outdoor guarda los próximos WEATHER_FORECAST_DAYS días (una consulta
+    por celda de grilla) y los re-escribe en cada corrida; los días ya pasados se
+    borran, porque desde ese momento manda el RegistroClima observado. Permite
+    proyectar el riego hacia adelante (ej: postergarlo si mañana se pronostica
+    lluvia intensa).
+    """
+    localidad = models.ForeignKey(LocalidadUsuario, on_delete=models.CASCADE, related_name='pronosticos')
+    fecha = models.DateField(help_text="Día pronosticado")
+    emitido = models.DateField(help_text="Día en que se obtuvo el pronóstico")
+    
+    class Meta:
+        unique_together = ['localidad', 'fecha']
+        ordering = ['fecha']
+        verbose_name = "Pronóstico de Clima"
+        verbose_name_plural = "Pronósticos de Clima"
+    
+    def __str__(self):
+        return f"{self.localidad_id} - {self.fecha} (emitido {self.emitido})"
+
+
+class ResumenClima(models.Model):
+    """
+    Resumen semanal o mensual del clima de una localidad.
+    
+    Lo mantiene el cron de forma incremental (se recalcula sólo el período de
+    los días guardados) y sobrevive a la compactación de los RegistroClima
+    diarios más viejos que settings.CLIMA_RETENCION_DIAS: los gráficos de
+    historial se sirven desde acá, con una fila por período.
+    """
+    PERIODO_CHOICES = [
+        ('semana', 'Semana'),
+        ('mes', 'Mes'),
+    ]
+    
+    localidad = models.ForeignKey(LocalidadUsuario, on_delete=models.CASCADE, related_name='resumenes_clima')
+    periodo = models.CharField(max_length=10, choices=PERIODO_CHOICES)
+    inicio = models.DateField(help_text="Primer día del período (lunes o día 1 del mes)")
+    dias = models.PositiveSmallIntegerField(help_text="Días con registro incluidos en el resumen")
+    
+    temperatura_max = models.FloatField(help_text="Máxima del período (°C)")
+    temperatura_min = models.FloatField(help_text="Mínima del período (°C)")
+    temperatura_media = models.FloatField(help_text="Promedio de las temperaturas medias diarias (°C)")
+    precipitacion_total_mm = models.FloatField(help_text="Lluvia acumulada (mm)")
+    humedad_media = models.FloatField(help_text="Humedad relativa promedio (%)")
+    viento_medio_kmh = models.FloatField(help_text="Velocidad del viento promedio (km/h)")
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['localidad', 'periodo', 'inicio']
+        ordering = ['periodo', 'inicio']
+        verbose_name = "Resumen de Clima"
+        verbose_name_plural = "Resúmenes de Clima"
+    
+    def __str__(self):
+        return f"{self.localidad_id} - {self.periodo} {self.inicio}"
+
+
+class ReclamoLocalidad(models.Model):
+    """
+    Reclamo (lease) de una localidad por un worker del cron outdoor para una fecha.
+    
+    Permite correr varios workers de update_outdoor_climate --claim en paralelo
+    sin procesar dos veces la misma localidad: el unique (localidad, fecha) es
+    el árbitro final, también en motores sin SELECT ... FOR UPDATE SKIP LOCKED.
+    El worker renueva el lease cuando cada etapa del pipeline toma la localidad
+    y lo marca terminado al final, así no vence mientras espera en una cola.
+    """
+    localidad = models.ForeignKey(LocalidadUsuario, on_delete=models.CASCADE, related_name='reclamos')
+    fecha = models.DateField()
+    worker = models.CharField(max_length=100)
+    expira_en = models.DateTimeField(help_text="Pasado este momento otro worker puede reclamar la localidad")
+    terminado = models.BooleanField(
+        default=False, help_text="El worker terminó la localidad: el reclamo ya no vence en el día"
+    )
+    
+    class Meta:
+        unique_together = ['localidad', 'fecha']
+        verbose_name = "Reclamo de Localidad"
+        verbose_name_plural = "Reclamos de Localidades"
+    
+    def __str__(self):
+        return f"{self.localidad_id} - {self.fecha} ({self.worker})"
+
+
+class GeocodeCache(models.Model):
+    """
+    Resultado de Google Geocoding por consulta normalizada.
+    
+    Los usuarios escriben una y otra vez los mismos nombres de ciudad: las
+    búsquedas pasan primero por esta tabla y sólo los misses consumen cuota
+    de la API. `hits` cuenta las veces que se sirvió desde acá (la primera
+    consulta, que la creó, fue el miss) y `ultimo_uso` permite podar en
+    orden LRU con el comando prune_geocode_cache.
+    """
+    consulta = models.CharField(max_length=255, unique=True, help_text="Texto buscado, normalizado")
+    latitud = models.FloatField()
+    longitud = models.FloatField()
+    direccion_formateada = models.CharField(max_length=255)
+    hits = models.PositiveIntegerField(default=0)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    ultimo_uso = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        verbose_name = "Geocoding cacheado"
+        verbose_name_plural = "Cache de Geocoding"
+    
+    def __str__(self):
+        return f"{self.consulta} → {self.direccion_formateada}"
+
+
+class CronRun(models.Model):
+    """
+    Una corrida del cron outdoor con su reporte de métricas por fase.
+    
+    Permite seguir la evolución entre noches (clima, BD, cálculo, Calendar) y
+    detectar regresiones: `regresiones` cuenta las métricas que superaron la
+    mediana de las corridas anteriores (ver plantas.services.cron_metricas).
+    """
+    ESTADO_CHOICES = [
+        ('ok', 'OK'),
+        ('parcial', 'Con errores'),
+        ('error', 'Fallida'),
+    ]
+    
+    comando = models.CharField(max_length=100)
+    worker = models.CharField(max_length=100, blank=True, default='', help_text="Worker o shard (corridas repartidas)")
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='ok')
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+    duracion_s = models.FloatField()
+    localidades_procesadas = models.IntegerField(default=0)
+    localidades_error = models.IntegerField(default=0)
+    eventos_actualizados = models.IntegerField(default=0)
+    regresiones = models.IntegerField(default=0, help_text="Métricas más lentas que la mediana de corridas anteriores")
+    reporte = models.JSONField(default=dict, help_text="Reporte completo (el mismo de --report-json)")
+    
+    class Meta:
+        ordering = ['-inicio']
+        verbose_name = "Corrida de Cron"
+        verbose_name_plural = "Corridas de Cron"
+        indexes = [
+            models.Index(fields=['comando', '-inicio']),
+        ]
+    
+    def __str__(self):
+        return f"{self.comando} {self.inicio:%Y-%m-%d %H:%M} ({self.estado})"
+
 
 class Planta(models.Model):
     TIPO_PLANTA_CHOICES = [
@@ -217,6 +435,12 @@ class Planta(models.Model):
     fecha_ultimo_riego = models.DateField()
     en_floracion = models.BooleanField(default=False)
     google_calendar_event_id = models.CharField(max_length=255, blank=True, null=True, help_text="ID del evento de Google Calendar para el próximo riego")
+    google_calendar_sync_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="Huella (fecha, hora, agua, texto) del evento sincronizado; si no cambia, no se llama a Calendar"
+    )
     
     # Campos manuales para categoría "Otras"
     frecuencia_riego_manual = models.IntegerField(
@@ -232,144 +456,129 @@ class Planta(models.Model):
         help_text="Cantidad de agua en ml (solo para categoría 'Otras'). Rango: 10-10000 ml"
     )
 
+    # Programación persistida (se mantiene en save(), Riego.save(), config indoor y cron outdoor)
+    proxima_fecha_riego = models.DateField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Fecha del próximo riego calculada (indexada para filtrar plantas a regar)"
+    )
+    frecuencia_riego_dias = models.IntegerField(
+        null=True,
+        blank=True,
+        help_text="Frecuencia de riego calculada en días"
+    )
+    motivo_riego = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="Motivo de la última programación outdoor (clima o pronóstico)"
+    )
+
+    # Campos que, al cambiar, obligan a recalcular la programación
+    CAMPOS_CALCULO = {
+        'categoria_botanica', 'tamano_planta', 'tipo_cultivo', 'tamano_maceta_litros',
+        'fecha_ultimo_riego', 'en_floracion', 'frecuencia_riego_manual', 'cantidad_agua_manual_ml',
+    }
+    CAMPOS_PROGRAMACION = ['proxima_fecha_riego', 'frecuencia_riego_dias']
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'proxima_fecha_riego']),
+        ]
+
     # ---------- LÓGICA DE CÁLCULO ----------
     def calculos_riego(self, temperatura_externa=None, humedad_externa=None):
         """
         Calcula días restantes, cantidad de agua, y estado de riego.
         Para categoría 'Otras', usa los valores manuales ingresados por el usuario.
         Para 'Cannabis', ajusta según temperatura y humedad externas (si se proporcionan).
+
+        La heurística vive en plantas.services.riego_calculator, que también
+        permite calcular muchas plantas en lote (calcular_riego_lote).
         """
-        today = date.today()
-
-        # ===== Plantas categoría "Otras": usar valores manuales =====
-        if self.categoria_botanica == 'Otras':
-            frequency_days = self.frecuencia_riego_manual or 3
-            recommended_water_ml = self.cantidad_agua_manual_ml or 500
-
-            next_watering_date = self.fecha_ultimo_riego + timedelta(days=frequency_days)
-            days_left = (next_watering_date - today).days
-
-            if days_left > 1:
-                estado_riego = 'no_necesita'
-                estado_texto = 'No necesita agua'
-            elif days_left == 1:
-                estado_riego = 'pronto'
-                estado_texto = 'Pronto a regar'
-            elif days_left == 0:
-                estado_riego = 'hoy'
-                estado_texto = 'Necesita riego hoy'
-            else:
-                estado_riego = 'urgente'
-                estado_texto = f'Riego urgente (atrasado {abs(days_left)} día{"s" if abs(days_left) > 1 else ""})'
-
-            return {
-                "recommended_water_ml": recommended_water_ml,
-                "frequency_days": frequency_days,
-                "next_watering_date": next_watering_date,
-                "days_left": days_left,
-                "estado_riego": estado_riego,
-                "estado_texto": estado_texto,
-                "sugerencia_suplementos": "Consultá las recomendaciones específicas del fabricante del sustrato o fertilizante que utilices.",
-            }
-
-        # ===== Plantas Cannabis: cálculo automático =====
-        litros = max(self.tamano_maceta_litros, 0.1)  # Mínimo 0.1L
-        size = self.tamano_planta
-        en_flor = self.en_floracion
-
-        # Heurística mejorada:
-        # Volumen por riego ≈ 15% del volumen de maceta (veg) y ≈ 20% (flor)
-        porcentaje = 0.20 if en_flor else 0.15
-        recommended_water_ml = int(litros * 1000 * porcentaje)
-        
-        # Límite máximo de agua por riego: 5000ml (5L)
-        recommended_water_ml = min(recommended_water_ml, 5000)
+        from plantas.services.riego_calculator import calcular_riego
 
-        # Frecuencia base ~ litros/2 días (10L ≈ 5 días)
-        # Ajustes por tamaño de planta, floración, temperatura y humedad
-        base = litros / 2.0 if litros > 0 else 2.0  # p.ej., 12L -> 6 días
-        
-        # Ajuste por tamaño de planta
-        size_map = {'Pequeña': -1.0, 'pequeña': -1.0, 'Mediana': 0.0, 'mediana': 0.0, 'Grande': 1.0, 'grande': 1.0}
-        size_offset = size_map.get(size, 0.0)
-        
-        # Ajuste por relación planta/maceta (planta grande en maceta pequeña necesita más riego)
-        ratio_offset = 0.0
-        if size in ['Grande', 'grande'] and litros < 10:
-            ratio_offset = -1.0  # Regar más seguido
-        elif size in ['Pequeña', 'pequeña'] and litros > 15:
-            ratio_offset = 0.5   # Regar menos seguido
-        
-        # Ajuste por etapa de floración
-        stage_offset = -1.0 if en_flor else 0.0
-        
-        # Ajuste por temperatura (gradual con 6 niveles)
-        temp_offset = 0.0
-        if temperatura_externa is not None:
-            if temperatura_externa > 30:
-                temp_offset = -2.0  # Muy caliente, regar mucho más seguido
-            elif temperatura_externa > 28:
-                temp_offset = -1.0  # Caliente, regar más seguido
-            elif temperatura_externa > 25:
-                temp_offset = -0.5  # Templado-caliente, regar un poco más seguido
-            elif temperatura_externa < 12:
-                temp_offset = 2.0   # Muy frío, regar mucho menos seguido
-            elif temperatura_externa < 15:
-                temp_offset = 1.0   # Frío, regar menos seguido
-            elif temperatura_externa < 18:
-                temp_offset = 0.5   # Templado-frío, regar un poco menos seguido
-
-        # Ajuste por humedad relativa (humedad baja → más transpiración → más riego)
-        humedad_offset = 0.0
-        if humedad_externa is not None:
-            if humedad_externa < 30:
-                humedad_offset = -1.0  # Muy seco, regar más seguido
-            elif humedad_externa < 40:
-                humedad_offset = -0.5  # Seco, regar un poco más seguido
-            elif humedad_externa > 70:
-                humedad_offset = 1.0   # Muy húmedo, regar menos seguido
-            elif humedad_externa > 60:
-                humedad_offset = 0.5   # Húmedo, regar un poco menos seguido
-
-        # Cálculo final de frecuencia
-        frequency_days = int(max(2, min(7, round(
-            base + size_offset + ratio_offset + stage_offset + temp_offset + humedad_offset, 0
-        ))))
-
-        next_watering_date = self.fecha_ultimo_riego + timedelta(days=frequency_days)
-        today = date.today()
-        days_left = (next_watering_date - today).days
-
-        # Estados de riego mejorados con "urgente"
-        if days_left > 1:
-            estado_riego = 'no_necesita'
-            estado_texto = 'No necesita agua'
-        elif days_left == 1:
-            estado_riego = 'pronto'
-            estado_texto = 'Pronto a regar'
-        elif days_left == 0:
-            estado_riego = 'hoy'
-            estado_texto = 'Necesita riego hoy'
-        else:  # days_left < 0
-            estado_riego = 'urgente'
-            estado_texto = f'Riego urgente (atrasado {abs(days_left)} día{"s" if abs(days_left) > 1 else ""})'
-
-        # Sugerencia genérica y conservadora de suplementos (si los usan).
-        # SIEMPRE empezar con dosis bajas y respetar etiqueta de cada marca.
-        if en_flor:
-            sugerencia = "Floración: Base Bloom ~1 ml/L + Cal-Mag ~0.5 ml/L (arrancar bajo). Ajustar pH según sustrato."
+        return calcular_riego(self, temperatura_externa, humedad_externa)
+
+    def clima_indoor(self):
+        """
+        Devuelve (temperatura, humedad) de la configuración indoor del usuario.
+        Para plantas outdoor (o sin configuración) devuelve (None, None).
+        """
+        if self.tipo_cultivo != 'indoor':
+            return None, None
+        config = ConfiguracionUsuario.objects.filter(user_id=self.usuario_id).values_list(
+            'temperatura_promedio', 'humedad_relativa'
+        ).first()
+        return config or (None, None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia.marcar_programada()
+        return instancia
+
+    def _valores_calculo(self):
+        # Los campos diferidos que no se tocaron no cuentan como cambio
+        return {campo: self.__dict__.get(campo) for campo in self.CAMPOS_CALCULO}
+
+    def marcar_programada(self):
+        """Registra los datos de cálculo con los que quedó la programación actual."""
+        self._calculo_programado = self._valores_calculo()
+
+    def calculo_cambiado(self, campos=None):
+        """Si cambió alguno de `campos` (default: CAMPOS_CALCULO) desde la última programación."""
+        programado = getattr(self, '_calculo_programado', None)
+        if programado is None or self.proxima_fecha_riego is None:
+            return True
+        actual = self._valores_calculo()
+        return any(actual[campo] != programado[campo] for campo in (campos or self.CAMPOS_CALCULO))
+
+    def programar_riego(self, datos_riego=None):
+        """
+        Actualiza proxima_fecha_riego y frecuencia_riego_dias (sin guardar).
+        Si no se pasa datos_riego, se calcula con la configuración indoor del usuario.
+        """
+        if datos_riego is None:
+            datos_riego = self.calculos_riego(*self.clima_indoor())
+        self.proxima_fecha_riego = datos_riego['next_watering_date']
+        self.frecuencia_riego_dias = datos_riego['frequency_days']
+        self.marcar_programada()
+
+    def reprogramar(self):
+        """
+        Recalcula la programación tras un cambio en los datos de cálculo (sin guardar).
+        A las outdoor se les vuelve a aplicar el último RegistroClima de su
+        localidad, como en el cron, en lugar de dejarles la fecha base.
+
+        Returns:
+            Lista de campos modificados
+        """
+        from plantas.services.outdoor_calculator import CAMPOS_RECALCULO_OUTDOOR, aplicar_ajuste_lote
+
+        self.programar_riego()
+        if self.tipo_cultivo != 'outdoor':
+            return self.CAMPOS_PROGRAMACION
+        registro = RegistroClima.objects.filter(
+            localidad__user_id=self.usuario_id, localidad__activo=True
+        ).order_by('-fecha').first()
+        if registro is None:
+            self.motivo_riego = ''
         else:
-            sugerencia = "Vegetación: Base Grow ~1 ml/L + Cal-Mag ~0.5 ml/L (arrancar bajo). Ajustar pH según sustrato."
+            aplicar_ajuste_lote([self], registro)
+        return CAMPOS_RECALCULO_OUTDOOR
 
-        return {
-            "recommended_water_ml": recommended_water_ml,
-            "frequency_days": frequency_days,
-            "next_watering_date": next_watering_date,
-            "days_left": days_left,
-            "estado_riego": estado_riego,
-            "estado_texto": estado_texto,
-            "sugerencia_suplementos": sugerencia,
-        }
+    def save(self, *args, **kwargs):
+        # Reprogramar sólo si cambiaron los datos de cálculo: así un save() de otro
+        # campo no pisa la fecha ajustada por clima de las outdoor
+        update_fields = kwargs.get('update_fields')
+        campos = self.CAMPOS_CALCULO if update_fields is None else self.CAMPOS_CALCULO & set(update_fields)
+        if campos and self.calculo_cambiado(campos):
+            modificados = self.reprogramar()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(modificados)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.nombre_personalizado} ({self.usuario.username})"
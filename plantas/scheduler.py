@@ -17,127 +17,70 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def recalcular_riegos_outdoor_diario():
+def recalcular_riegos_outdoor_diario(concurrencia=4, tamano_lote=200):
     """
     Task que se ejecuta diariamente para recalcular riegos outdoor.
     
-    Este es el corazón del sistema automático:
-    - Consulta el clima para cada localidad activa
+    Este es el corazón del sistema automático (mismo pipeline que update_outdoor_climate):
+    - Consulta el clima para cada localidad activa (hasta `concurrencia` en paralelo)
     - Guarda registro del clima
     - Recalcula el próximo riego para plantas outdoor
     - Actualiza Google Calendar con nuevas fechas
     """
-    from plantas.models import LocalidadUsuario, Planta
-    from plantas.services.weather_service import obtener_y_guardar_clima
-    from plantas.services.outdoor_calculator import recalcular_fecha_riego_outdoor
-    from notificaciones.services.google_calendar import actualizar_evento_riego
+    from itertools import islice
+    from plantas.services.weather_service import localidades_con_plantas_outdoor
+    from plantas.services.outdoor_pipeline import PipelineOutdoor
     
     logger.info("🌤️ Iniciando recálculo diario de riegos outdoor...")
     
-    # Obtener todas las localidades activas
-    localidades = LocalidadUsuario.objects.filter(activo=True).select_related('user')
-    
-    if not localidades.exists():
-        logger.info("No hay localidades activas para procesar")
-        return
+    # Las localidades activas que tienen plantas outdoor (las demás no usan el clima),
+    # ordenadas por coordenadas para que las de una misma celda caigan en el mismo lote
+    localidades = iter(
+        localidades_con_plantas_outdoor().select_related('user', 'user__profile')
+        .order_by('latitud', 'longitud', 'id').iterator(chunk_size=tamano_lote)
+    )
+    lotes = iter(lambda: list(islice(localidades, tamano_lote)), [])
     
-    total_plantas_procesadas = 0
-    total_errores = 0
-    
-    for localidad in localidades:
-        try:
-            # 1. Obtener y guardar clima
-            logger.info(f"Consultando clima para {localidad.nombre_localidad}...")
-            registro_clima = obtener_y_guardar_clima(localidad)
-            
-            if registro_clima is None:
-                logger.warning(f"No se pudo obtener clima para {localidad.nombre_localidad}")
-                total_errores += 1
-                continue
-            
-            # 2. Obtener plantas outdoor del usuario
-            plantas_outdoor = Planta.objects.filter(
-                usuario=localidad.user,
-                tipo_cultivo='outdoor'
-            )
-            
-            logger.info(f"Procesando {plantas_outdoor.count()} plantas outdoor de {localidad.user.username}...")
-            
-            for planta in plantas_outdoor:
-                try:
-                    # 3. Recalcular riego
-                    resultado = recalcular_fecha_riego_outdoor(planta, registro_clima)
-                    
-                    # 4. Actualizar Google Calendar
-                    if hasattr(localidad.user, 'profile') and localidad.user.profile.google_access_token:
-                        try:
-                            from notificaciones.services.google_calendar import delete_calendar_event, create_riego_event
-                            
-                            # Borrar evento anterior si existe
-                            if planta.google_calendar_event_id:
-                                delete_calendar_event(localidad.user, planta.google_calendar_event_id)
-                            
-                            # Crear nuevo evento con fecha actualizada
-                            nuevo_evento = create_riego_event(
-                                user=localidad.user,
-                                planta=planta,
-                                fecha_riego=resultado['fecha_proximo_riego'],
-                                motivo=resultado['motivo']
-                            )
-                            
-                            if nuevo_evento:
-                                planta.google_calendar_event_id = nuevo_evento.get('id')
-                                planta.save(update_fields=['google_calendar_event_id'])
-                        
-                        except Exception as e:
-                            logger.error(f"Error al actualizar Google Calendar para {planta.nombre_personalizado}: {e}")
-                    
-                    total_plantas_procesadas += 1
-                    logger.debug(f"✅ {planta.nombre_personalizado}: {resultado['motivo']}")
-                
-                except Exception as e:
-                    logger.error(f"Error procesando planta {planta.nombre_personalizado}: {e}")
-                    total_errores += 1
-            
-            # Marcar registro como procesado
-            registro_clima.riegos_recalculados = True
-            registro_clima.save()
-        
-        except Exception as e:
-            logger.error(f"Error procesando localidad {localidad.nombre_localidad}: {e}")
-            total_errores += 1
+    pipeline = PipelineOutdoor(concurrencia_clima=concurrencia).ejecutar(lotes)
     
-    logger.info(f"✅ Recálculo completado: {total_plantas_procesadas} plantas procesadas, {total_errores} errores")
+    logger.info(
+        f"✅ Recálculo completado: {pipeline.localidades_procesadas} localidades, "
+        f"{pipeline.plantas_actualizadas} plantas procesadas ({pipeline.plantas_cambiadas} con cambios), "
+        f"{pipeline.eventos_actualizados} eventos actualizados ({pipeline.eventos_omitidos} omitidos), "
+        f"{pipeline.localidades_error} errores"
+    )
+    for etapa in pipeline.etapas.values():
+        logger.info(
+            f"Etapa {etapa.nombre}: {etapa.items} items, {etapa.throughput:.1f}/s, "
+            f"cola máx. {etapa.cola_max}"
+        )
 
 
-def procesar_dias_faltantes():
+def procesar_dias_faltantes(dias=7):
     """
     Procesa días faltantes cuando el servidor se reinicia.
     
     Si el servidor estuvo inactivo por varios días (ej: Render lo suspendió),
-    este método procesa el clima de los días que se perdieron.
+    completa con clima histórico los días que se perdieron y recalcula los
+    riegos outdoor en orden de fecha (ver plantas.services.clima_historico).
     """
-    from plantas.models import LocalidadUsuario, RegistroClima
     from datetime import timedelta
     from django.db import ProgrammingError
+    from plantas.services.weather_service import localidades_con_plantas_outdoor
+    from plantas.services.clima_historico import completar_huecos
     
     try:
         logger.info("Verificando días faltantes...")
         
-        localidades = LocalidadUsuario.objects.filter(activo=True)
+        hasta = date.today() - timedelta(days=1)
+        localidades = list(localidades_con_plantas_outdoor().select_related('user', 'user__profile'))
+        resumen = completar_huecos(localidades, hasta - timedelta(days=dias - 1), hasta)
         
-        for localidad in localidades:
-            # Verificar si hay registros recientes
-            ultimo_registro = RegistroClima.objects.filter(
-                localidad=localidad
-            ).order_by('-fecha').first()
-            
-            if ultimo_registro:
-                dias_desde_ultimo = (date.today() - ultimo_registro.fecha).days
-                
-                if dias_desde_ultimo > 1:
-                    logger.warning(f"Faltan {dias_desde_ultimo - 1} días de clima para {localidad.nombre_localidad}")
-                    # Por ahora solo loggeamos, en el futuro podríamos usar historical weather API
+        if resumen['dias_faltantes']:
+            logger.warning(
+                f"Faltaban {resumen['dias_faltantes']} días de clima en {resumen['localidades_con_huecos']} localidades: "
+                f"{resumen['registros_creados']} completados con {resumen['consultas']} consultas"
+            )
     
     except ProgrammingError as e:
         # Las tablas aún no existen (migraciones no aplicadas) - esto es normal durante deploy
@@ -146,6 +89,19 @@ def procesar_dias_faltantes():
         logger.error(f"Error al procesar días faltantes: {e}")
 
 
+def compactar_historial_clima():
+    """
+    Compacta los RegistroClima diarios anteriores al horizonte de retención
+    en resúmenes semanales/mensuales (ver plantas.services.clima_resumen).
+    """
+    from plantas.services.clima_resumen import compactar_historial
+    
+    try:
+        compactar_historial()
+    except Exception as e:
+        logger.error(f"Error al compactar el historial de clima: {e}")
+
+
 # Instancia global del scheduler
 scheduler = None
 
@@ -182,6 +138,17 @@ def start_scheduler():
         replace_existing=True
     )
     
+    # Compactación semanal del historial de clima (domingos)
+    scheduler.add_job(
+        compactar_historial_clima,
+        'cron',
+        day_of_week='sun',
+        hour=10,
+        minute=0,
+        id='climate_history_compaction',
+        replace_existing=True
+    )
+    
     scheduler.start()
     logger.info("✅ Scheduler iniciado - Recálculo diario a las 3:00 AM UTC")
     
@@ -135,6 +135,8 @@ class PlantaSerializer(serializers.ModelSerializer):
     estado_riego = serializers.SerializerMethodField()
     estado_texto = serializers.SerializerMethodField()
     sugerencia_suplementos = serializers.SerializerMethodField()
+    # Todos los calculados juntos, en una sola pasada
+    resumen_riego = serializers.SerializerMethodField()
     imagenes = ImagenPlantaSerializer(many=True, read_only=True)
 
     class Meta:
@@ -149,10 +151,13 @@ class PlantaSerializer(serializers.ModelSerializer):
             # calculados
             "recommended_water_ml", "frequency_days", "next_watering_date",
             "days_left", "estado_riego", "estado_texto", "sugerencia_suplementos",
+            "resumen_riego",
+            # programación persistida
+            "proxima_fecha_riego", "frecuencia_riego_dias",
             # imágenes
             "imagenes",
         )
-        read_only_fields = ("usuario",)
+        read_only_fields = ("usuario", "proxima_fecha_riego", "frecuencia_riego_dias")
 
     def validate(self, attrs):
         """
@@ -190,8 +195,41 @@ class PlantaSerializer(serializers.ModelSerializer):
 
         return attrs
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Cache de calculos_riego() por planta, vive lo mismo que el serializer (un request)
+        self._calc_cache = {}
+        # Clima indoor (ConfiguracionUsuario) por usuario: una query por dueño, no por planta
+        self._clima_cache = {}
+
+    def _clima_indoor(self, obj):
+        """(temperatura, humedad) indoor del dueño de la planta, resuelto una vez por usuario."""
+        if obj.tipo_cultivo != 'indoor':
+            return None, None
+        clima = self._clima_cache.get(obj.usuario_id)
+        if clima is None:
+            clima = obj.clima_indoor()
+            self._clima_cache[obj.usuario_id] = clima
+        return clima
+
     def get_calc(self, obj):
-        return obj.calculos_riego()
+        """
+        Devuelve calculos_riego() de la planta calculándolo una sola vez por instancia.
+        Los campos calculados comparten este resultado en lugar de recalcular cada uno.
+        Si la vista ya calculó el lote completo (context['calculos_riego']), se usa ese.
+        La fecha, la frecuencia y el estado son los de la programación guardada.
+        """
+        from plantas.services.riego_calculator import con_programacion
+
+        key = obj.pk if obj.pk is not None else id(obj)
+        calc = self._calc_cache.get(key)
+        if calc is None:
+            calc = self.context.get('calculos_riego', {}).get(obj.pk) or obj.calculos_riego(*self._clima_indoor(obj))
+            calc = con_programacion(calc, obj)
+            self._calc_cache[key] = calc
+        return calc
+
+    def get_resumen_riego(self, obj): return dict(self.get_calc(obj))
 
     def get_recommended_water_ml(self, obj): return self.get_calc(obj)["recommended_water_ml"]
     def get_frequency_days(self, obj): return self.get_calc(obj)["frequency_days"]
@@ -0,0 +1,280 @@
+"""
+Clima histórico para completar días sin RegistroClima (comando backfill_climate).
+
+Si el cron no corrió algunos días, las plantas outdoor pierden los reseteos por
+lluvia y los ajustes por calor de esos días. Este módulo:
+1. Detecta los huecos de RegistroClima por localidad.
+2. Consulta el clima diario de todo el rango con un request por celda de grilla.
+3. Inserta en lote los registros faltantes (con su ajuste ya calculado).
+4. Re-aplica los registros a las plantas outdoor en orden de fecha, cada uno
+   con su propia fecha como "hoy" (como lo habría hecho el cron ese día).
+
+El proveedor se elige con settings.WEATHER_HISTORY_PROVIDER: cualquier clase con
+obtener_rango(latitud, longitud, desde, hasta) -> {date: datos_clima}.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils.module_loading import import_string
+
+from plantas.models import RegistroClima
+from plantas.services import http_client
+from plantas.services.weather_service import agrupar_por_celda, centro_celda, celda_clima
+from plantas.services.clima_resumen import actualizar_resumenes
+from plantas.services.outdoor_calculator import (
+    aplicar_ajuste_lote, cargar_plantas_outdoor_por_usuario, guardar_plantas_recalculadas,
+    firma_programacion, separar_cambiadas, requiere_evento
+)
+
+logger = logging.getLogger(__name__)
+
+DIAS_DEFAULT = 7
+
+
+class OpenMeteoProvider:
+    """
+    Clima diario de Open-Meteo (no requiere API key).
+
+    El endpoint de pronóstico acepta fechas pasadas (hasta ~3 meses) con
+    start_date/end_date; para rangos más viejos se puede apuntar
+    WEATHER_HISTORY_URL al endpoint de archivo, que usa los mismos parámetros.
+    """
+
+    VARIABLES = {
+        'temperatura_max': 'temperature_2m_max',
+        'temperatura_min': 'temperature_2m_min',
+        'humedad_promedio': 'relative_humidity_2m_mean',
+        'precipitacion_mm': 'precipitation_sum',
+        'velocidad_viento_kmh': 'wind_speed_10m_max',
+    }
+
+    def __init__(self, url=None):
+        self.url = url or settings.WEATHER_HISTORY_URL
+
+    def obtener_rango(self, latitud, longitud, desde, hasta):
+        """
+        Clima diario de un punto entre dos fechas (inclusive), en un solo request.
+
+        Returns:
+            dict {date: datos_clima} (los días sin datos no se incluyen)
+
+        Raises:
+            requests.exceptions.RequestException: Si falla la API
+        """
+        params = {
+            'latitude': latitud,
+            'longitude': longitud,
+            'start_date': desde.isoformat(),
+            'end_date': hasta.isoformat(),
+            'daily': ','.join(self.VARIABLES.values()),
+            'wind_speed_unit': 'kmh',
+            'timezone': 'auto',
+        }
+        response = http_client.get(self.url, params=params, endpoint='weather_history')
+        response.raise_for_status()
+        diario = response.json().get('daily', {})
+
+        resultado = {}
+        for i, fecha in enumerate(diario.get('time', [])):
+            valores = {
+                campo: (diario.get(variable) or [None] * (i + 1))[i]
+                for campo, variable in self.VARIABLES.items()
+            }
+            if valores['temperatura_max'] is None:
+                continue
+            resultado[date.fromisoformat(fecha)] = {
+                'temperatura_max': float(valores['temperatura_max']),
+                'temperatura_min': float(valores['temperatura_min'] if valores['temperatura_min'] is not None else valores['temperatura_max'] - 5),
+                'humedad_promedio': float(valores['humedad_promedio'] if valores['humedad_promedio'] is not None else 50.0),
+                'precipitacion_mm': float(valores['precipitacion_mm'] or 0.0),
+                'velocidad_viento_kmh': float(valores['velocidad_viento_kmh'] or 0.0),
+            }
+        return resultado
+
+
+def obtener_proveedor():
+    """Instancia del proveedor configurado en settings.WEATHER_HISTORY_PROVIDER."""
+    return import_string(settings.WEATHER_HISTORY_PROVIDER)()
+
+
+def detectar_huecos(localidades, desde, hasta):
+    """
+    Fechas sin RegistroClima por localidad entre `desde` y `hasta` (inclusive).
+
+    Sólo cuentan como hueco los días posteriores al primer registro de cada
+    localidad: las que nunca tuvieron clima las completa el cron.
+
+    Returns:
+        dict {localidad_id: [date, ...]} ordenado por fecha, sólo localidades con huecos
+    """
+    ids = [localidad.id for localidad in localidades]
+    primeras = dict(
+        RegistroClima.objects.filter(localidad_id__in=ids)
+        .values('localidad_id').annotate(primera=Min('fecha'))
+        .values_list('localidad_id', 'primera')
+    )
+    existentes = set(
+        RegistroClima.objects.filter(localidad_id__in=ids, fecha__range=(desde, hasta))
+        .values_list('localidad_id', 'fecha')
+    )
+
+    huecos = {}
+    for localidad_id, primera in primeras.items():
+        dia = max(desde, primera)
+        faltantes = []
+        while dia <= hasta:
+            if (localidad_id, dia) not in existentes:
+                faltantes.append(dia)
+            dia += timedelta(days=1)
+        if faltantes:
+            huecos[localidad_id] = faltantes
+    return huecos
+
+
+def completar_huecos(localidades, desde, hasta, proveedor=None, concurrencia=1, actualizar_calendario=True):
+    """
+    Completa los días faltantes de RegistroClima y re-aplica el clima a las plantas outdoor.
+
+    Args:
+        localidades: Lista de LocalidadUsuario (idealmente con select_related('user'))
+        desde, hasta: Rango de fechas a revisar (inclusive)
+        proveedor: Proveedor de clima histórico (default: obtener_proveedor())
+        concurrencia: Requests simultáneos al proveedor (uno por celda)
+        actualizar_calendario: Si actualiza Google Calendar con las fechas resultantes
+
+    Returns:
+        dict con 'localidades_con_huecos', 'dias_faltantes', 'consultas', 'errores',
+        'registros_creados', 'plantas_recalculadas', 'eventos_actualizados'
+    """
+    localidades = list(localidades)
+    proveedor = proveedor or obtener_proveedor()
+    huecos = detectar_huecos(localidades, desde, hasta)
+    resumen = {
+        'localidades_con_huecos': len(huecos),
+        'dias_faltantes': sum(len(fechas) for fechas in huecos.values()),
+        'consultas': 0,
+        'errores': 0,
+        'registros_creados': 0,
+        'plantas_recalculadas': 0,
+        'eventos_actualizados': 0,
+    }
+    if not huecos:
+        return resumen
+
+    # === 1. Un request por celda con el rango que cubre los huecos de todas sus localidades ===
+    con_huecos = [localidad for localidad in localidades if localidad.id in huecos]
+    celdas = agrupar_por_celda(con_huecos)
+
+    def consultar(celda):
+        fechas = [fecha for localidad in celdas[celda] for fecha in huecos[localidad.id]]
+        latitud, longitud = centro_celda(celda)
+        try:
+            return celda, proveedor.obtener_rango(latitud, longitud, min(fechas), max(fechas))
+        except Exception as e:
+            logger.error(f"Error al obtener clima histórico para la celda {celda}: {e}")
+            return celda, None
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as executor:
+        clima_por_celda = dict(executor.map(consultar, celdas))
+    resumen['consultas'] = len(celdas)
+    resumen['errores'] = sum(1 for datos in clima_por_celda.values() if datos is None)
+
+    # === 2. Insertar los registros faltantes en lote ===
+    nuevos = []
+    for localidad in con_huecos:
+        clima = clima_por_celda.get(celda_clima(localidad.latitud, localidad.longitud)) or {}
+        for fecha in huecos[localidad.id]:
+            datos_clima = clima.get(fecha)
+            if datos_clima is None:
+                continue
+            registro = RegistroClima(localidad=localidad, fecha=fecha, **datos_clima)
+            registro.actualizar_ajuste()
+            nuevos.append(registro)
+    RegistroClima.objects.bulk_create(nuevos, ignore_conflicts=True, batch_size=500)
+    actualizar_resumenes(nuevos)
+    resumen['registros_creados'] = len(nuevos)
+    if not nuevos:
+        return resumen
+
+    # === 3. Re-aplicar el clima en orden de fecha ===
+    fechas_nuevas = {}
+    for registro in nuevos:
+        fechas_nuevas.setdefault(registro.localidad_id, set()).add(registro.fecha)
+    registros_por_localidad = {}
+    for registro in RegistroClima.objects.filter(localidad_id__in=fechas_nuevas, fecha__gte=desde).order_by('fecha'):
+        registros_por_localidad.setdefault(registro.localidad_id, []).append(registro)
+
+    localidades_por_id = {localidad.id: localidad for localidad in con_huecos}
+    plantas_por_usuario = cargar_plantas_outdoor_por_usuario(
+        [localidades_por_id[localidad_id].user_id for localidad_id in fechas_nuevas]
+    )
+
+    recalculadas = []
+    con_evento = {}
+    ids_rellenados = {}
+    motivos = {}
+    for localidad_id, fechas in fechas_nuevas.items():
+        localidad = localidades_por_id[localidad_id]
+        plantas = plantas_por_usuario.get(localidad.user_id, [])
+        firmas = {planta.id: firma_programacion(planta) for planta in plantas}
+        registros = registros_por_localidad.get(localidad_id, [])
+        # Los días rellenados y, al final, el registro más reciente posterior a ellos
+        # (ej: el de hoy) para que la programación final refleje el último clima
+        a_aplicar = [registro for registro in registros if registro.fecha in fechas]
+        posteriores = [registro for registro in registros if registro.fecha > max(fechas)]
+        if posteriores:
+            a_aplicar.append(posteriores[-1])
+        for registro in a_aplicar:
+            # Cada día se re-aplica como lo habría hecho el cron ese día
+            aplicar_ajuste_lote(plantas, registro, hoy=registro.fecha)
+            if registro.fecha in fechas:
+                ids_rellenados.setdefault(localidad_id, []).append(registro.id)
+        # Sólo se guardan y se llevan a Calendar las plantas cuya programación cambió
+        cambiadas, _ = separar_cambiadas(plantas, firmas)
+        recalculadas.extend(cambiadas)
+        con_evento[localidad_id] = [planta for planta in cambiadas if requiere_evento(planta, firmas[planta.id][1])]
+        motivos[localidad_id] = a_aplicar[-1].motivo_ajuste if a_aplicar else None
+
+    with transaction.atomic():
+        guardar_plantas_recalculadas(recalculadas)
+        RegistroClima.objects.filter(
+            id__in=[registro_id for ids in ids_rellenados.values() for registro_id in ids]
+        ).update(riegos_recalculados=True)
+    resumen['plantas_recalculadas'] = len(recalculadas)
+
+    # === 4. Google Calendar con las fechas resultantes ===
+    # Sólo se marcan calendario_actualizado los registros de las localidades
+    # cuyos eventos se sincronizaron todos
+    sincronizados = []
+    if actualizar_calendario:
+        from notificaciones.services.google_calendar import update_calendar_event_for_plant
+
+        for localidad_id in fechas_nuevas:
+            localidad = localidades_por_id[localidad_id]
+            profile = getattr(localidad.user, 'profile', None)
+            if not (profile and profile.google_access_token):
+                continue
+            errores = 0
+            for planta in con_evento[localidad_id]:
+                try:
+                    evento = update_calendar_event_for_plant(
+                        planta, fecha_riego=planta.proxima_fecha_riego,
+                        motivo=planta.motivo_riego or motivos[localidad_id] or None,
+                    )
+                except Exception as e:
+                    logger.error(f"Error al actualizar Google Calendar para {planta.nombre_personalizado}: {e}")
+                    evento = None
+                if evento is None:
+                    errores += 1
+                    continue
+                resumen['eventos_actualizados'] += 1
+            if not errores:
+                sincronizados.extend(ids_rellenados.get(localidad_id, []))
+    RegistroClima.objects.filter(id__in=sincronizados).update(calendario_actualizado=True)
+
+    return resumen
@@ -0,0 +1,180 @@
+"""
+Resúmenes semanales/mensuales de clima (ResumenClima) y retención de RegistroClima.
+
+- actualizar_resumenes: el cron y backfill_climate recalculan sólo los
+  períodos de los días que guardaron, con una query agrupada por período.
+- compactar_historial: borra los RegistroClima diarios anteriores al
+  horizonte de retención (settings.CLIMA_RETENCION_DIAS, alineado al inicio
+  de mes), resumiendo antes los períodos afectados.
+
+Un resumen nunca se pisa con uno de menos días: si los registros diarios de
+un período ya se compactaron, el resumen existente es el dato completo.
+"""
+
+import logging
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+
+from plantas.models import RegistroClima, ResumenClima
+
+logger = logging.getLogger(__name__)
+
+PERIODOS = ('semana', 'mes')
+CAMPOS_RESUMEN = [
+    'dias', 'temperatura_max', 'temperatura_min', 'temperatura_media',
+    'precipitacion_total_mm', 'humedad_media', 'viento_medio_kmh',
+]
+
+
+def inicio_periodo(fecha, periodo):
+    """Primer día del período que contiene `fecha` (lunes de la semana o día 1 del mes)."""
+    if periodo == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    return fecha.replace(day=1)
+
+
+def fin_periodo(inicio, periodo):
+    """Primer día del período siguiente (límite exclusivo)."""
+    if periodo == 'semana':
+        return inicio + timedelta(days=7)
+    return (inicio + timedelta(days=32)).replace(day=1)
+
+
+def recalcular_periodo(periodo, inicio, localidad_ids=None):
+    """
+    Recalcula el resumen de un período desde los RegistroClima diarios.
+
+    Args:
+        periodo: 'semana' o 'mes'
+        inicio: Primer día del período
+        localidad_ids: Localidades a recalcular (None = todas las que tengan registros)
+
+    Returns:
+        Cantidad de resúmenes guardados
+    """
+    registros = RegistroClima.objects.filter(fecha__gte=inicio, fecha__lt=fin_periodo(inicio, periodo))
+    if localidad_ids is not None:
+        registros = registros.filter(localidad_id__in=localidad_ids)
+    # Los alias no pueden coincidir con campos de RegistroClima: se renombran al armar el resumen
+    agregados = [
+        {
+            'localidad_id': fila['localidad_id'],
+            'dias': fila['n_dias'],
+            'temperatura_max': fila['t_max'],
+            'temperatura_min': fila['t_min'],
+            'temperatura_media': fila['t_media'],
+            'precipitacion_total_mm': fila['lluvia'],
+            'humedad_media': fila['humedad'],
+            'viento_medio_kmh': fila['viento'],
+        }
+        for fila in registros.order_by().values('localidad_id').annotate(
+            n_dias=Count('id'),
+            t_max=Max('temperatura_max'),
+            t_min=Min('temperatura_min'),
+            t_media=Avg((F('temperatura_max') + F('temperatura_min')) / 2),
+            lluvia=Sum('precipitacion_mm'),
+            humedad=Avg('humedad_promedio'),
+            viento=Avg('velocidad_viento_kmh'),
+        )
+    ]
+    if not agregados:
+        return 0
+
+    # No reemplazar resúmenes de períodos cuyos diarios ya se compactaron
+    dias_existentes = dict(
+        ResumenClima.objects.filter(
+            periodo=periodo, inicio=inicio, localidad_id__in=[fila['localidad_id'] for fila in agregados]
+        ).values_list('localidad_id', 'dias')
+    )
+    resumenes = [
+        ResumenClima(periodo=periodo, inicio=inicio, **fila)
+        for fila in agregados
+        if fila['dias'] >= dias_existentes.get(fila['localidad_id'], 0)
+    ]
+    ResumenClima.objects.bulk_create(
+        resumenes,
+        update_conflicts=True,
+        unique_fields=['localidad', 'periodo', 'inicio'],
+        update_fields=CAMPOS_RESUMEN + ['actualizado'],
+        batch_size=500,
+    )
+    return len(resumenes)
+
+
+def actualizar_resumenes(registros):
+    """
+    Recalcula los resúmenes de los períodos que contienen los registros dados.
+
+    Args:
+        registros: Iterable de RegistroClima (o de tuplas (localidad_id, fecha))
+
+    Returns:
+        Cantidad de resúmenes guardados
+    """
+    por_periodo = {}
+    for registro in registros:
+        localidad_id, fecha = (
+            registro if isinstance(registro, tuple) else (registro.localidad_id, registro.fecha)
+        )
+        for periodo in PERIODOS:
+            por_periodo.setdefault((periodo, inicio_periodo(fecha, periodo)), set()).add(localidad_id)
+
+    guardados = 0
+    for (periodo, inicio), localidad_ids in por_periodo.items():
+        guardados += recalcular_periodo(periodo, inicio, localidad_ids)
+    return guardados
+
+
+def fecha_corte(hoy=None, dias=None):
+    """Primer día que se conserva en RegistroClima: hoy - retención, alineado al inicio de mes."""
+    hoy = hoy or date.today()
+    if dias is None:
+        dias = settings.CLIMA_RETENCION_DIAS
+    return inicio_periodo(hoy - timedelta(days=dias), 'mes')
+
+
+def compactar_historial(hoy=None, dias=None, dry_run=False, tamano_lote=5000):
+    """
+    Resume y elimina los RegistroClima anteriores al horizonte de retención.
+
+    Args:
+        hoy: date de referencia (default: hoy)
+        dias: Días de retención (default: settings.CLIMA_RETENCION_DIAS)
+        dry_run: Sólo cuenta lo que se eliminaría
+        tamano_lote: Filas a borrar por DELETE (para no bloquear la tabla)
+
+    Returns:
+        dict con 'corte', 'registros_compactados' y 'resumenes_actualizados'
+    """
+    corte = fecha_corte(hoy, dias)
+    viejos = RegistroClima.objects.filter(fecha__lt=corte)
+    resumen = {'corte': corte, 'registros_compactados': 0, 'resumenes_actualizados': 0}
+
+    if dry_run:
+        resumen['registros_compactados'] = viejos.count()
+        return resumen
+    fechas = set(viejos.order_by().values_list('fecha', flat=True).distinct())
+    if not fechas:
+        return resumen
+
+    # 1. Resumir todos los períodos que tienen diarios por compactar
+    periodos = sorted({(periodo, inicio_periodo(fecha, periodo)) for fecha in fechas for periodo in PERIODOS})
+    for periodo, inicio in periodos:
+        resumen['resumenes_actualizados'] += recalcular_periodo(periodo, inicio)
+
+    # 2. Borrar los diarios en lotes
+    while True:
+        with transaction.atomic():
+            ids = list(viejos.order_by('id').values_list('id', flat=True)[:tamano_lote])
+            if not ids:
+                break
+            resumen['registros_compactados'] += RegistroClima.objects.filter(id__in=ids).delete()[0]
+
+    logger.info(
+        f"Historial de clima compactado antes de {corte}: {resumen['registros_compactados']} registros diarios, "
+        f"{resumen['resumenes_actualizados']} resúmenes"
+    )
+    return resumen
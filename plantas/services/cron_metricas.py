@@ -0,0 +1,212 @@
+"""
+Métricas por fase de las corridas del cron outdoor (update_outdoor_climate).
+
+- MetricaFase: cantidad, errores y latencias de una fase (percentiles p50/p90/p99).
+- armar_reporte: reporte JSON de una corrida del pipeline (fases, etapas,
+  HTTP, cache de clima y localidades más lentas).
+- guardar_corrida: lo persiste en CronRun para ver la evolución entre noches.
+- detectar_regresiones: compara la corrida con la mediana de las anteriores.
+"""
+
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Cantidad de localidades más lentas que se incluyen en el reporte
+CANTIDAD_OUTLIERS = 10
+# Corridas anteriores contra las que se compara y cuánto más lenta cuenta como regresión
+CORRIDAS_COMPARACION = 7
+FACTOR_REGRESION = 1.5
+# Fases (y totales) que se vigilan en detectar_regresiones
+METRICAS_VIGILADAS = ['duracion_s', 'clima_api.p90_ms', 'bd_guardar_clima.total_s', 'calculo_plantas.total_s',
+                      'bd_guardar_plantas.total_s', 'calendario.p90_ms']
+
+
+def percentil(valores_ordenados, p):
+    """Percentil `p` (0-100) por interpolación lineal de una lista ya ordenada."""
+    if not valores_ordenados:
+        return None
+    posicion = (len(valores_ordenados) - 1) * p / 100
+    inferior, superior = math.floor(posicion), math.ceil(posicion)
+    if inferior == superior:
+        return valores_ordenados[inferior]
+    fraccion = posicion - inferior
+    return valores_ordenados[inferior] * (1 - fraccion) + valores_ordenados[superior] * fraccion
+
+
+class MetricaFase:
+    """Latencias y errores de una fase del pipeline (thread-safe)."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.cantidad = 0
+        self.errores = 0
+        self.total_s = 0.0
+        self._muestras = []
+        self._lock = threading.Lock()
+
+    def registrar(self, segundos, error=False, cantidad=1):
+        with self._lock:
+            self.cantidad += cantidad
+            self.total_s += segundos
+            self._muestras.append(segundos)
+            if error:
+                self.errores += 1
+
+    def resumen(self):
+        """dict con cantidad, errores, total_s y percentiles/máximo en ms."""
+        with self._lock:
+            muestras = sorted(self._muestras)
+        resultado = {
+            'cantidad': self.cantidad,
+            'errores': self.errores,
+            'total_s': round(self.total_s, 4),
+        }
+        for nombre, p in (('p50_ms', 50), ('p90_ms', 90), ('p99_ms', 99)):
+            valor = percentil(muestras, p)
+            resultado[nombre] = round(valor * 1000, 1) if valor is not None else None
+        resultado['max_ms'] = round(muestras[-1] * 1000, 1) if muestras else None
+        return resultado
+
+
+def armar_reporte(pipeline, inicio, fin, opciones=None, total_localidades=None):
+    """
+    Reporte JSON-serializable de una corrida de PipelineOutdoor.
+
+    Args:
+        pipeline: PipelineOutdoor ya ejecutado
+        inicio, fin: datetimes de la corrida
+        opciones: dict de opciones del comando (concurrencia, shard, worker...)
+        total_localidades: Localidades a procesar en la corrida
+    """
+    from plantas.services import http_client, weather_cache
+
+    fases = {nombre: metrica.resumen() for nombre, metrica in pipeline.fases.items()}
+    clima_lentas = sorted(pipeline.latencias, reverse=True)[:CANTIDAD_OUTLIERS]
+    calendario_lentas = sorted(pipeline.tiempos_calendario, reverse=True)[:CANTIDAD_OUTLIERS]
+    return {
+        'fecha': pipeline.hoy.isoformat(),
+        'inicio': inicio.isoformat(),
+        'fin': fin.isoformat(),
+        'duracion_s': round((fin - inicio).total_seconds(), 3),
+        'opciones': opciones or {},
+        'totales': {
+            'localidades': total_localidades,
+            'localidades_procesadas': pipeline.localidades_procesadas,
+            'localidades_error': pipeline.localidades_error,
+            'localidades_perdidas': pipeline.localidades_perdidas,
+            'plantas_recalculadas': pipeline.plantas_actualizadas,
+            'plantas_cambiadas': pipeline.plantas_cambiadas,
+            'plantas_sin_cambios': pipeline.plantas_sin_cambios,
+            'eventos_actualizados': pipeline.eventos_actualizados,
+            'eventos_omitidos': pipeline.eventos_omitidos,
+            'consultas_api': pipeline.consultas_api,
+            'consultas_pronostico': pipeline.consultas_pronostico,
+            'riegos_postergados': pipeline.riegos_postergados,
+        },
+        'fases': fases,
+        'etapas': {
+            nombre: {
+                'concurrencia': etapa.concurrencia,
+                'items': etapa.items,
+                'errores': etapa.errores,
+                'ocupado_s': round(etapa.ocupado_s, 4),
+                'duracion_s': round(etapa.duracion_s, 4),
+                'throughput': round(etapa.throughput, 2),
+                'cola_max': etapa.cola_max,
+                'cola_promedio': round(etapa.cola_promedio, 2),
+            }
+            for nombre, etapa in pipeline.etapas.items()
+        },
+        'http': {
+            endpoint: {
+                'llamadas': metrica['llamadas'],
+                'errores': metrica['errores'],
+                'promedio_ms': round(metrica['promedio_s'] * 1000, 1),
+                'max_ms': round(metrica['max_s'] * 1000, 1),
+            }
+            for endpoint, metrica in http_client.obtener_metricas().items()
+        },
+        'cache_clima': weather_cache.obtener_metricas(),
+        'outliers': {
+            'clima_api': [
+                {'localidad': nombre, 'ms': round(latencia * 1000, 1)} for latencia, nombre in clima_lentas
+            ],
+            'calendario': [
+                {'localidad': nombre, 'ms': round(segundos * 1000, 1), 'eventos': eventos}
+                for segundos, nombre, eventos in calendario_lentas
+            ],
+        },
+    }
+
+
+def _valor(reporte, ruta):
+    """Valor de `reporte` en una ruta 'fase.metrica' (o clave de primer nivel)."""
+    if '.' not in ruta:
+        return reporte.get(ruta)
+    fase, metrica = ruta.split('.', 1)
+    return (reporte.get('fases', {}).get(fase) or {}).get(metrica)
+
+
+def detectar_regresiones(reporte, anteriores):
+    """
+    Compara las métricas vigiladas con la mediana de corridas anteriores.
+
+    Args:
+        reporte: Reporte de la corrida actual (armar_reporte)
+        anteriores: Lista de reportes de corridas anteriores exitosas
+
+    Returns:
+        Lista de dicts {'metrica', 'valor', 'mediana', 'factor'} de las que
+        superan FACTOR_REGRESION veces la mediana
+    """
+    regresiones = []
+    for ruta in METRICAS_VIGILADAS:
+        valor = _valor(reporte, ruta)
+        historicos = sorted(v for v in (_valor(anterior, ruta) for anterior in anteriores) if v)
+        if valor is None or not historicos:
+            continue
+        mediana = percentil(historicos, 50)
+        if mediana and valor > mediana * FACTOR_REGRESION:
+            regresiones.append({
+                'metrica': ruta, 'valor': valor, 'mediana': round(mediana, 3), 'factor': round(valor / mediana, 2),
+            })
+    return regresiones
+
+
+def guardar_corrida(comando, reporte, inicio, fin, estado='ok', worker=''):
+    """
+    Persiste la corrida en CronRun, con las regresiones contra las anteriores.
+
+    Agrega al reporte la clave 'regresiones' (ver detectar_regresiones).
+
+    Returns:
+        CronRun creado (o None si no se pudo guardar: nunca corta el cron)
+    """
+    from plantas.models import CronRun
+
+    try:
+        anteriores = list(
+            CronRun.objects.filter(comando=comando, estado='ok')
+            .order_by('-inicio').values_list('reporte', flat=True)[:CORRIDAS_COMPARACION]
+        )
+        reporte['regresiones'] = detectar_regresiones(reporte, anteriores)
+        totales = reporte.get('totales', {})
+        return CronRun.objects.create(
+            comando=comando,
+            worker=worker,
+            estado=estado,
+            inicio=inicio,
+            fin=fin,
+            duracion_s=(fin - inicio).total_seconds(),
+            localidades_procesadas=totales.get('localidades_procesadas') or 0,
+            localidades_error=totales.get('localidades_error') or 0,
+            eventos_actualizados=totales.get('eventos_actualizados') or 0,
+            regresiones=len(reporte['regresiones']),
+            reporte=reporte,
+        )
+    except Exception as e:
+        logger.error(f"No se pudo guardar la corrida de {comando}: {e}")
+        return None
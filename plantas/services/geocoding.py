@@ -0,0 +1,124 @@
+"""
+Geocoding de nombres de localidad con cache persistente (modelo GeocodeCache).
+
+LocalidadUsuarioView y WeatherDataView resuelven texto libre ("Córdoba, Argentina")
+a coordenadas. Como los usuarios repiten siempre las mismas ciudades, la
+consulta se normaliza y se busca primero en la tabla; sólo los misses van a la
+Geocoding API (con los timeouts y reintentos de http_client) y su resultado
+queda guardado para los siguientes.
+"""
+
+import logging
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from plantas.models import GeocodeCache
+from plantas.services import http_client
+from plantas.services.weather_service import GEOCODE_URL
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_consulta(texto):
+    """
+    Forma canónica de una búsqueda: sin tildes, en minúsculas y con espacios
+    y comas uniformes ("  Córdoba ,Argentina" -> "cordoba, argentina").
+    """
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'\s*,\s*', ', ', texto.lower())
+    return re.sub(r'\s+', ' ', texto).strip(' ,')[:255]
+
+
+def _como_resultado(entrada):
+    return {
+        'latitud': entrada.latitud,
+        'longitud': entrada.longitud,
+        'direccion_formateada': entrada.direccion_formateada,
+    }
+
+
+def geocodificar(texto):
+    """
+    Coordenadas y dirección formateada de un texto libre.
+
+    Returns:
+        dict {'latitud', 'longitud', 'direccion_formateada'} o None si Google
+        no encontró la localidad (los "sin resultados" no se cachean)
+
+    Raises:
+        requests.exceptions.RequestException: Si falla la Geocoding API
+        ValueError: Si la respuesta no es JSON
+    """
+    consulta = normalizar_consulta(texto)
+    if not consulta:
+        return None
+
+    entrada = GeocodeCache.objects.filter(consulta=consulta).first()
+    if entrada is not None:
+        GeocodeCache.objects.filter(pk=entrada.pk).update(hits=F('hits') + 1, ultimo_uso=timezone.now())
+        return _como_resultado(entrada)
+
+    params = {'address': texto, 'key': settings.GOOGLE_MAPS_API_KEY}
+    response = http_client.get(GEOCODE_URL, params=params, endpoint='geocoding')
+    response.raise_for_status()
+    data = response.json()
+    if not data.get('results'):
+        if data.get('status') not in (None, 'OK', 'ZERO_RESULTS'):
+            logger.warning(f"Geocoding respondió {data.get('status')} para '{texto}': {data.get('error_message', '')}")
+        return None
+
+    result = data['results'][0]
+    location = result['geometry']['location']
+    # update_or_create: si otro request cacheó la misma consulta en paralelo, gana el último
+    entrada, _ = GeocodeCache.objects.update_or_create(
+        consulta=consulta,
+        defaults={
+            'latitud': location['lat'],
+            'longitud': location['lng'],
+            'direccion_formateada': result['formatted_address'][:255],
+            'ultimo_uso': timezone.now(),
+        },
+    )
+    return _como_resultado(entrada)
+
+
+def tasa_de_hits():
+    """
+    Hits y misses acumulados del cache (cada fila existente fue un miss al crearse).
+
+    Returns:
+        dict {'hits', 'misses', 'tasa'} con tasa entre 0 y 1 (None si está vacío)
+    """
+    totales = GeocodeCache.objects.aggregate(hits=Sum('hits'), misses=Count('id'))
+    hits, misses = totales['hits'] or 0, totales['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'tasa': hits / total if total else None}
+
+
+def podar(max_entradas=None, dias_sin_uso=None):
+    """
+    Elimina entradas en orden LRU.
+
+    Args:
+        max_entradas: Conservar sólo las N usadas más recientemente
+        dias_sin_uso: Eliminar las que no se usan hace más de N días
+
+    Returns:
+        Cantidad de entradas eliminadas
+    """
+    eliminadas = 0
+    if dias_sin_uso is not None:
+        limite = timezone.now() - timedelta(days=dias_sin_uso)
+        eliminadas += GeocodeCache.objects.filter(ultimo_uso__lt=limite).delete()[0]
+    if max_entradas is not None:
+        sobrantes = GeocodeCache.objects.order_by('-ultimo_uso', '-id').values_list('id', flat=True)[max_entradas:]
+        ids = list(sobrantes)
+        if ids:
+            eliminadas += GeocodeCache.objects.filter(id__in=ids).delete()[0]
+    return eliminadas
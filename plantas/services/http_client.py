@@ -0,0 +1,152 @@
+"""
+Cliente HTTP compartido para las llamadas salientes a Google (Geocoding y Weather).
+
+- Reutiliza conexiones (keep-alive) con un pool por host, así cada consulta
+  no paga un handshake TCP+TLS nuevo. El pool admite settings.HTTP_POOL_MAXSIZE
+  conexiones por host; los comandos con más threads lo agrandan con ajustar_pool.
+- Siempre aplica timeouts de conexión y lectura.
+- Reintenta los GET (idempotentes) ante errores de red o respuestas 429/5xx
+  con backoff exponencial y jitter.
+- Registra la latencia por endpoint para poder diagnosticar el cron y las vistas.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# (conexión, lectura) en segundos
+DEFAULT_TIMEOUT = (3.05, 10)
+MAX_REINTENTOS = 2
+BACKOFF_BASE_SEGUNDOS = 0.5
+STATUS_REINTENTABLES = {429, 500, 502, 503, 504}
+POOL_MAXSIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+_pool_maxsize = None
+
+_metricas = {}
+_metricas_lock = threading.Lock()
+
+
+def _tamano_pool():
+    """Conexiones por host del pool: el mayor entre el setting y lo pedido con ajustar_pool."""
+    return max(getattr(settings, 'HTTP_POOL_MAXSIZE', POOL_MAXSIZE), _pool_maxsize or 0)
+
+
+def _montar_adapter(session):
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_tamano_pool())
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def get_session():
+    """Devuelve la sesión compartida del proceso (se crea una sola vez)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                _montar_adapter(session)
+                _session = session
+    return _session
+
+
+def ajustar_pool(conexiones):
+    """
+    Asegura que el pool admita `conexiones` simultáneas por host (ej: --concurrency).
+
+    Con más threads que conexiones en el pool, urllib3 descarta las que sobran
+    ("Connection pool is full") y esas consultas pierden el keep-alive. Si la
+    sesión ya existe, se le monta un adapter nuevo con el tamaño pedido.
+    """
+    global _pool_maxsize
+    with _session_lock:
+        if conexiones <= _tamano_pool():
+            return
+        _pool_maxsize = conexiones
+        if _session is not None:
+            _montar_adapter(_session)
+
+
+def _registrar(endpoint, segundos, ok):
+    with _metricas_lock:
+        metrica = _metricas.setdefault(endpoint, {'llamadas': 0, 'errores': 0, 'total_s': 0.0, 'max_s': 0.0})
+        metrica['llamadas'] += 1
+        metrica['total_s'] += segundos
+        metrica['max_s'] = max(metrica['max_s'], segundos)
+        if not ok:
+            metrica['errores'] += 1
+
+
+def obtener_metricas():
+    """
+    Devuelve una copia de las métricas acumuladas por endpoint.
+
+    Returns:
+        dict {endpoint: {'llamadas', 'errores', 'total_s', 'max_s', 'promedio_s'}}
+    """
+    with _metricas_lock:
+        return {
+            endpoint: {**metrica, 'promedio_s': metrica['total_s'] / metrica['llamadas']}
+            for endpoint, metrica in _metricas.items()
+        }
+
+
+def reiniciar_metricas():
+    """Limpia las métricas acumuladas (p. ej. al inicio de una corrida del cron)."""
+    with _metricas_lock:
+        _metricas.clear()
+
+
+def _esperar_backoff(intento):
+    time.sleep(BACKOFF_BASE_SEGUNDOS * (2 ** intento) * random.uniform(0.5, 1.5))
+
+
+def get(url, params=None, endpoint='default', timeout=DEFAULT_TIMEOUT, reintentos=MAX_REINTENTOS):
+    """
+    GET con la sesión compartida, timeouts y reintentos con backoff.
+
+    Args:
+        url: URL a consultar
+        params: dict de query params (opcional)
+        endpoint: Nombre lógico para las métricas (ej: 'geocoding', 'weather')
+        timeout: float o tupla (conexión, lectura)
+        reintentos: Cantidad de reintentos ante errores transitorios
+
+    Returns:
+        requests.Response (la última, si se agotaron los reintentos por status)
+
+    Raises:
+        requests.exceptions.RequestException: Si falla la conexión en todos los intentos
+    """
+    session = get_session()
+
+    for intento in range(reintentos + 1):
+        inicio = time.perf_counter()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _registrar(endpoint, time.perf_counter() - inicio, ok=False)
+            if intento >= reintentos:
+                raise
+            logger.warning(f"Error de red en {endpoint} (intento {intento + 1}): {e}")
+            _esperar_backoff(intento)
+            continue
+
+        ok = response.status_code < 400
+        _registrar(endpoint, time.perf_counter() - inicio, ok=ok)
+
+        if response.status_code in STATUS_REINTENTABLES and intento < reintentos:
+            logger.warning(f"{endpoint} respondió {response.status_code} (intento {intento + 1}), reintentando")
+            _esperar_backoff(intento)
+            continue
+
+        return response
@@ -6,17 +6,28 @@ Este módulo ajusta la frecuencia de riego de plantas outdoor considerando:
 - Precipitación
 - Humedad relativa
 - Velocidad del viento
+
+El ajuste depende sólo del clima del día: se calcula una vez por RegistroClima
+(y queda persistido en el registro) y después se aplica en lote a las plantas
+outdoor de la localidad con aplicar_ajuste_lote. Con el pronóstico guardado
+(PronosticoClima) proyectar_pronostico posterga los riegos que una lluvia
+intensa pronosticada va a cubrir.
 """
 
-from datetime import date
+from datetime import date, timedelta
+
+# Campos de Planta que modifica el recálculo outdoor (para bulk_update)
+CAMPOS_RECALCULO_OUTDOOR = ['fecha_ultimo_riego', 'proxima_fecha_riego', 'frecuencia_riego_dias', 'motivo_riego']
 
 
-def calcular_ajuste_por_clima(planta, clima_dia):
+def calcular_ajuste_por_clima(clima_dia):
     """
     Calcula el ajuste en días para el próximo riego basado en condiciones climáticas.
     
+    No depende de la planta: normalmente se usa a través de RegistroClima.ajuste(),
+    que lo guarda junto al registro.
+    
     Args:
-        planta: Instancia del modelo Planta
         clima_dia: Dict con datos del clima del día
                    {
                        'temperatura_max': float,
@@ -113,13 +124,158 @@ def calcular_ajuste_por_clima(planta, clima_dia):
     }
 
 
-def recalcular_fecha_riego_outdoor(planta, registro_clima):
+def aplicar_ajuste_lote(plantas, registro_clima, calculos=None, hoy=None):
+    """
+    Aplica el ajuste de un RegistroClima a un lote de plantas outdoor (sin guardar).
+    
+    Modifica en memoria fecha_ultimo_riego (sólo si la lluvia cuenta como riego
+    y el registro es posterior al último riego),
+    proxima_fecha_riego y frecuencia_riego_dias; el llamador persiste
+    CAMPOS_RECALCULO_OUTDOOR en lote (ver guardar_plantas_recalculadas).
+    
+    Args:
+        plantas: Lista de instancias de Planta
+        registro_clima: Instancia de RegistroClima con datos del día
+        calculos: dict {planta_id: calculos_riego()} ya calculado en lote (opcional)
+        hoy: date opcional (default: hoy)
+    
+    Returns:
+        dict {planta_id: {
+            'dias_restantes': int,
+            'fecha_proximo_riego': date,
+            'ajuste_aplicado': float,
+            'motivo': str,
+            'reseteo_por_lluvia': bool,
+            'frecuencia_ajustada': float,  # sólo si no hubo reseteo
+            'datos_riego': dict  # cálculo base vigente tras el ajuste
+        }}
+    """
+    from plantas.services.riego_calculator import calcular_riego_lote
+    
+    plantas = list(plantas)
+    hoy = hoy or date.today()
+    ajuste = registro_clima.ajuste()
+    resultados = {}
+    
+    # Lluvia intensa: se considera regado el día del registro y se recalcula desde cero
+    # (sólo si es posterior al último riego: un registro viejo no puede atrasarlo)
+    reseteadas = []
+    if ajuste['resetear_riego']:
+        reseteadas = [
+            planta for planta in plantas
+            if planta.fecha_ultimo_riego is None or planta.fecha_ultimo_riego < registro_clima.fecha
+        ]
+        for planta in reseteadas:
+            planta.fecha_ultimo_riego = registro_clima.fecha
+        calculos_reseteo = calcular_riego_lote(reseteadas, hoy=hoy)
+        for planta in reseteadas:
+            datos_riego = calculos_reseteo[planta.id]
+            planta.programar_riego(datos_riego)
+            planta.motivo_riego = ajuste['motivo'][:255]
+            resultados[planta.id] = {
+                'dias_restantes': datos_riego['days_left'],
+                'fecha_proximo_riego': datos_riego['next_watering_date'],
+                'ajuste_aplicado': 0,
+                'motivo': ajuste['motivo'],
+                'reseteo_por_lluvia': True,
+                'datos_riego': datos_riego,
+            }
+    
+    restantes = [planta for planta in plantas if planta.id not in resultados]
+    if calculos is None:
+        calculos = calcular_riego_lote(restantes, hoy=hoy)
+    ajuste_dias = ajuste['ajuste_dias']
+    
+    for planta in restantes:
+        datos_riego = calculos[planta.id]
+        dias_ajustados = max(1, datos_riego['frequency_days'] + ajuste_dias)  # Mínimo 1 día entre riegos
+        
+        dias_desde_ultimo = (hoy - planta.fecha_ultimo_riego).days
+        dias_restantes = max(0, int(dias_ajustados - dias_desde_ultimo))
+        fecha_proximo = hoy + timedelta(days=dias_restantes)
+        
+        # Programación ajustada por clima (sin recalcular la base)
+        planta.proxima_fecha_riego = fecha_proximo
+        planta.frecuencia_riego_dias = int(dias_ajustados)
+        planta.motivo_riego = ajuste['motivo'][:255]
+        planta.marcar_programada()
+        
+        resultados[planta.id] = {
+            'dias_restantes': dias_restantes,
+            'fecha_proximo_riego': fecha_proximo,
+            'ajuste_aplicado': ajuste_dias,
+            'motivo': ajuste['motivo'],
+            'reseteo_por_lluvia': False,
+            'frecuencia_ajustada': dias_ajustados,
+            'datos_riego': datos_riego,
+        }
+    
+    return resultados
+
+
+def proyectar_pronostico(plantas, pronosticos, resultados=None):
+    """
+    Posterga el próximo riego de las plantas si se pronostica lluvia intensa antes (sin guardar).
+    
+    Una lluvia que cuenta como riego el día D (o antes del riego programado)
+    hace innecesario regar: el próximo riego pasa a D + frecuencia base. No
+    toca fecha_ultimo_riego: si la lluvia no llega, la corrida de ese día
+    vuelve a calcular desde el último riego real.
+    
+    Args:
+        plantas: Plantas ya ajustadas por el clima del día (aplicar_ajuste_lote)
+        pronosticos: PronosticoClima de días futuros de la localidad, ordenados por fecha
+        resultados: Resultado de aplicar_ajuste_lote (se actualiza en el lugar)
+    
+    Returns:
+        dict {planta_id: {'fecha_proximo_riego': date, 'motivo': str}} sólo de las postergadas
+    """
+    lluvias = [pronostico for pronostico in pronosticos if pronostico.ajuste()['resetear_riego']]
+    if not lluvias:
+        return {}
+    
+    postergadas = {}
+    for planta in plantas:
+        if planta.proxima_fecha_riego is None:
+            continue
+        resultado = (resultados or {}).get(planta.id)
+        frecuencia = planta.frecuencia_riego_dias
+        if resultado is not None:
+            frecuencia = resultado['datos_riego']['frequency_days']
+        if not frecuencia:
+            continue
+        
+        for lluvia in lluvias:
+            if lluvia.fecha > planta.proxima_fecha_riego:
+                break
+            planta.proxima_fecha_riego = lluvia.fecha + timedelta(days=frecuencia)
+            planta.motivo_riego = f"Lluvia intensa pronosticada para el {lluvia.fecha:%d/%m} ({lluvia.precipitacion_mm:.1f}mm)"
+            postergadas[planta.id] = {
+                'fecha_proximo_riego': planta.proxima_fecha_riego,
+                'motivo': planta.motivo_riego,
+            }
+        
+        if planta.id in postergadas and resultado is not None:
+            hoy = resultado['fecha_proximo_riego'] - timedelta(days=resultado['dias_restantes'])
+            resultado['fecha_proximo_riego'] = planta.proxima_fecha_riego
+            resultado['dias_restantes'] = (planta.proxima_fecha_riego - hoy).days
+            resultado['motivo'] = postergadas[planta.id]['motivo']
+    
+    return postergadas
+
+
+def recalcular_fecha_riego_outdoor(planta, registro_clima, datos_riego=None, guardar=True):
     """
     Recalcula la fecha del próximo riego para una planta outdoor.
     
+    Versión de una sola planta de aplicar_ajuste_lote.
+    
     Args:
         planta: Instancia del modelo Planta
         registro_clima: Instancia del modelo RegistroClima con datos del día
+        datos_riego: Resultado de calculos_riego() ya calculado en lote (opcional)
+        guardar: Si es False sólo modifica la instancia; el llamador persiste
+                 CAMPOS_RECALCULO_OUTDOOR en lote (ver guardar_plantas_recalculadas)
     
     Returns:
         dict: {
@@ -130,54 +286,75 @@ def recalcular_fecha_riego_outdoor(planta, registro_clima):
             'reseteo_por_lluvia': bool
         }
     """
-    from datetime import timedelta
-    
-    # Obtener datos del clima
-    clima_dia = {
-        'temperatura_max': registro_clima.temperatura_max,
-        'temperatura_min': registro_clima.temperatura_min,
-        'humedad_promedio': registro_clima.humedad_promedio,
-        'precipitacion_mm': registro_clima.precipitacion_mm,
-        'velocidad_viento_kmh': registro_clima.velocidad_viento_kmh,
-    }
+    calculos = {planta.id: datos_riego} if datos_riego else None
+    resultado = aplicar_ajuste_lote([planta], registro_clima, calculos)[planta.id]
     
-    # Calcular ajuste
-    resultado_ajuste = calcular_ajuste_por_clima(planta, clima_dia)
+    if guardar:
+        if resultado['reseteo_por_lluvia']:
+            planta.save()
+        else:
+            planta.save(update_fields=planta.CAMPOS_PROGRAMACION + ['motivo_riego'])
     
-    # Si hay que resetear por lluvia intensa
-    if resultado_ajuste['resetear_riego']:
-        planta.fecha_ultimo_riego = registro_clima.fecha
-        planta.save()
-        
-        # Recalcular desde cero
-        datos_riego = planta.calculos_riego()
-        
-        return {
-            'dias_restantes': datos_riego['days_left'],
-            'fecha_proximo_riego': datos_riego['next_watering_date'],
-            'ajuste_aplicado': 0,
-            'motivo': resultado_ajuste['motivo'],
-            'reseteo_por_lluvia': True
-        }
+    return resultado
+
+
+def firma_programacion(planta):
+    """Lo que el recálculo outdoor puede cambiar de una planta (para detectar cambios)."""
+    return tuple(getattr(planta, campo) for campo in CAMPOS_RECALCULO_OUTDOOR)
+
+
+def separar_cambiadas(plantas, firmas_anteriores):
+    """
+    Separa las plantas cuya programación cambió respecto de `firmas_anteriores`.
     
-    # Obtener cálculo base actual
-    datos_base = planta.calculos_riego()
-    dias_base = datos_base['frequency_days']
+    Args:
+        plantas: Plantas ya recalculadas (en memoria)
+        firmas_anteriores: dict {planta_id: firma_programacion()} tomado antes de recalcular
     
-    # Aplicar ajuste
-    ajuste = resultado_ajuste['ajuste_dias']
-    dias_ajustados = max(1, dias_base + ajuste)  # Mínimo 1 día entre riegos
+    Returns:
+        tuple (cambiadas, sin_cambios) como listas
+    """
+    cambiadas = []
+    sin_cambios = []
+    for planta in plantas:
+        if firmas_anteriores.get(planta.id) == firma_programacion(planta):
+            sin_cambios.append(planta)
+        else:
+            cambiadas.append(planta)
+    return cambiadas, sin_cambios
+
+
+def requiere_evento(planta, fecha_anterior):
+    """
+    Si hay que tocar el evento de Calendar de una planta recalculada: cambió la
+    fecha del riego o todavía no tiene evento. Un cambio sólo en el texto del
+    motivo (ej: la temperatura exacta del día) no justifica recrearlo.
+    """
+    return not planta.google_calendar_event_id or planta.proxima_fecha_riego != fecha_anterior
+
+
+def cargar_plantas_outdoor_por_usuario(user_ids):
+    """
+    Carga en una sola query las plantas outdoor de varios usuarios.
     
-    # Calcular nueva fecha de próximo riego
-    dias_desde_ultimo = (date.today() - planta.fecha_ultimo_riego).days
-    dias_restantes = max(0, int(dias_ajustados - dias_desde_ultimo))
-    fecha_proximo = date.today() + timedelta(days=dias_restantes)
+    Returns:
+        dict {user_id: [Planta, ...]}
+    """
+    from plantas.models import Planta
     
-    return {
-        'dias_restantes': dias_restantes,
-        'fecha_proximo_riego': fecha_proximo,
-        'ajuste_aplicado': ajuste,
-        'motivo': resultado_ajuste['motivo'],
-        'reseteo_por_lluvia': False,
-        'frecuencia_ajustada': dias_ajustados
-    }
+    plantas_por_usuario = {}
+    plantas = Planta.objects.filter(
+        usuario_id__in=user_ids,
+        tipo_cultivo='outdoor'
+    ).select_related('usuario').order_by('usuario_id', 'id')
+    for planta in plantas:
+        plantas_por_usuario.setdefault(planta.usuario_id, []).append(planta)
+    return plantas_por_usuario
+
+
+def guardar_plantas_recalculadas(plantas):
+    """Persiste en lote los cambios de recalcular_fecha_riego_outdoor(..., guardar=False)."""
+    from plantas.models import Planta
+    
+    if plantas:
+        Planta.objects.bulk_update(plantas, CAMPOS_RECALCULO_OUTDOOR, batch_size=500)
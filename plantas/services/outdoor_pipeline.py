@@ -0,0 +1,506 @@
+"""
+Pipeline por etapas del recálculo diario de riegos outdoor.
+
+Lo usan el comando update_outdoor_climate (Render Cron) y el scheduler, así la
+lógica vive en un solo lugar. Las etapas corren en paralelo, conectadas por
+colas acotadas (si una etapa se atrasa, las anteriores esperan en lugar de
+acumular trabajo en memoria):
+
+1. Clima (un thread productor + `concurrencia_clima` consultas simultáneas):
+   toma lotes de localidades, reutiliza el clima ya guardado hoy si se reanuda
+   y consulta la Weather API (condiciones actuales y pronóstico de los
+   próximos días) una vez por celda de grilla sin el dato en weather_cache.
+2. Base de datos (thread que llama a ejecutar): guarda los RegistroClima
+   (y sus resúmenes semanal/mensual) y los PronosticoClima, aplica el ajuste del día a las plantas outdoor, proyecta
+   el pronóstico (lluvia intensa que posterga el riego) y marca el checkpoint
+   del lote en una transacción.
+3. Calendar (`concurrencia_calendario` workers): actualiza los eventos de
+   Google Calendar de cada localidad y marca su checkpoint.
+
+El recálculo es incremental: se comparan la fecha y el motivo nuevos con los
+persistidos y sólo se guardan las plantas que cambiaron; Calendar sólo se
+toca si cambió la fecha del riego (o la planta no tiene evento).
+
+Los checkpoints son los de RegistroClima (ver update_outdoor_climate). En modo
+--claim cada etapa renueva el lease de lo que toma y descarta las localidades
+que otro worker reclamó mientras esperaban en una cola.
+"""
+
+import logging
+import queue
+import threading
+import time
+from datetime import date
+
+from django.db import connection, transaction
+
+from plantas.models import RegistroClima, PronosticoClima
+from plantas.services.weather_service import (
+    obtener_climas_concurrente, guardar_registros_clima_lote, agrupar_por_celda, localidades_sin_cache,
+    dias_pronostico, obtener_pronosticos_concurrente, guardar_pronosticos_lote, pronosticos_por_localidad
+)
+from plantas.services.clima_resumen import actualizar_resumenes
+from plantas.services.cron_metricas import MetricaFase
+from plantas.services.outdoor_calculator import (
+    aplicar_ajuste_lote, proyectar_pronostico, cargar_plantas_outdoor_por_usuario, guardar_plantas_recalculadas,
+    firma_programacion, separar_cambiadas, requiere_evento
+)
+
+logger = logging.getLogger(__name__)
+
+TAMANO_COLA_DEFAULT = 4
+
+# Fases instrumentadas (tiempos por llamada, ver cron_metricas.MetricaFase)
+FASES = ['clima_api', 'pronostico_api', 'bd_guardar_clima', 'calculo_plantas', 'bd_guardar_plantas', 'calendario']
+
+# Marca de fin de una cola
+_FIN = object()
+
+
+class EstadisticasEtapa:
+    """Contadores de una etapa: items, tiempo activo y profundidad de su cola de entrada."""
+
+    def __init__(self, nombre, concurrencia):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.items = 0
+        self.errores = 0
+        self.ocupado_s = 0.0
+        self.cola_max = 0
+        self._cola_suma = 0
+        self._cola_muestras = 0
+        self._inicio = None
+        self._fin = None
+        self._lock = threading.Lock()
+
+    def registrar(self, items, segundos, errores=0):
+        ahora = time.perf_counter()
+        with self._lock:
+            self.items += items
+            self.errores += errores
+            self.ocupado_s += segundos
+            if self._inicio is None:
+                self._inicio = ahora - segundos
+            self._fin = ahora
+
+    def muestrear_cola(self, profundidad):
+        with self._lock:
+            self.cola_max = max(self.cola_max, profundidad)
+            self._cola_suma += profundidad
+            self._cola_muestras += 1
+
+    @property
+    def duracion_s(self):
+        if self._inicio is None:
+            return 0.0
+        return self._fin - self._inicio
+
+    @property
+    def throughput(self):
+        """Items por segundo mientras la etapa estuvo activa."""
+        return self.items / self.duracion_s if self.duracion_s else 0.0
+
+    @property
+    def cola_promedio(self):
+        return self._cola_suma / self._cola_muestras if self._cola_muestras else 0.0
+
+
+class PipelineOutdoor:
+    """
+    Ejecuta el recálculo outdoor sobre un iterable de lotes de LocalidadUsuario.
+
+    Args:
+        hoy: date de la corrida (default: hoy)
+        resume: Reutiliza el clima de hoy y saltea los pasos ya marcados
+        concurrencia_clima: Consultas simultáneas a la Weather API
+        concurrencia_calendario: Workers de Google Calendar
+        tamano_cola: Lotes (o localidades, en Calendar) que puede haber en espera por etapa
+        reporte: callable(mensaje, nivel) con nivel 'info', 'detalle', 'warning' o 'error'
+        reclamos: ReclamosWorker en modo --claim (renueva y termina los reclamos de cada localidad)
+    """
+
+    def __init__(self, hoy=None, resume=False, concurrencia_clima=1, concurrencia_calendario=1,
+                 tamano_cola=TAMANO_COLA_DEFAULT, reporte=None, reclamos=None):
+        self.hoy = hoy or date.today()
+        self.resume = resume
+        self.concurrencia_clima = max(1, concurrencia_clima)
+        self.concurrencia_calendario = max(1, concurrencia_calendario)
+        self.tamano_cola = max(1, tamano_cola)
+        self.reporte = reporte or _reporte_log
+        self.reclamos = reclamos
+
+        self.localidades_procesadas = 0
+        self.localidades_error = 0
+        self.plantas_actualizadas = 0
+        self.plantas_cambiadas = 0
+        self.plantas_sin_cambios = 0
+        self.eventos_omitidos = 0
+        self.eventos_actualizados = 0
+        self.consultas_api = 0
+        self.consultas_pronostico = 0
+        self.dias_pronostico = dias_pronostico()
+        self.pronosticos_cambiados = 0
+        self.riegos_postergados = 0
+        self.localidades_perdidas = 0
+        self.latencias = []
+        self.tiempos_calendario = []
+
+        self.fases = {nombre: MetricaFase(nombre) for nombre in FASES}
+        self.etapas = {
+            'clima': EstadisticasEtapa('clima', self.concurrencia_clima),
+            'base_de_datos': EstadisticasEtapa('base_de_datos', 1),
+            'calendario': EstadisticasEtapa('calendario', self.concurrencia_calendario),
+        }
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+
+    # ------------------------------------------------------------------ ejecución
+
+    def ejecutar(self, lotes):
+        """Procesa todos los lotes y espera a que terminen las tres etapas."""
+        cola_clima = queue.Queue(maxsize=self.tamano_cola)
+        cola_calendario = queue.Queue(maxsize=self.tamano_cola * self.concurrencia_calendario)
+
+        productor = threading.Thread(
+            target=self._etapa_clima, args=(lotes, cola_clima), name='outdoor-clima', daemon=True
+        )
+        workers = [
+            threading.Thread(
+                target=self._etapa_calendario, args=(cola_calendario,), name=f'outdoor-calendario-{i}', daemon=True
+            )
+            for i in range(self.concurrencia_calendario)
+        ]
+        productor.start()
+        for worker in workers:
+            worker.start()
+
+        try:
+            self._etapa_base_de_datos(cola_clima, cola_calendario)
+        finally:
+            # Si la etapa de BD se cortó antes de tiempo, liberar al productor bloqueado en la cola
+            self._detener.set()
+            while productor.is_alive():
+                try:
+                    cola_clima.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            for _ in workers:
+                cola_calendario.put(_FIN)
+            for worker in workers:
+                worker.join()
+        return self
+
+    def _poner(self, cola, item, etapa):
+        cola.put(item)
+        self.etapas[etapa].muestrear_cola(cola.qsize())
+
+    # ------------------------------------------------------------------ etapa 1: clima
+
+    def _etapa_clima(self, lotes, cola_clima):
+        try:
+            for lote in lotes:
+                if self._detener.is_set():
+                    return
+                inicio = time.perf_counter()
+                try:
+                    existentes = self._registros_existentes(lote)
+                    a_consultar = [localidad for localidad in lote if localidad.id not in existentes]
+                    with self._lock:
+                        # Las celdas con clima vigente en cache no van a la API
+                        self.consultas_api += len(agrupar_por_celda(localidades_sin_cache(a_consultar)))
+
+                    resultados = []
+                    errores = 0
+                    for localidad, datos_clima, latencia in obtener_climas_concurrente(a_consultar, self.concurrencia_clima):
+                        self.latencias.append((latencia, localidad.nombre_localidad))
+                        self.fases['clima_api'].registrar(latencia, error=datos_clima is None)
+                        self.reporte(f'  → {localidad.nombre_localidad} (Weather API: {latencia * 1000:.0f} ms)', 'detalle')
+                        if datos_clima is None:
+                            self.reporte(f'    ✗ Error al obtener clima para {localidad.nombre_localidad}', 'error')
+                            errores += 1
+                            continue
+                        resultados.append((localidad, datos_clima))
+                    pronosticos = self._consultar_pronosticos(lote)
+                except Exception as e:
+                    self.reporte(f'  ✗ Error al consultar clima de un lote de {len(lote)} localidades: {e}', 'error')
+                    self._sumar_errores(len(lote))
+                    self.etapas['clima'].registrar(0, time.perf_counter() - inicio, errores=len(lote))
+                    continue
+
+                self._sumar_errores(errores)
+                self.etapas['clima'].registrar(len(lote), time.perf_counter() - inicio, errores=errores)
+                self._poner(cola_clima, (lote, existentes, resultados, pronosticos), 'base_de_datos')
+        except Exception as e:
+            # Falla al generar los lotes (ej: query de reclamo): se corta la producción
+            self.reporte(f'  ✗ Error al obtener lotes de localidades: {e}', 'error')
+        finally:
+            cola_clima.put(_FIN)
+            connection.close()
+
+    def _registros_existentes(self, lote):
+        """RegistroClima de hoy para el lote (sólo al reanudar)."""
+        if not self.resume:
+            return {}
+        por_id = {localidad.id: localidad for localidad in lote}
+        existentes = {}
+        for registro in RegistroClima.objects.filter(fecha=self.hoy, localidad_id__in=por_id):
+            registro.localidad = por_id[registro.localidad_id]
+            existentes[registro.localidad_id] = registro
+        return existentes
+
+    def _consultar_pronosticos(self, lote):
+        """Pronóstico de las localidades del lote (al reanudar, sólo las que no lo tienen de hoy)."""
+        if not self.dias_pronostico:
+            return []
+        a_consultar = lote
+        if self.resume:
+            con_pronostico = set(
+                PronosticoClima.objects.filter(localidad__in=lote, emitido=self.hoy).values_list('localidad_id', flat=True)
+            )
+            a_consultar = [localidad for localidad in lote if localidad.id not in con_pronostico]
+        inicio = time.perf_counter()
+        pronosticos, consultas = obtener_pronosticos_concurrente(a_consultar, self.dias_pronostico, self.concurrencia_clima)
+        if consultas:
+            self.fases['pronostico_api'].registrar(time.perf_counter() - inicio, cantidad=consultas)
+        with self._lock:
+            self.consultas_pronostico += consultas
+        return pronosticos
+
+    # ------------------------------------------------------------------ etapa 2: base de datos
+
+    def _etapa_base_de_datos(self, cola_clima, cola_calendario):
+        while True:
+            item = cola_clima.get()
+            if item is _FIN:
+                return
+            lote, existentes, resultados, pronosticos = item
+            inicio = time.perf_counter()
+            try:
+                if self.reclamos is not None:
+                    lote, existentes, resultados, pronosticos = self._lote_vigente(lote, existentes, resultados, pronosticos)
+                pendientes_calendario = self._procesar_lote(lote, existentes, resultados, pronosticos)
+            except Exception as e:
+                self.reporte(f'  ✗ Error al procesar lote de {len(lote)} localidades: {e}', 'error')
+                self._sumar_errores(len(lote))
+                self.etapas['base_de_datos'].registrar(0, time.perf_counter() - inicio, errores=len(lote))
+                continue
+            self.etapas['base_de_datos'].registrar(len(lote), time.perf_counter() - inicio)
+            # Lo que no sigue a Calendar (ej: sin clima por error de la API) termina acá
+            en_calendario = {trabajo[0].id for trabajo in pendientes_calendario}
+            self._terminar_reclamos([localidad for localidad in lote if localidad.id not in en_calendario])
+
+            for trabajo in pendientes_calendario:
+                self._poner(cola_calendario, trabajo, 'calendario')
+
+    def _lote_vigente(self, lote, existentes, resultados, pronosticos):
+        """Renueva el lease del lote y descarta las localidades que otro worker reclamó mientras esperaba."""
+        vigentes = self.reclamos.renovar(lote)
+        if len(vigentes) == len(lote):
+            return lote, existentes, resultados, pronosticos
+        ids = {localidad.id for localidad in vigentes}
+        perdidas = len(lote) - len(vigentes)
+        with self._lock:
+            self.localidades_perdidas += perdidas
+        self.reporte(f'  ⚑ {perdidas} localidades del lote reclamadas por otro worker (lease vencido), se omiten', 'warning')
+        return (
+            vigentes,
+            {localidad_id: registro for localidad_id, registro in existentes.items() if localidad_id in ids},
+            [(localidad, datos) for localidad, datos in resultados if localidad.id in ids],
+            [(localidad, dias) for localidad, dias in pronosticos if localidad.id in ids],
+        )
+
+    def _procesar_lote(self, lote, existentes, resultados, pronosticos):
+        """
+        Guarda el clima y el pronóstico, recalcula las plantas y marca el checkpoint del lote.
+
+        Returns:
+            Lista de (localidad, registro, plantas, datos_por_planta) para Calendar, sólo con
+            las plantas cuyo evento hay que actualizar
+        """
+        inicio = time.perf_counter()
+        registros = guardar_registros_clima_lote(resultados, fecha=self.hoy)
+        # Resúmenes semanal/mensual de los días recién guardados (incremental)
+        actualizar_resumenes(registros.values())
+        registros.update(existentes)
+        self.localidades_procesadas += len(registros)
+        self.pronosticos_cambiados += guardar_pronosticos_lote(pronosticos, emitido=self.hoy)['dias_cambiados']
+        pronosticos_guardados = pronosticos_por_localidad(list(registros), self.hoy) if self.dias_pronostico else {}
+        self.fases['bd_guardar_clima'].registrar(time.perf_counter() - inicio, cantidad=len(resultados))
+
+        # Plantas outdoor de todo el lote en una sola query
+        plantas_por_usuario = cargar_plantas_outdoor_por_usuario(
+            [localidad.user_id for localidad in lote if localidad.id in registros]
+        )
+
+        recalculadas = []
+        datos_por_planta = {}
+        eventos_por_localidad = {}
+        registros_recalculados = []
+        for localidad in lote:
+            registro_clima = registros.get(localidad.id)
+            if registro_clima is None or registro_clima.riegos_recalculados:
+                continue
+            plantas_outdoor = plantas_por_usuario.get(localidad.user_id, [])
+            firmas = {planta.id: firma_programacion(planta) for planta in plantas_outdoor}
+            self.reporte(
+                f'    ✓ Clima de {localidad.nombre_localidad}: {registro_clima.temperatura_max}°C, '
+                f'{registro_clima.precipitacion_mm}mm lluvia ({registro_clima.motivo_ajuste})', 'detalle'
+            )
+
+            inicio = time.perf_counter()
+            try:
+                # Ajuste del registro (calculado una vez) aplicado a todas las plantas de la localidad
+                resultados_plantas = aplicar_ajuste_lote(plantas_outdoor, registro_clima)
+                # Proyección con el pronóstico ya guardado (ajustes precalculados por día)
+                postergadas = proyectar_pronostico(
+                    plantas_outdoor, pronosticos_guardados.get(localidad.id, []), resultados_plantas
+                )
+            except Exception as e:
+                self.fases['calculo_plantas'].registrar(time.perf_counter() - inicio, error=True, cantidad=len(plantas_outdoor))
+                self.reporte(f'    ✗ Error al recalcular plantas de {localidad.nombre_localidad}: {e}', 'error')
+                continue
+            self.fases['calculo_plantas'].registrar(time.perf_counter() - inicio, cantidad=len(plantas_outdoor))
+
+            if registro_clima.resetear_riego:
+                self.reporte('      🌧️  Riego reseteado por lluvia intensa', 'detalle')
+            for planta in plantas_outdoor:
+                resultado = resultados_plantas[planta.id]
+                self.reporte(f'    ✓ Planta "{planta.nombre_personalizado}": {resultado["dias_restantes"]} días hasta riego', 'detalle')
+                if planta.id in postergadas:
+                    self.reporte(f'      ☔ {postergadas[planta.id]["motivo"]}: riego postergado', 'detalle')
+                datos_por_planta[planta.id] = resultado['datos_riego']
+            self.riegos_postergados += len(postergadas)
+
+            # Sólo se persisten (y se llevan a Calendar) las plantas cuya programación cambió
+            cambiadas, sin_cambios = separar_cambiadas(plantas_outdoor, firmas)
+            recalculadas.extend(cambiadas)
+            eventos_por_localidad[localidad.id] = [
+                planta for planta in cambiadas if requiere_evento(planta, firmas[planta.id][1])
+            ]
+            self.plantas_actualizadas += len(plantas_outdoor)
+            self.plantas_cambiadas += len(cambiadas)
+            self.plantas_sin_cambios += len(sin_cambios)
+            registros_recalculados.append(registro_clima)
+
+        # Checkpoint del lote: plantas y marca de registros procesados en la misma transacción
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            guardar_plantas_recalculadas(recalculadas)
+            RegistroClima.objects.filter(
+                id__in=[registro.id for registro in registros_recalculados]
+            ).update(riegos_recalculados=True)
+        self.fases['bd_guardar_plantas'].registrar(time.perf_counter() - inicio, cantidad=len(recalculadas))
+        for registro in registros_recalculados:
+            registro.riegos_recalculados = True
+
+        pendientes = []
+        for localidad in lote:
+            registro_clima = registros.get(localidad.id)
+            if registro_clima is None or not registro_clima.riegos_recalculados or registro_clima.calendario_actualizado:
+                continue
+            plantas = plantas_por_usuario.get(localidad.user_id, [])
+            # Al reanudar un lote ya recalculado no se sabe qué cambió: se actualizan todas
+            con_evento = eventos_por_localidad.get(localidad.id, plantas)
+            if _tiene_calendar(localidad.user):
+                self.eventos_omitidos += len(plantas) - len(con_evento)
+            pendientes.append((localidad, registro_clima, con_evento, datos_por_planta))
+        return pendientes
+
+    # ------------------------------------------------------------------ etapa 3: calendar
+
+    def _etapa_calendario(self, cola_calendario):
+        try:
+            while True:
+                item = cola_calendario.get()
+                if item is _FIN:
+                    return
+                localidad = item[0]
+                inicio = time.perf_counter()
+                try:
+                    if self.reclamos is not None and not self.reclamos.renovar([localidad]):
+                        with self._lock:
+                            self.localidades_perdidas += 1
+                        self.reporte(f'  ⚑ {localidad.nombre_localidad} reclamada por otro worker (lease vencido), se omite Calendar', 'warning')
+                        continue
+                    eventos, errores = self._actualizar_calendario(*item)
+                except Exception as e:
+                    # Seguir consumiendo: un worker caído deja la cola llena y la etapa de BD bloqueada en put()
+                    self.reporte(f'  ✗ Error al actualizar Calendar de {localidad.nombre_localidad}: {e}', 'error')
+                    self.fases['calendario'].registrar(time.perf_counter() - inicio, error=True)
+                    eventos, errores = 0, 1
+                self._terminar_reclamos([localidad])
+                self.etapas['calendario'].registrar(eventos, time.perf_counter() - inicio, errores=errores)
+        finally:
+            connection.close()
+
+    def _actualizar_calendario(self, localidad, registro_clima, plantas, datos_por_planta):
+        """Actualiza los eventos de una localidad; marca el checkpoint si no hubo errores."""
+        from notificaciones.services.google_calendar import update_calendar_event_for_plant
+
+        eventos = 0
+        errores = 0
+        inicio_localidad = time.perf_counter()
+        if _tiene_calendar(localidad.user):
+            for planta in plantas:
+                inicio = time.perf_counter()
+                try:
+                    # Fecha ajustada por clima (si se recalculó en una corrida anterior, la guardada)
+                    evento = update_calendar_event_for_plant(
+                        planta,
+                        datos_por_planta.get(planta.id),
+                        fecha_riego=planta.proxima_fecha_riego,
+                        motivo=planta.motivo_riego or registro_clima.motivo_ajuste or None,
+                    )
+                    if evento is None:
+                        raise RuntimeError('Google Calendar no creó el evento')
+                    eventos += 1
+                    self.fases['calendario'].registrar(time.perf_counter() - inicio)
+                    self.reporte(f'      📅 Google Calendar actualizado ({planta.nombre_personalizado})', 'detalle')
+                except Exception as e:
+                    errores += 1
+                    self.fases['calendario'].registrar(time.perf_counter() - inicio, error=True)
+                    self.reporte(f'      ⚠️  No se pudo actualizar Calendar ({planta.nombre_personalizado}): {e}', 'warning')
+
+        with self._lock:
+            self.eventos_actualizados += eventos
+            if plantas:
+                self.tiempos_calendario.append(
+                    (time.perf_counter() - inicio_localidad, localidad.nombre_localidad, eventos)
+                )
+        if not errores:
+            RegistroClima.objects.filter(id=registro_clima.id).update(calendario_actualizado=True)
+        return eventos, errores
+
+    # ------------------------------------------------------------------ auxiliares
+
+    def _terminar_reclamos(self, localidades):
+        """En modo --claim marca terminadas las localidades; un error acá no corta la etapa."""
+        if self.reclamos is None or not localidades:
+            return
+        try:
+            self.reclamos.terminar(localidades)
+        except Exception as e:
+            # El reclamo vence solo y otro worker retoma lo que falte
+            self.reporte(f'  ✗ Error al terminar el reclamo de {len(localidades)} localidades: {e}', 'error')
+
+    def _sumar_errores(self, cantidad):
+        with self._lock:
+            self.localidades_error += cantidad
+
+
+def _tiene_calendar(user):
+    """Si el usuario vinculó Google Calendar."""
+    profile = getattr(user, 'profile', None)
+    return bool(profile and profile.google_access_token)
+
+
+def _reporte_log(mensaje, nivel='info'):
+    """Reporte por defecto: al logger del módulo."""
+    if nivel == 'detalle':
+        logger.debug(mensaje.strip())
+    elif nivel == 'warning':
+        logger.warning(mensaje.strip())
+    elif nivel == 'error':
+        logger.error(mensaje.strip())
+    else:
+        logger.info(mensaje.strip())
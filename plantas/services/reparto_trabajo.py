@@ -0,0 +1,181 @@
+"""
+Reparto del trabajo del cron outdoor entre varios procesos.
+
+Dos modos, combinables con --resume:
+- Shards estáticos (--shard i/n): cada proceso toma las localidades cuyas celdas
+  de grilla caen en su shard. Repartir por celda (y no por id) evita que dos
+  shards consulten la Weather API por la misma celda.
+- Reclamo dinámico (--claim): cada worker reclama lotes de localidades pendientes
+  con un lease en ReclamoLocalidad hasta que no queda nada por hacer. El lease
+  se renueva cuando el lote llega a la etapa de BD y cuando Calendar toma cada
+  localidad (un lote puede esperar en las colas del pipeline más que el lease),
+  y el reclamo se marca terminado al final: ya no vence ni se vuelve a reclamar.
+"""
+
+import logging
+import os
+import socket
+import zlib
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from plantas.models import ReclamoLocalidad
+from plantas.services.weather_service import celda_clima
+
+logger = logging.getLogger(__name__)
+
+LEASE_MINUTOS_DEFAULT = 30
+
+
+def parsear_shard(valor):
+    """
+    Convierte 'i/n' en la tupla (i, n) validando 0 <= i < n.
+    
+    Raises:
+        ValueError: Si el formato o los valores no son válidos
+    """
+    try:
+        indice, total = (int(parte) for parte in valor.split('/'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Shard inválido '{valor}': el formato es i/n (ej: 0/4)")
+    if total < 1 or not 0 <= indice < total:
+        raise ValueError(f"Shard inválido '{valor}': se requiere 0 <= i < n")
+    return indice, total
+
+
+def shard_de_celda(celda, total_shards):
+    """Shard (0..n-1) de una celda; estable entre procesos y máquinas."""
+    return zlib.crc32(repr(celda).encode()) % total_shards
+
+
+def ids_del_shard(localidades, indice, total_shards):
+    """
+    IDs de las localidades (QuerySet) cuyas celdas pertenecen al shard indicado.
+    
+    Sólo lee id y coordenadas.
+    """
+    return [
+        localidad_id
+        for localidad_id, latitud, longitud in localidades.values_list('id', 'latitud', 'longitud')
+        if shard_de_celda(celda_clima(latitud, longitud), total_shards) == indice
+    ]
+
+
+def id_worker_default():
+    """Identificador del worker: host y PID."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def reclamar_localidades(localidades, fecha, worker, cantidad, lease_minutos=LEASE_MINUTOS_DEFAULT):
+    """
+    Reclama hasta `cantidad` localidades sin reclamo vigente para `fecha`.
+    
+    En PostgreSQL las candidatas se leen con SELECT ... FOR UPDATE SKIP LOCKED,
+    así dos workers no compiten por las mismas filas. En motores sin SKIP LOCKED
+    (SQLite) el unique (localidad, fecha) de ReclamoLocalidad decide quién gana.
+    Los reclamos vencidos y no terminados (worker caído) o de días anteriores se
+    liberan antes de reclamar.
+    
+    Args:
+        localidades: QuerySet de LocalidadUsuario pendientes, ya ordenado
+        fecha: date de la corrida
+        worker: Identificador de este worker
+        cantidad: Tamaño máximo del lote
+        lease_minutos: Duración del reclamo
+    
+    Returns:
+        Lista de LocalidadUsuario reclamadas por este worker (vacía si no queda trabajo)
+    """
+    while True:
+        ahora = timezone.now()
+        with transaction.atomic():
+            # Liberar reclamos vencidos (worker caído) y los de días anteriores
+            ReclamoLocalidad.objects.filter(Q(expira_en__lt=ahora, terminado=False) | Q(fecha__lt=fecha)).delete()
+            
+            reclamos = ReclamoLocalidad.objects.filter(localidad_id=OuterRef('pk'), fecha=fecha)
+            candidatas = localidades.exclude(Exists(reclamos))
+            if connection.features.has_select_for_update_skip_locked:
+                candidatas = candidatas.select_for_update(skip_locked=True, of=('self',))
+            candidatas = list(candidatas[:cantidad])
+            if not candidatas:
+                return []
+            
+            expira_en = ahora + timedelta(minutes=lease_minutos)
+            ReclamoLocalidad.objects.bulk_create(
+                [
+                    ReclamoLocalidad(localidad=localidad, fecha=fecha, worker=worker, expira_en=expira_en)
+                    for localidad in candidatas
+                ],
+                ignore_conflicts=True,
+            )
+            propias = set(ReclamoLocalidad.objects.filter(
+                fecha=fecha, worker=worker, localidad_id__in=[localidad.id for localidad in candidatas]
+            ).values_list('localidad_id', flat=True))
+        
+        reclamadas = [localidad for localidad in candidatas if localidad.id in propias]
+        if reclamadas:
+            return reclamadas
+        # Otro worker ganó todas las candidatas: volver a intentar con las siguientes
+        logger.debug(f"{worker}: candidatas ya reclamadas por otro worker, reintentando")
+
+
+def renovar_reclamos(localidades, fecha, worker, lease_minutos=LEASE_MINUTOS_DEFAULT):
+    """
+    Extiende el lease de las localidades que este worker sigue teniendo reclamadas.
+    
+    Un reclamo vencido que nadie tomó todavía sigue siendo de este worker: se
+    renueva, o se vuelve a crear si otro worker lo liberó sin reclamar la
+    localidad. Si otro worker ya la reclamó, la localidad se perdió.
+    
+    Returns:
+        Lista de las localidades que siguen siendo de este worker (las perdidas no se procesan)
+    """
+    ids = [localidad.id for localidad in localidades]
+    if not ids:
+        return []
+    expira_en = timezone.now() + timedelta(minutes=lease_minutos)
+    with transaction.atomic():
+        reclamos = ReclamoLocalidad.objects.filter(localidad_id__in=ids, fecha=fecha, worker=worker)
+        reclamos.update(expira_en=expira_en)
+        ReclamoLocalidad.objects.bulk_create(
+            [ReclamoLocalidad(localidad_id=localidad_id, fecha=fecha, worker=worker, expira_en=expira_en) for localidad_id in ids],
+            ignore_conflicts=True,
+        )
+        propias = set(reclamos.values_list('localidad_id', flat=True))
+    return [localidad for localidad in localidades if localidad.id in propias]
+
+
+def terminar_reclamos(localidades, fecha, worker):
+    """Marca terminados los reclamos de este worker: no vencen ni se vuelven a reclamar en el día."""
+    ids = [localidad.id for localidad in localidades]
+    if not ids:
+        return 0
+    return ReclamoLocalidad.objects.filter(
+        localidad_id__in=ids, fecha=fecha, worker=worker
+    ).update(terminado=True)
+
+
+class ReclamosWorker:
+    """
+    Reclamos de un worker del cron outdoor para una fecha.
+    
+    Agrupa reclamar/renovar/terminar con el mismo worker, fecha y lease para
+    pasárselos al pipeline (ver PipelineOutdoor).
+    """
+    
+    def __init__(self, fecha, worker, lease_minutos=LEASE_MINUTOS_DEFAULT):
+        self.fecha = fecha
+        self.worker = worker
+        self.lease_minutos = lease_minutos
+    
+    def reclamar(self, localidades, cantidad):
+        return reclamar_localidades(localidades, self.fecha, self.worker, cantidad, self.lease_minutos)
+    
+    def renovar(self, localidades):
+        return renovar_reclamos(localidades, self.fecha, self.worker, self.lease_minutos)
+    
+    def terminar(self, localidades):
+        return terminar_reclamos(localidades, self.fecha, self.worker)
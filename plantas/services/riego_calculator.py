@@ -0,0 +1,219 @@
+"""
+Motor de cálculo de riego para una o muchas plantas.
+
+Centraliza la heurística de Planta.calculos_riego para poder aplicarla en lote
+(listado de plantas, cron outdoor, población de eventos de Calendar) sin repetir
+por cada planta el trabajo que es común a todo el lote:
+- La fecha de hoy y los ajustes por temperatura/humedad se calculan una vez.
+- Las combinaciones (maceta, tamaño, floración) repetidas se calculan una vez.
+"""
+
+from datetime import date, timedelta
+
+from django.db.models import QuerySet
+
+
+# Campos de Planta que necesita el cálculo (para querysets con .values())
+CAMPOS_CALCULO = (
+    'id', 'categoria_botanica', 'tamano_planta', 'tamano_maceta_litros',
+    'en_floracion', 'fecha_ultimo_riego', 'frecuencia_riego_manual',
+    'cantidad_agua_manual_ml',
+)
+
+SIZE_MAP = {'Pequeña': -1.0, 'pequeña': -1.0, 'Mediana': 0.0, 'mediana': 0.0, 'Grande': 1.0, 'grande': 1.0}
+
+SUGERENCIA_OTRAS = "Consultá las recomendaciones específicas del fabricante del sustrato o fertilizante que utilices."
+SUGERENCIA_FLORACION = "Floración: Base Bloom ~1 ml/L + Cal-Mag ~0.5 ml/L (arrancar bajo). Ajustar pH según sustrato."
+SUGERENCIA_VEGETACION = "Vegetación: Base Grow ~1 ml/L + Cal-Mag ~0.5 ml/L (arrancar bajo). Ajustar pH según sustrato."
+
+
+def offset_temperatura(temperatura_externa):
+    """Ajuste de frecuencia (días) por temperatura, gradual con 6 niveles."""
+    if temperatura_externa is None:
+        return 0.0
+    if temperatura_externa > 30:
+        return -2.0  # Muy caliente, regar mucho más seguido
+    if temperatura_externa > 28:
+        return -1.0  # Caliente, regar más seguido
+    if temperatura_externa > 25:
+        return -0.5  # Templado-caliente, regar un poco más seguido
+    if temperatura_externa < 12:
+        return 2.0   # Muy frío, regar mucho menos seguido
+    if temperatura_externa < 15:
+        return 1.0   # Frío, regar menos seguido
+    if temperatura_externa < 18:
+        return 0.5   # Templado-frío, regar un poco menos seguido
+    return 0.0
+
+
+def offset_humedad(humedad_externa):
+    """Ajuste de frecuencia (días) por humedad relativa (humedad baja → más riego)."""
+    if humedad_externa is None:
+        return 0.0
+    if humedad_externa < 30:
+        return -1.0  # Muy seco, regar más seguido
+    if humedad_externa < 40:
+        return -0.5  # Seco, regar un poco más seguido
+    if humedad_externa > 70:
+        return 1.0   # Muy húmedo, regar menos seguido
+    if humedad_externa > 60:
+        return 0.5   # Húmedo, regar un poco menos seguido
+    return 0.0
+
+
+def estado_por_dias(days_left):
+    """Devuelve (estado_riego, estado_texto) según los días restantes."""
+    if days_left > 1:
+        return 'no_necesita', 'No necesita agua'
+    if days_left == 1:
+        return 'pronto', 'Pronto a regar'
+    if days_left == 0:
+        return 'hoy', 'Necesita riego hoy'
+    return 'urgente', f'Riego urgente (atrasado {abs(days_left)} día{"s" if abs(days_left) > 1 else ""})'
+
+
+def _cannabis(litros, size, en_flor, clima_offset):
+    """
+    Agua recomendada, frecuencia y sugerencia para una planta Cannabis.
+
+    clima_offset es la tupla (temp_offset, humedad_offset) ya resuelta para el lote.
+    """
+    litros = max(litros, 0.1)  # Mínimo 0.1L
+
+    # Volumen por riego ≈ 15% del volumen de maceta (veg) y ≈ 20% (flor), máximo 5L
+    porcentaje = 0.20 if en_flor else 0.15
+    recommended_water_ml = min(int(litros * 1000 * porcentaje), 5000)
+
+    # Frecuencia base ~ litros/2 días (10L ≈ 5 días)
+    base = litros / 2.0 if litros > 0 else 2.0
+    size_offset = SIZE_MAP.get(size, 0.0)
+
+    # Planta grande en maceta pequeña necesita más riego (y al revés)
+    ratio_offset = 0.0
+    if size in ['Grande', 'grande'] and litros < 10:
+        ratio_offset = -1.0
+    elif size in ['Pequeña', 'pequeña'] and litros > 15:
+        ratio_offset = 0.5
+
+    stage_offset = -1.0 if en_flor else 0.0
+    temp_offset, humedad_offset = clima_offset
+
+    frequency_days = int(max(2, min(7, round(
+        base + size_offset + ratio_offset + stage_offset + temp_offset + humedad_offset, 0
+    ))))
+
+    sugerencia = SUGERENCIA_FLORACION if en_flor else SUGERENCIA_VEGETACION
+    return recommended_water_ml, frequency_days, sugerencia
+
+
+def _leer(planta, campo):
+    """Lee un campo de una instancia de Planta o de una fila de .values()."""
+    if isinstance(planta, dict):
+        return planta.get(campo)
+    return getattr(planta, campo)
+
+
+def _calcular(planta, clima_offset, today, memo):
+    """Cálculo de una planta reutilizando los invariantes del lote."""
+    if _leer(planta, 'categoria_botanica') == 'Otras':
+        frequency_days = _leer(planta, 'frecuencia_riego_manual') or 3
+        recommended_water_ml = _leer(planta, 'cantidad_agua_manual_ml') or 500
+        sugerencia = SUGERENCIA_OTRAS
+    else:
+        key = (_leer(planta, 'tamano_maceta_litros'), _leer(planta, 'tamano_planta'), _leer(planta, 'en_floracion'))
+        resultado = memo.get(key)
+        if resultado is None:
+            resultado = _cannabis(key[0], key[1], key[2], clima_offset)
+            memo[key] = resultado
+        recommended_water_ml, frequency_days, sugerencia = resultado
+
+    next_watering_date = _leer(planta, 'fecha_ultimo_riego') + timedelta(days=frequency_days)
+    days_left = (next_watering_date - today).days
+    estado_riego, estado_texto = estado_por_dias(days_left)
+
+    return {
+        "recommended_water_ml": recommended_water_ml,
+        "frequency_days": frequency_days,
+        "next_watering_date": next_watering_date,
+        "days_left": days_left,
+        "estado_riego": estado_riego,
+        "estado_texto": estado_texto,
+        "sugerencia_suplementos": sugerencia,
+    }
+
+
+def calcular_riego(planta, temperatura_externa=None, humedad_externa=None, hoy=None):
+    """
+    Calcula el riego de una sola planta (instancia o fila de .values()).
+
+    Returns:
+        dict con las mismas claves que Planta.calculos_riego()
+    """
+    clima_offset = (offset_temperatura(temperatura_externa), offset_humedad(humedad_externa))
+    return _calcular(planta, clima_offset, hoy or date.today(), {})
+
+
+def calcular_riego_lote(plantas, temperatura_externa=None, humedad_externa=None, hoy=None):
+    """
+    Calcula el riego de muchas plantas en una sola pasada.
+
+    Args:
+        plantas: QuerySet de Planta, lista de instancias o lista de dicts de .values().
+                 Si es un QuerySet sin evaluar, sólo se leen las columnas de CAMPOS_CALCULO.
+        temperatura_externa: float opcional, se aplica a todo el lote
+        humedad_externa: float opcional, se aplica a todo el lote
+        hoy: date opcional (default: hoy)
+
+    Returns:
+        dict {planta_id: resultado}, con resultado igual a Planta.calculos_riego()
+    """
+    if isinstance(plantas, QuerySet) and plantas._result_cache is None:
+        plantas = plantas.values(*CAMPOS_CALCULO)
+
+    clima_offset = (offset_temperatura(temperatura_externa), offset_humedad(humedad_externa))
+    today = hoy or date.today()
+    memo = {}
+
+    return {
+        _leer(planta, 'id'): _calcular(planta, clima_offset, today, memo)
+        for planta in plantas
+    }
+
+
+def con_programacion(resultado, planta, hoy=None):
+    """
+    Resultado de calcular_riego con la programación persistida de la planta
+    (proxima_fecha_riego y frecuencia_riego_dias, que en las outdoor incluyen el
+    ajuste por clima). Es lo que filtran ?estado= y ?vence_antes= en la API, así
+    el estado mostrado coincide con el filtro.
+    """
+    if planta.proxima_fecha_riego is None:
+        return resultado
+    days_left = (planta.proxima_fecha_riego - (hoy or date.today())).days
+    estado_riego, estado_texto = estado_por_dias(days_left)
+    return {
+        **resultado,
+        "frequency_days": planta.frecuencia_riego_dias or resultado["frequency_days"],
+        "next_watering_date": planta.proxima_fecha_riego,
+        "days_left": days_left,
+        "estado_riego": estado_riego,
+        "estado_texto": estado_texto,
+    }
+
+
+def reprogramar_plantas(plantas, temperatura_externa=None, humedad_externa=None):
+    """
+    Recalcula y persiste proxima_fecha_riego y frecuencia_riego_dias de un lote
+    de plantas con un único bulk_update (sin disparar signals de Planta).
+
+    Returns:
+        dict {planta_id: resultado} como calcular_riego_lote
+    """
+    from plantas.models import Planta
+
+    plantas = list(plantas)
+    calculos = calcular_riego_lote(plantas, temperatura_externa, humedad_externa)
+    for planta in plantas:
+        planta.programar_riego(calculos[planta.id])
+    Planta.objects.bulk_update(plantas, Planta.CAMPOS_PROGRAMACION, batch_size=500)
+    return calculos
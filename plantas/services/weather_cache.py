@@ -0,0 +1,211 @@
+"""
+Cache compartido del clima actual, por celda de grilla (coordenadas redondeadas).
+
+Lo usan WeatherDataView, LocalidadClimaView y el cron (a través de
+weather_service.obtener_clima_actual), así una localidad consultada hace un
+minuto por otro usuario, o por el cron, no vuelve a pegarle a la Weather API.
+El pronóstico (weather_service.consultar_pronostico) usa el mismo cache con
+otro prefijo de clave por cantidad de días (ver prefijo_pronostico).
+
+- Backend: el cache default de Django (settings.CACHES). En producción
+  (render.yaml) es DatabaseCache, compartido entre los workers web, el cron y
+  el worker de Calendar. Con LocMemCache (default de desarrollo) cada proceso
+  tiene su propio cache: el TTL y el lock de single-flight valen sólo dentro
+  del proceso y cada uno consulta la API por su cuenta.
+- TTL: settings.WEATHER_CACHE_TTL segundos de dato vigente.
+- Stale-while-revalidate: durante settings.WEATHER_CACHE_STALE segundos más,
+  quien acepta datos viejos recibe el último valor al instante y el refresco
+  se hace en segundo plano.
+- Single-flight: si varias consultas fallan el cache a la vez para la misma
+  celda, una sola va a la API y las demás esperan su resultado (en el proceso
+  con un Future; entre procesos con un lock cache.add en el propio cache, que
+  sólo coordina procesos si el backend es compartido).
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from plantas.services.weather_service import celda_clima
+
+logger = logging.getLogger(__name__)
+
+PREFIJO = 'clima_actual'
+PREFIJO_PRONOSTICO = 'pronostico'
+ESPERA_LOCK_SEGUNDOS = 10
+
+_en_vuelo = {}
+_en_vuelo_lock = threading.Lock()
+
+_metricas = {'hits': 0, 'viejos': 0, 'misses': 0, 'esperas': 0}
+_metricas_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, 'WEATHER_CACHE_TTL', 900)
+
+
+def _ventana_vieja():
+    return getattr(settings, 'WEATHER_CACHE_STALE', 3600)
+
+
+def prefijo_pronostico(dias):
+    """Prefijo de las claves del pronóstico de `dias` días (otro request, otro dato)."""
+    return f'{PREFIJO_PRONOSTICO}_{dias}d'
+
+
+def clave_cache(latitud, longitud, prefijo=PREFIJO):
+    """Clave de cache de una coordenada: su celda de grilla (o la coordenada redondeada)."""
+    celda = celda_clima(latitud, longitud)
+    if getattr(settings, 'WEATHER_GRID_DEGREES', 0.1) <= 0:
+        celda = (round(celda[0], 3), round(celda[1], 3))
+    return f'{prefijo}:{celda[0]}:{celda[1]}'
+
+
+def _contar(metrica):
+    with _metricas_lock:
+        _metricas[metrica] += 1
+
+
+def obtener_metricas():
+    """Copia de los contadores de hits, datos viejos servidos, misses y esperas por single-flight."""
+    with _metricas_lock:
+        return dict(_metricas)
+
+
+def obtener(latitud, longitud, cargar, permitir_viejo=False, prefijo=PREFIJO):
+    """
+    Devuelve el dato cacheado de la celda o lo carga con `cargar()`.
+
+    Args:
+        latitud, longitud: Coordenadas consultadas
+        cargar: callable sin argumentos que consulta la API (puede lanzar excepciones)
+        permitir_viejo: Si acepta un dato vencido (dentro de WEATHER_CACHE_STALE)
+                        mientras se refresca en segundo plano
+        prefijo: Tipo de dato cacheado (clima actual o prefijo_pronostico)
+
+    Returns:
+        El valor devuelto por `cargar` (actual o cacheado)
+
+    Raises:
+        Las excepciones de `cargar` si no hay dato utilizable en cache
+    """
+    clave = clave_cache(latitud, longitud, prefijo)
+    entrada = cache.get(clave)
+
+    if entrada is not None:
+        edad = time.time() - entrada['obtenido']
+        if edad < _ttl():
+            _contar('hits')
+            return entrada['datos']
+        if permitir_viejo:
+            _contar('viejos')
+            _refrescar_en_segundo_plano(clave, cargar)
+            return entrada['datos']
+
+    _contar('misses')
+    return _cargar_una_vez(clave, cargar)
+
+
+def claves_vigentes(coordenadas, prefijo=PREFIJO):
+    """
+    Claves de cache con dato vigente (dentro del TTL) entre las de `coordenadas`,
+    con un solo get_many. Consultar esas celdas no va a la API.
+
+    Args:
+        coordenadas: Iterable de (latitud, longitud)
+        prefijo: Tipo de dato cacheado (ver obtener)
+
+    Returns:
+        set de claves (ver clave_cache)
+    """
+    claves = {clave_cache(latitud, longitud, prefijo) for latitud, longitud in coordenadas}
+    if not claves:
+        return set()
+    ahora = time.time()
+    return {
+        clave for clave, entrada in cache.get_many(list(claves)).items()
+        if ahora - entrada['obtenido'] < _ttl()
+    }
+
+
+def invalidar(latitud, longitud, prefijo=PREFIJO):
+    """Elimina el dato cacheado de la celda."""
+    cache.delete(clave_cache(latitud, longitud, prefijo))
+
+
+def _guardar(clave, datos):
+    cache.set(clave, {'datos': datos, 'obtenido': time.time()}, timeout=_ttl() + _ventana_vieja())
+
+
+def _cargar_una_vez(clave, cargar):
+    """Carga la clave con single-flight dentro del proceso y entre procesos."""
+    with _en_vuelo_lock:
+        futuro = _en_vuelo.get(clave)
+        propio = futuro is None
+        if propio:
+            futuro = Future()
+            _en_vuelo[clave] = futuro
+
+    if not propio:
+        _contar('esperas')
+        return futuro.result(timeout=ESPERA_LOCK_SEGUNDOS * 3)
+
+    clave_lock = f'{clave}:lock'
+    tengo_lock = False
+    try:
+        tengo_lock = cache.add(clave_lock, 1, timeout=ESPERA_LOCK_SEGUNDOS)
+        if not tengo_lock:
+            # Otro proceso la está cargando: esperar su resultado antes de ir a la API
+            entrada = _esperar_entrada(clave)
+            if entrada is not None:
+                _contar('esperas')
+                futuro.set_result(entrada['datos'])
+                return entrada['datos']
+
+        datos = cargar()
+        _guardar(clave, datos)
+        futuro.set_result(datos)
+        return datos
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        if tengo_lock:
+            cache.delete(clave_lock)
+        with _en_vuelo_lock:
+            _en_vuelo.pop(clave, None)
+
+
+def _esperar_entrada(clave):
+    """Espera (hasta ESPERA_LOCK_SEGUNDOS) a que otro proceso guarde un dato vigente."""
+    limite = time.monotonic() + ESPERA_LOCK_SEGUNDOS
+    while time.monotonic() < limite:
+        time.sleep(0.1)
+        entrada = cache.get(clave)
+        if entrada is not None and time.time() - entrada['obtenido'] < _ttl():
+            return entrada
+    return None
+
+
+def _refrescar_en_segundo_plano(clave, cargar):
+    """Refresca la clave en un thread, salvo que ya haya una carga en curso."""
+    with _en_vuelo_lock:
+        if clave in _en_vuelo:
+            return
+
+    def refrescar():
+        try:
+            _cargar_una_vez(clave, cargar)
+        except Exception as e:
+            logger.warning(f"No se pudo refrescar el clima cacheado ({clave}): {e}")
+        finally:
+            # Con DatabaseCache el thread abrió su propia conexión a la BD
+            connection.close()
+
+    threading.Thread(target=refrescar, name=f'refresco-{clave}', daemon=True).start()
@@ -4,21 +4,86 @@ Servicio para interactuar con Google Weather API y gestionar registros climátic
 
 import requests
 import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
 from datetime import datetime, date
-from plantas.models import RegistroClima, LocalidadUsuario
+from plantas.models import RegistroClima, PronosticoClima, LocalidadUsuario
+from plantas.services import http_client
 
 # Logger para este módulo
 logger = logging.getLogger(__name__)
 
+WEATHER_URL = "https://weather.googleapis.com/v1/currentConditions:lookup"
+FORECAST_URL = "https://weather.googleapis.com/v1/forecast/days:lookup"
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
 
-def obtener_clima_actual(latitud, longitud):
+CAMPOS_CLIMA = ['temperatura_max', 'temperatura_min', 'humedad_promedio', 'precipitacion_mm', 'velocidad_viento_kmh']
+
+
+def consultar_clima_crudo(latitud, longitud, reintentos=http_client.MAX_REINTENTOS):
     """
-    Obtiene datos del clima actual de Google Weather API.
+    Consulta Google Weather API (condiciones actuales) y devuelve el JSON tal cual.
+    
+    Raises:
+        requests.exceptions.RequestException: Si hay error en la API
+        ValueError: Si la respuesta no es JSON
+    """
+    params = {
+        'key': settings.GOOGLE_MAPS_API_KEY,
+        'location.latitude': latitud,
+        'location.longitude': longitud,
+    }
+    response = http_client.get(WEATHER_URL, params=params, endpoint='weather', reintentos=reintentos)
+    response.raise_for_status()
+    return response.json()
+
+
+def parsear_clima(data):
+    """
+    Convierte el JSON de Google Weather API en los datos que usa RegistroClima.
+    
+    Returns:
+        dict {'temperatura_max', 'temperatura_min', 'humedad_promedio',
+              'precipitacion_mm', 'velocidad_viento_kmh'}
+    """
+    # Temperatura actual
+    temp_actual = data.get('temperature', {}).get('degrees', 20.0)
+    
+    # Temperatura máxima y mínima del historial
+    history = data.get('currentConditionsHistory', {})
+    temp_max = history.get('maxTemperature', {}).get('degrees', temp_actual)
+    temp_min = history.get('minTemperature', {}).get('degrees', temp_actual - 5)
+    
+    # Humedad relativa (viene directo como número)
+    humedad = data.get('relativeHumidity', 50.0)
+    
+    # Precipitación acumulada (en el historial)
+    precipitacion_mm = history.get('qpf', {}).get('quantity', 0.0)
+    
+    # Velocidad del viento (ya viene en km/h)
+    viento_kmh = data.get('wind', {}).get('speed', {}).get('value', 0.0)
+    
+    return {
+        'temperatura_max': float(temp_max),
+        'temperatura_min': float(temp_min),
+        'humedad_promedio': float(humedad),
+        'precipitacion_mm': float(precipitacion_mm),
+        'velocidad_viento_kmh': float(viento_kmh)
+    }
+
+
+def obtener_clima_actual(latitud, longitud, permitir_viejo=False):
+    """
+    Obtiene datos del clima actual de Google Weather API, pasando por el cache
+    compartido de clima (ver weather_cache).
     
     Args:
         latitud: float
         longitud: float
+        permitir_viejo: Si acepta un dato vencido mientras se refresca en segundo
+                        plano (para vistas; el cron necesita datos vigentes)
     
     Returns:
         dict con datos meteorológicos o None si hay error
@@ -29,54 +94,382 @@ def obtener_clima_actual(latitud, longitud):
             'precipitacion_mm': float,
             'velocidad_viento_kmh': float
         }
-    
-    Raises:
-        requests.exceptions.RequestException: Si hay error en la API
     """
-    api_key = settings.GOOGLE_MAPS_API_KEY
-    url = f"https://weather.googleapis.com/v1/currentConditions:lookup?key={api_key}&location.latitude={latitud}&location.longitude={longitud}"
+    from plantas.services import weather_cache
     
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Parsear respuesta de Google Weather API
-        # Estructura real documentada en el JSON de respuesta
-        
-        # Temperatura actual
-        temp_actual = data.get('temperature', {}).get('degrees', 20.0)
-        
-        # Temperatura máxima y mínima del historial
-        history = data.get('currentConditionsHistory', {})
-        temp_max = history.get('maxTemperature', {}).get('degrees', temp_actual)
-        temp_min = history.get('minTemperature', {}).get('degrees', temp_actual - 5)
-        
-        # Humedad relativa (viene directo como número)
-        humedad = data.get('relativeHumidity', 50.0)
-        
-        # Precipitación acumulada (en el historial)
-        precipitacion_mm = history.get('qpf', {}).get('quantity', 0.0)
-        
-        # Velocidad del viento (ya viene en km/h)
-        viento_kmh = data.get('wind', {}).get('speed', {}).get('value', 0.0)
-        
-        return {
-            'temperatura_max': float(temp_max),
-            'temperatura_min': float(temp_min),
-            'humedad_promedio': float(humedad),
-            'precipitacion_mm': float(precipitacion_mm),
-            'velocidad_viento_kmh': float(viento_kmh)
-        }
+        data = weather_cache.obtener(
+            latitud, longitud, lambda: consultar_clima_crudo(latitud, longitud), permitir_viejo=permitir_viejo
+        )
+        return parsear_clima(data)
     
     except requests.exceptions.RequestException as e:
         logger.error(f"Error al consultar Weather API: {e}")
         return None
-    except (KeyError, ValueError) as e:
+    except (KeyError, ValueError, AttributeError) as e:
         logger.error(f"Error al parsear respuesta de Weather API: {e}")
         return None
 
 
+def dias_pronostico():
+    """Días de pronóstico a ingerir (settings.WEATHER_FORECAST_DAYS, 0 = desactivado)."""
+    return max(0, min(10, getattr(settings, 'WEATHER_FORECAST_DAYS', 3)))
+
+
+def consultar_pronostico_crudo(latitud, longitud, dias):
+    """
+    Consulta el pronóstico diario de los próximos `dias` días (un request) y devuelve el JSON tal cual.
+    
+    Raises:
+        requests.exceptions.RequestException: Si hay error en la API
+        ValueError: Si la respuesta no es JSON
+    """
+    params = {
+        'key': settings.GOOGLE_MAPS_API_KEY,
+        'location.latitude': latitud,
+        'location.longitude': longitud,
+        'days': dias,
+        'pageSize': dias,
+    }
+    response = http_client.get(FORECAST_URL, params=params, endpoint='weather_forecast')
+    response.raise_for_status()
+    return response.json()
+
+
+def consultar_pronostico(latitud, longitud, dias):
+    """
+    Pronóstico diario de los próximos `dias` días, pasando por el cache
+    compartido de clima (ver weather_cache.prefijo_pronostico).
+    
+    Returns:
+        dict {date: datos_clima} con el mismo formato que parsear_clima
+    
+    Raises:
+        requests.exceptions.RequestException: Si hay error en la API
+        ValueError: Si la respuesta no es JSON
+    """
+    from plantas.services import weather_cache
+    
+    data = weather_cache.obtener(
+        latitud, longitud, lambda: consultar_pronostico_crudo(latitud, longitud, dias),
+        prefijo=weather_cache.prefijo_pronostico(dias),
+    )
+    return parsear_pronostico(data)
+
+
+def parsear_pronostico(data):
+    """
+    Convierte el JSON de forecast/days:lookup en {date: datos_clima}.
+    
+    Humedad: promedio de día y noche; lluvia: suma de ambos; viento: el máximo.
+    Los días incompletos se descartan.
+    """
+    pronostico = {}
+    for dia in data.get('forecastDays', []):
+        try:
+            display = dia['displayDate']
+            fecha = date(display['year'], display['month'], display['day'])
+            temp_max = dia['maxTemperature']['degrees']
+        except (KeyError, TypeError, ValueError):
+            continue
+        temp_min = dia.get('minTemperature', {}).get('degrees', temp_max - 5)
+        partes = [dia.get('daytimeForecast') or {}, dia.get('nighttimeForecast') or {}]
+        humedades = [parte['relativeHumidity'] for parte in partes if 'relativeHumidity' in parte]
+        precipitacion = sum(
+            parte.get('precipitation', {}).get('qpf', {}).get('quantity', 0.0) for parte in partes
+        )
+        viento = max(parte.get('wind', {}).get('speed', {}).get('value', 0.0) for parte in partes)
+        pronostico[fecha] = {
+            'temperatura_max': float(temp_max),
+            'temperatura_min': float(temp_min),
+            'humedad_promedio': float(sum(humedades) / len(humedades)) if humedades else 50.0,
+            'precipitacion_mm': float(precipitacion),
+            'velocidad_viento_kmh': float(viento),
+        }
+    return pronostico
+
+
+def celda_clima(latitud, longitud, tamano_grados=None):
+    """
+    Devuelve la celda de la grilla lat/lon a la que pertenece una coordenada.
+    
+    Localidades en la misma celda comparten la consulta a la Weather API.
+    El tamaño se configura con settings.WEATHER_GRID_DEGREES (0 = sin agrupar).
+    
+    Returns:
+        tuple (indice_lat, indice_lon) o las coordenadas exactas si no se agrupa
+    """
+    if tamano_grados is None:
+        tamano_grados = getattr(settings, 'WEATHER_GRID_DEGREES', 0.1)
+    if tamano_grados <= 0:
+        return (latitud, longitud)
+    return (math.floor(latitud / tamano_grados), math.floor(longitud / tamano_grados))
+
+
+def centro_celda(celda, tamano_grados=None):
+    """Coordenadas (latitud, longitud) del centro de una celda de celda_clima()."""
+    if tamano_grados is None:
+        tamano_grados = getattr(settings, 'WEATHER_GRID_DEGREES', 0.1)
+    if tamano_grados <= 0:
+        return celda
+    return (round((celda[0] + 0.5) * tamano_grados, 6), round((celda[1] + 0.5) * tamano_grados, 6))
+
+
+def agrupar_por_celda(localidades):
+    """
+    Agrupa localidades por celda de la grilla.
+    
+    Returns:
+        dict {celda: [LocalidadUsuario, ...]}
+    """
+    celdas = {}
+    for localidad in localidades:
+        celdas.setdefault(celda_clima(localidad.latitud, localidad.longitud), []).append(localidad)
+    return celdas
+
+
+def localidades_con_plantas_outdoor():
+    """
+    Localidades activas cuyo usuario tiene al menos una planta outdoor.
+    
+    Las demás no necesitan clima (nadie usa el dato), así que no se consultan.
+    Cada localidad viene anotada con `proximo_riego`: la proxima_fecha_riego más
+    cercana de sus plantas outdoor, usada como prioridad cuando hay presupuesto.
+    """
+    from django.db.models import Exists, OuterRef, Subquery
+    from plantas.models import Planta
+    
+    plantas_outdoor = Planta.objects.filter(usuario_id=OuterRef('user_id'), tipo_cultivo='outdoor')
+    return LocalidadUsuario.objects.filter(activo=True).filter(Exists(plantas_outdoor)).annotate(
+        proximo_riego=Subquery(
+            plantas_outdoor.order_by('proxima_fecha_riego').values('proxima_fecha_riego')[:1]
+        )
+    )
+
+
+def localidades_sin_cache(localidades, prefijo=None):
+    """
+    Localidades cuya celda no tiene un dato vigente en weather_cache (consultarlas va a la API).
+    
+    Args:
+        localidades: Lista de LocalidadUsuario
+        prefijo: Tipo de dato (default: clima actual; ver weather_cache.prefijo_pronostico)
+    """
+    from plantas.services import weather_cache
+    
+    prefijo = prefijo or weather_cache.PREFIJO
+    vigentes = weather_cache.claves_vigentes(
+        ((localidad.latitud, localidad.longitud) for localidad in localidades), prefijo
+    )
+    return [
+        localidad for localidad in localidades
+        if weather_cache.clave_cache(localidad.latitud, localidad.longitud, prefijo) not in vigentes
+    ]
+
+
+def aplicar_presupuesto_consultas(localidades, max_consultas, sin_consulta=frozenset(), dias=0,
+                                  sin_pronostico=frozenset()):
+    """
+    Selecciona localidades, en el orden recibido, sin superar `max_consultas` requests a la Weather API.
+    
+    Cada celda nueva cuesta una consulta de clima actual y, con `dias` > 0, otra
+    de pronóstico. Las localidades de una celda ya elegida no consumen presupuesto
+    adicional, y tampoco las celdas con el dato vigente en weather_cache (no van a la API).
+    
+    Args:
+        localidades: Iterable de LocalidadUsuario ordenado por prioridad
+        max_consultas: Cantidad máxima de requests a la Weather API
+        sin_consulta: IDs de localidades que ya tienen el clima del día (no consultan clima actual)
+        dias: Días de pronóstico que se consultan por celda (0 = sin pronóstico)
+        sin_pronostico: IDs de localidades que ya tienen el pronóstico del día
+    
+    Returns:
+        tuple (seleccionadas, omitidas) como listas
+    """
+    from plantas.services import weather_cache
+    
+    localidades = list(localidades)
+    ids_clima = {
+        localidad.id
+        for localidad in localidades_sin_cache([localidad for localidad in localidades if localidad.id not in sin_consulta])
+    }
+    ids_pronostico = set()
+    if dias > 0:
+        ids_pronostico = {
+            localidad.id
+            for localidad in localidades_sin_cache(
+                [localidad for localidad in localidades if localidad.id not in sin_pronostico],
+                weather_cache.prefijo_pronostico(dias),
+            )
+        }
+    
+    celdas_clima = set()
+    celdas_pronostico = set()
+    seleccionadas = []
+    omitidas = []
+    for localidad in localidades:
+        celda = celda_clima(localidad.latitud, localidad.longitud)
+        clima = localidad.id in ids_clima and celda not in celdas_clima
+        pronostico = localidad.id in ids_pronostico and celda not in celdas_pronostico
+        if len(celdas_clima) + len(celdas_pronostico) + clima + pronostico > max_consultas:
+            omitidas.append(localidad)
+            continue
+        if clima:
+            celdas_clima.add(celda)
+        if pronostico:
+            celdas_pronostico.add(celda)
+        seleccionadas.append(localidad)
+    return seleccionadas, omitidas
+
+
+def obtener_climas_concurrente(localidades, concurrencia=1):
+    """
+    Consulta el clima de varias localidades con un pool acotado de threads.
+    
+    Se hace una sola consulta a la Weather API por celda de la grilla (ver celda_clima)
+    y el resultado se reparte entre todas las localidades de esa celda.
+    Los threads sólo hacen las requests HTTP (no tocan la BD): el guardado queda
+    en el thread que consume los resultados.
+    
+    Args:
+        localidades: Lista de LocalidadUsuario (ya evaluada)
+        concurrencia: Cantidad máxima de requests simultáneas (1 = secuencial)
+    
+    Yields:
+        tuple (localidad, datos_clima o None, latencia_segundos) a medida que terminan
+    """
+    celdas = agrupar_por_celda(localidades)
+    
+    def _consultar(celda):
+        latitud, longitud = centro_celda(celda)
+        inicio = time.perf_counter()
+        try:
+            datos = obtener_clima_actual(latitud, longitud)
+        except Exception as e:
+            logger.error(f"Error inesperado al consultar clima de la celda {celda}: {e}")
+            datos = None
+        return celda, datos, time.perf_counter() - inicio
+    
+    def _repartir(resultado):
+        celda, datos, latencia = resultado
+        for localidad in celdas[celda]:
+            yield localidad, datos, latencia
+    
+    if concurrencia <= 1:
+        for celda in celdas:
+            yield from _repartir(_consultar(celda))
+        return
+    
+    with ThreadPoolExecutor(max_workers=concurrencia) as executor:
+        futuros = [executor.submit(_consultar, celda) for celda in celdas]
+        for futuro in as_completed(futuros):
+            yield from _repartir(futuro.result())
+
+
+def obtener_pronosticos_concurrente(localidades, dias, concurrencia=1):
+    """
+    Consulta el pronóstico de varias localidades, un request por celda de grilla.
+    
+    Como obtener_climas_concurrente, los threads sólo hacen HTTP. Las celdas con
+    el pronóstico vigente en weather_cache no van a la API.
+    
+    Returns:
+        tuple (pronosticos, consultas) con pronosticos = [(LocalidadUsuario, {date: datos_clima}), ...]
+        (las celdas con error no se incluyen) y consultas = celdas que fueron a la API
+    """
+    from plantas.services import weather_cache
+    
+    celdas = agrupar_por_celda(localidades)
+    if not celdas or dias <= 0:
+        return [], 0
+    consultas = len(agrupar_por_celda(localidades_sin_cache(localidades, weather_cache.prefijo_pronostico(dias))))
+    
+    def _consultar(celda):
+        latitud, longitud = centro_celda(celda)
+        try:
+            return celda, consultar_pronostico(latitud, longitud, dias)
+        except Exception as e:
+            logger.error(f"Error al consultar pronóstico de la celda {celda}: {e}")
+            return celda, None
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as executor:
+        por_celda = list(executor.map(_consultar, celdas))
+    
+    pronosticos = [
+        (localidad, dias_pronostico)
+        for celda, dias_pronostico in por_celda if dias_pronostico
+        for localidad in celdas[celda]
+    ]
+    return pronosticos, consultas
+
+
+def guardar_pronosticos_lote(pronosticos, emitido=None):
+    """
+    Reemplaza el pronóstico guardado de varias localidades (upsert en lote).
+    
+    Los días de hoy o anteriores se ignoran (para eso está RegistroClima) y los
+    pronósticos vencidos de esas localidades se borran. Compara contra el
+    pronóstico anterior: sólo interesa re-proyectar los días cuyo ajuste cambió.
+    
+    Args:
+        pronosticos: Lista de tuplas (LocalidadUsuario, {date: datos_clima})
+        emitido: date de la consulta (default: hoy)
+    
+    Returns:
+        dict con 'dias' (filas guardadas) y 'dias_cambiados' (días nuevos o con
+        otro ajuste que el pronóstico anterior)
+    """
+    emitido = emitido or date.today()
+    ids = [localidad.id for localidad, _ in pronosticos]
+    if not ids:
+        return {'dias': 0, 'dias_cambiados': 0}
+    
+    anteriores = {
+        (localidad_id, fecha): (ajuste_dias, resetear_riego)
+        for localidad_id, fecha, ajuste_dias, resetear_riego in PronosticoClima.objects.filter(
+            localidad_id__in=ids, fecha__gt=emitido
+        ).values_list('localidad_id', 'fecha', 'ajuste_dias', 'resetear_riego')
+    }
+    
+    filas = []
+    cambiados = 0
+    for localidad, dias in pronosticos:
+        for fecha, datos_clima in sorted(dias.items()):
+            if fecha <= emitido:
+                continue
+            fila = PronosticoClima(localidad=localidad, fecha=fecha, emitido=emitido, **datos_clima)
+            fila.actualizar_ajuste()
+            if anteriores.get((localidad.id, fecha)) != (fila.ajuste_dias, fila.resetear_riego):
+                cambiados += 1
+            filas.append(fila)
+    
+    PronosticoClima.objects.filter(localidad_id__in=ids, fecha__lte=emitido).delete()
+    PronosticoClima.objects.bulk_create(
+        filas,
+        update_conflicts=True,
+        unique_fields=['localidad', 'fecha'],
+        update_fields=CAMPOS_CLIMA + PronosticoClima.CAMPOS_AJUSTE + ['emitido'],
+        batch_size=500,
+    )
+    return {'dias': len(filas), 'dias_cambiados': cambiados}
+
+
+def pronosticos_por_localidad(localidad_ids, desde, hasta=None):
+    """
+    Pronósticos guardados a partir de `desde` (exclusive), ordenados por fecha.
+    
+    Returns:
+        dict {localidad_id: [PronosticoClima, ...]}
+    """
+    filtros = {'localidad_id__in': localidad_ids, 'fecha__gt': desde}
+    if hasta is not None:
+        filtros['fecha__lte'] = hasta
+    por_localidad = {}
+    for pronostico in PronosticoClima.objects.filter(**filtros).order_by('fecha'):
+        por_localidad.setdefault(pronostico.localidad_id, []).append(pronostico)
+    return por_localidad
+
+
 def guardar_registro_clima(localidad, datos_clima, fecha=None):
     """
     Guarda un registro del clima en la base de datos.
@@ -112,6 +505,68 @@ def guardar_registro_clima(localidad, datos_clima, fecha=None):
     return registro
 
 
+def guardar_registros_clima_lote(resultados, fecha=None):
+    """
+    Guarda en lote los registros de clima de varias localidades.
+    
+    Hace un upsert (bulk_create con update_conflicts) de los RegistroClima, con su
+    ajuste de riego ya calculado, y un bulk_update de ultima_actualizacion_clima,
+    en lugar de dos queries por localidad.
+    
+    Args:
+        resultados: Lista de tuplas (LocalidadUsuario, datos_clima)
+        fecha: date object (opcional, default: hoy)
+    
+    Returns:
+        dict {localidad_id: RegistroClima}
+    """
+    from django.utils import timezone
+    
+    if not resultados:
+        return {}
+    if fecha is None:
+        fecha = date.today()
+    
+    registros = [
+        RegistroClima(
+            localidad=localidad,
+            fecha=fecha,
+            temperatura_max=datos_clima.get('temperatura_max', 20.0),
+            temperatura_min=datos_clima.get('temperatura_min', 15.0),
+            humedad_promedio=datos_clima.get('humedad_promedio', 50.0),
+            precipitacion_mm=datos_clima.get('precipitacion_mm', 0.0),
+            velocidad_viento_kmh=datos_clima.get('velocidad_viento_kmh', 0.0),
+        )
+        for localidad, datos_clima in resultados
+    ]
+    # bulk_create no llama a save(): el ajuste del día se calcula acá, una vez por registro
+    for registro in registros:
+        registro.actualizar_ajuste()
+    # Datos nuevos invalidan los checkpoints del día (quedan en False en las instancias)
+    RegistroClima.objects.bulk_create(
+        registros,
+        update_conflicts=True,
+        unique_fields=['localidad', 'fecha'],
+        update_fields=CAMPOS_CLIMA + RegistroClima.CAMPOS_AJUSTE + ['riegos_recalculados', 'calendario_actualizado'],
+        batch_size=500,
+    )
+    
+    ahora = timezone.now()
+    localidades = [localidad for localidad, _ in resultados]
+    for localidad in localidades:
+        localidad.ultima_actualizacion_clima = ahora
+    LocalidadUsuario.objects.bulk_update(localidades, ['ultima_actualizacion_clima'], batch_size=500)
+    
+    # bulk_create con update_conflicts no devuelve los IDs en todos los motores: releer en una query
+    localidades_por_id = {localidad.id: localidad for localidad in localidades}
+    registros_guardados = RegistroClima.objects.filter(fecha=fecha, localidad_id__in=localidades_por_id)
+    guardados = {}
+    for registro in registros_guardados:
+        registro.localidad = localidades_por_id[registro.localidad_id]
+        guardados[registro.localidad_id] = registro
+    return guardados
+
+
 def obtener_y_guardar_clima(localidad):
     """
     Obtiene clima actual y lo guarda en la base de datos.
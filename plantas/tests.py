@@ -1,3 +1,1346 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .serializers import PlantaSerializer
+from .models import (
+    ConfiguracionUsuario, CronRun, GeocodeCache, LocalidadUsuario, Planta, PronosticoClima, ReclamoLocalidad,
+    RegistroClima, ResumenClima,
+)
+from .services import http_client, weather_cache
+from .services.clima_historico import completar_huecos
+from .services.clima_resumen import actualizar_resumenes, compactar_historial, fecha_corte, inicio_periodo
+from .services.geocoding import geocodificar, normalizar_consulta, podar, tasa_de_hits
+from .services.outdoor_calculator import (
+    CAMPOS_RECALCULO_OUTDOOR, aplicar_ajuste_lote, cargar_plantas_outdoor_por_usuario, guardar_plantas_recalculadas,
+    firma_programacion, proyectar_pronostico, recalcular_fecha_riego_outdoor, requiere_evento, separar_cambiadas,
+)
+from .services.outdoor_pipeline import PipelineOutdoor
+from .services.reparto_trabajo import ReclamosWorker, parsear_shard, reclamar_localidades
+from .services.riego_calculator import calcular_riego, calcular_riego_lote
+from .services.weather_service import (
+    aplicar_presupuesto_consultas, celda_clima, centro_celda, guardar_pronosticos_lote, guardar_registros_clima_lote,
+    obtener_climas_concurrente, obtener_pronosticos_concurrente, parsear_clima, parsear_pronostico,
+)
+
+
+def crear_planta(usuario, **campos):
+    """Planta Cannabis indoor mediana, con los campos que se quieran cambiar."""
+    datos = {
+        'nombre_personalizado': 'Planta',
+        'tamano_planta': 'Mediana',
+        'tipo_cultivo': 'indoor',
+        'tamano_maceta_litros': 10,
+        'fecha_ultimo_riego': date.today() - timedelta(days=1),
+    }
+    datos.update(campos)
+    return Planta.objects.create(usuario=usuario, **datos)
+
+
+class CalculoRiegoLoteTests(TestCase):
+    """calcular_riego_lote tiene que dar lo mismo que calcular_riego planta por planta."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('lote', password='x')
+        hoy = date.today()
+        self.plantas = [
+            crear_planta(self.user, tamano_planta='Pequeña', tamano_maceta_litros=3, fecha_ultimo_riego=hoy),
+            crear_planta(self.user, tamano_planta='Grande', tamano_maceta_litros=40, en_floracion=True),
+            crear_planta(self.user, tamano_planta='Mediana', tamano_maceta_litros=10,
+                         fecha_ultimo_riego=hoy - timedelta(days=9)),
+            # Mismos datos que la anterior: el lote la calcula una sola vez
+            crear_planta(self.user, tamano_planta='Mediana', tamano_maceta_litros=10,
+                         fecha_ultimo_riego=hoy - timedelta(days=9)),
+            crear_planta(self.user, categoria_botanica='Otras', frecuencia_riego_manual=4,
+                         cantidad_agua_manual_ml=750),
+            crear_planta(self.user, categoria_botanica='Otras'),
+        ]
+
+    def test_lote_igual_a_calculo_individual(self):
+        for temperatura, humedad in [(None, None), (32, 25), (14, 85), (24, None)]:
+            lote = calcular_riego_lote(self.plantas, temperatura, humedad)
+            for planta in self.plantas:
+                with self.subTest(planta=planta.id, temperatura=temperatura, humedad=humedad):
+                    self.assertEqual(lote[planta.id], calcular_riego(planta, temperatura, humedad))
+
+    def test_lote_desde_queryset_y_values(self):
+        esperado = calcular_riego_lote(self.plantas, 28, 40)
+        self.assertEqual(calcular_riego_lote(Planta.objects.filter(usuario=self.user), 28, 40), esperado)
+        self.assertEqual(calcular_riego_lote(list(Planta.objects.filter(usuario=self.user).values()), 28, 40), esperado)
+
+    def test_misma_fecha_de_referencia(self):
+        hoy = date.today() + timedelta(days=3)
+        lote = calcular_riego_lote(self.plantas, hoy=hoy)
+        for planta in self.plantas:
+            self.assertEqual(lote[planta.id], calcular_riego(planta, hoy=hoy))
+
+    def test_serializer_sin_lote_lee_la_configuracion_una_vez(self):
+        ConfiguracionUsuario.objects.create(user=self.user, temperatura_promedio=32, humedad_relativa=25)
+        plantas = list(Planta.objects.filter(usuario=self.user).prefetch_related('imagenes'))
+        with CaptureQueriesContext(connection) as consultas:
+            datos = PlantaSerializer(plantas, many=True).data
+        config = [q for q in consultas.captured_queries if 'plantas_configuracionusuario' in q['sql']]
+        self.assertEqual(len(config), 1)
+        for planta, serializada in zip(plantas, datos):
+            self.assertEqual(serializada['frequency_days'], calcular_riego(planta, 32, 25)['frequency_days'])
+
+
+class FiltrosPlantaTests(TestCase):
+    """?estado=, ?vence_antes= y ?ordering= filtran por la programación guardada y la API muestra la misma."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('filtros', password='x')
+        ConfiguracionUsuario.objects.create(user=self.user, temperatura_promedio=34, humedad_relativa=20)
+        self.hoy = date.today()
+        self.por_estado = {}
+        for estado, dias in [('urgente', -2), ('hoy', 0), ('pronto', 1), ('no_necesita', 6)]:
+            planta = crear_planta(self.user, nombre_personalizado=estado)
+            # Programación distinta del cálculo base (ej: ajustada por clima)
+            Planta.objects.filter(pk=planta.pk).update(proxima_fecha_riego=self.hoy + timedelta(days=dias))
+            self.por_estado[estado] = planta.pk
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_estado_coincide_con_lo_serializado(self):
+        for estado, planta_id in self.por_estado.items():
+            with self.subTest(estado=estado):
+                respuesta = self.client.get('/api/plantas/', {'estado': estado})
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertEqual([planta['id'] for planta in respuesta.json()], [planta_id])
+                planta = respuesta.json()[0]
+                guardada = Planta.objects.get(pk=planta_id).proxima_fecha_riego
+                self.assertEqual(planta['estado_riego'], estado)
+                self.assertEqual(planta['resumen_riego']['estado_riego'], estado)
+                self.assertEqual(planta['next_watering_date'], guardada.isoformat())
+
+    def test_estado_invalido(self):
+        self.assertEqual(self.client.get('/api/plantas/', {'estado': 'mañana'}).status_code, 400)
+
+    def test_vence_antes(self):
+        respuesta = self.client.get('/api/plantas/', {'vence_antes': self.hoy.isoformat()})
+        self.assertEqual(
+            sorted(planta['id'] for planta in respuesta.json()),
+            sorted([self.por_estado['urgente'], self.por_estado['hoy']]),
+        )
+        self.assertTrue(all(planta['days_left'] <= 0 for planta in respuesta.json()))
+        self.assertEqual(self.client.get('/api/plantas/', {'vence_antes': 'ayer'}).status_code, 400)
+
+    def test_ordering_dias_restantes(self):
+        respuesta = self.client.get('/api/plantas/', {'ordering': 'dias_restantes'})
+        dias = [planta['days_left'] for planta in respuesta.json()]
+        self.assertEqual(dias, sorted(dias))
+        respuesta = self.client.get('/api/plantas/', {'ordering': '-dias_restantes'})
+        self.assertEqual([planta['id'] for planta in respuesta.json()][0], self.por_estado['no_necesita'])
+
+    def test_usuario_no_ve_plantas_ajenas(self):
+        otro = User.objects.create_user('otro', password='x')
+        crear_planta(otro)
+        self.assertEqual(len(self.client.get('/api/plantas/').json()), len(self.por_estado))
+
+
+class ProgramacionPlantaTests(TestCase):
+    """Planta.save() reprograma sólo si cambian los datos de cálculo."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('programacion', password='x')
+        self.hoy = date.today()
+
+    def test_nueva_planta_queda_programada(self):
+        planta = crear_planta(self.user)
+        datos = calcular_riego(planta)
+        self.assertEqual(planta.proxima_fecha_riego, datos['next_watering_date'])
+        self.assertEqual(planta.frecuencia_riego_dias, datos['frequency_days'])
+
+    def test_indoor_usa_configuracion(self):
+        ConfiguracionUsuario.objects.create(user=self.user, temperatura_promedio=34, humedad_relativa=20)
+        planta = crear_planta(self.user)
+        self.assertEqual(planta.proxima_fecha_riego, calcular_riego(planta, 34, 20)['next_watering_date'])
+
+    def test_save_de_otro_campo_no_pisa_la_programacion(self):
+        planta = crear_planta(self.user, tipo_cultivo='outdoor')
+        ajustada = self.hoy + timedelta(days=20)
+        Planta.objects.filter(pk=planta.pk).update(proxima_fecha_riego=ajustada, motivo_riego='Lluvia')
+
+        planta = Planta.objects.get(pk=planta.pk)
+        planta.nombre_personalizado = 'Renombrada'
+        planta.save()
+        planta.refresh_from_db()
+        self.assertEqual(planta.proxima_fecha_riego, ajustada)
+        self.assertEqual(planta.motivo_riego, 'Lluvia')
+
+    def test_cambio_de_calculo_reprograma(self):
+        planta = crear_planta(self.user)
+        Planta.objects.filter(pk=planta.pk).update(proxima_fecha_riego=self.hoy + timedelta(days=20))
+
+        planta = Planta.objects.get(pk=planta.pk)
+        planta.tamano_maceta_litros = 30
+        planta.save(update_fields=['tamano_maceta_litros'])
+        planta.refresh_from_db()
+        self.assertEqual(planta.proxima_fecha_riego, calcular_riego(planta)['next_watering_date'])
+
+    def test_outdoor_reaplica_el_ultimo_clima(self):
+        localidad = LocalidadUsuario.objects.create(
+            user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2
+        )
+        registro = RegistroClima.objects.create(
+            localidad=localidad, fecha=self.hoy, temperatura_max=36, temperatura_min=24,
+            humedad_promedio=20, precipitacion_mm=0, velocidad_viento_kmh=30,
+        )
+        registro.refresh_from_db()
+        self.assertLess(registro.ajuste_dias, 0)
+
+        planta = crear_planta(self.user, tipo_cultivo='outdoor')
+        planta.en_floracion = True
+        planta.save()
+        planta.refresh_from_db()
+
+        base = calcular_riego(planta)
+        self.assertEqual(planta.motivo_riego, registro.motivo_ajuste)
+        self.assertEqual(planta.frecuencia_riego_dias, int(max(1, base['frequency_days'] + registro.ajuste_dias)))
+        self.assertLess(planta.proxima_fecha_riego, base['next_watering_date'])
+
+
+class RecalcularLoteTests(TestCase):
+    """POST /api/plantas/recalcular-lote/ calcula todas (o algunas) plantas del usuario en una request."""
+
+    url = '/api/plantas/recalcular-lote/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('recalcular', password='x')
+        self.plantas = [
+            crear_planta(self.user, tamano_maceta_litros=litros, en_floracion=litros > 10)
+            for litros in (3, 10, 25)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _por_id(self, respuesta):
+        self.assertEqual(respuesta.status_code, 200)
+        return {planta.pop('id'): planta for planta in respuesta.json()['plantas']}
+
+    def test_con_temperatura_y_humedad(self):
+        respuesta = self.client.post(self.url, {'temperatura': 31, 'humedad': 30}, format='json')
+        resultados = self._por_id(respuesta)
+        # Valores explícitos: no se usó la configuración
+        self.assertFalse(respuesta.json()['usando_config_indoor'])
+        self.assertEqual(set(resultados), {planta.id for planta in self.plantas})
+        for planta in self.plantas:
+            esperado = calcular_riego(planta, 31, 30)
+            self.assertEqual(resultados[planta.id]['frequency_days'], esperado['frequency_days'])
+            self.assertEqual(resultados[planta.id]['recommended_water_ml'], esperado['recommended_water_ml'])
+            self.assertEqual(resultados[planta.id]['next_watering_date'], esperado['next_watering_date'].isoformat())
+
+    def test_usa_la_configuracion_indoor(self):
+        ConfiguracionUsuario.objects.create(user=self.user, temperatura_promedio=15, humedad_relativa=80)
+        respuesta = self.client.post(self.url, {}, format='json')
+        resultados = self._por_id(respuesta)
+        self.assertTrue(respuesta.json()['usando_config_indoor'])
+        for planta in self.plantas:
+            self.assertEqual(resultados[planta.id]['frequency_days'], calcular_riego(planta, 15, 80)['frequency_days'])
+
+    def test_configuracion_sin_valores_no_cuenta_como_usada(self):
+        ConfiguracionUsuario.objects.create(user=self.user)
+        self.assertFalse(self.client.post(self.url, {}, format='json').json()['usando_config_indoor'])
+
+    def test_outdoor_coincide_con_el_listado(self):
+        outdoor = crear_planta(self.user, tipo_cultivo='outdoor')
+        # Programación ajustada por clima (ej: la guardó el cron)
+        Planta.objects.filter(pk=outdoor.pk).update(proxima_fecha_riego=date.today(), motivo_riego='Calor alto')
+        listado = {planta['id']: planta for planta in self.client.get('/api/plantas/').json()}
+
+        # La temperatura explícita es para las indoor: la outdoor sigue con su programación
+        resultados = self._por_id(self.client.post(self.url, {'temperatura': 31}, format='json'))
+        self.assertEqual(resultados[outdoor.id]['next_watering_date'], date.today().isoformat())
+        self.assertEqual(resultados[outdoor.id]['estado_riego'], 'hoy')
+
+        resultados = self._por_id(self.client.post(self.url, {}, format='json'))
+        for planta_id, datos in resultados.items():
+            self.assertEqual(datos['next_watering_date'], listado[planta_id]['next_watering_date'])
+            self.assertEqual(datos['estado_riego'], listado[planta_id]['estado_riego'])
+
+    def test_subconjunto_de_ids(self):
+        otro = User.objects.create_user('ajeno', password='x')
+        ajena = crear_planta(otro)
+        ids = [self.plantas[0].id, ajena.id]
+        resultados = self._por_id(self.client.post(self.url, {'ids': ids}, format='json'))
+        self.assertEqual(set(resultados), {self.plantas[0].id})
+
+    def test_datos_invalidos(self):
+        self.assertEqual(self.client.post(self.url, {'temperatura': 'calor'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'ids': ['a']}, format='json').status_code, 400)
+        # Un string no se recorre carácter por carácter
+        self.assertEqual(self.client.post(self.url, {'ids': '12'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'ids': 12}, format='json').status_code, 400)
+
+
+def pronostico_crudo(dias=3, lluvia=0.0):
+    """Respuesta mínima de forecast/days:lookup desde mañana."""
+    return {'forecastDays': [
+        {
+            'displayDate': {'year': fecha.year, 'month': fecha.month, 'day': fecha.day},
+            'maxTemperature': {'degrees': 28},
+            'minTemperature': {'degrees': 15},
+            'daytimeForecast': {'relativeHumidity': 50, 'precipitation': {'qpf': {'quantity': lluvia}}},
+            'nighttimeForecast': {'relativeHumidity': 70},
+        }
+        for fecha in (date.today() + timedelta(days=i) for i in range(1, dias + 1))
+    ]}
+
+
+def clima_crudo(temperatura=30, humedad=35, lluvia=0.0):
+    """Respuesta mínima de Google Weather API (condiciones actuales)."""
+    return {
+        'temperature': {'degrees': temperatura},
+        'currentConditionsHistory': {
+            'maxTemperature': {'degrees': temperatura + 2},
+            'minTemperature': {'degrees': temperatura - 8},
+            'qpf': {'quantity': lluvia},
+        },
+        'relativeHumidity': humedad,
+        'wind': {'speed': {'value': 10}},
+    }
+
+
+@override_settings(WEATHER_FORECAST_DAYS=0)
+class ReanudarClimaOutdoorTests(TransactionTestCase):
+    """update_outdoor_climate --resume saltea lo terminado hoy y reutiliza el clima guardado."""
+
+    def setUp(self):
+        cache.clear()
+        self.hoy = date.today()
+        self.localidades = []
+        for i in range(3):
+            user = User.objects.create_user(f'outdoor{i}', password='x')
+            # Celdas de grilla distintas: una consulta por localidad
+            self.localidades.append(LocalidadUsuario.objects.create(
+                user=user, nombre_localidad=f'L{i}', latitud=-31.0 - i, longitud=-64.0
+            ))
+            crear_planta(user, tipo_cultivo='outdoor')
+
+    def _correr(self, *args):
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima_crudo()) as api:
+            call_command('update_outdoor_climate', *args, stdout=StringIO(), stderr=StringIO())
+        cache.clear()
+        return api
+
+    def test_corrida_completa_marca_checkpoints(self):
+        api = self._correr()
+        self.assertEqual(api.call_count, 3)
+        registros = RegistroClima.objects.filter(fecha=self.hoy)
+        self.assertEqual(registros.count(), 3)
+        self.assertTrue(all(registro.riegos_recalculados and registro.calendario_actualizado for registro in registros))
+        self.assertEqual(Planta.objects.exclude(motivo_riego='').count(), 3)
+
+    def test_resume_no_repite_localidades_terminadas(self):
+        self._correr()
+        api = self._correr('--resume')
+        api.assert_not_called()
+        self.assertEqual(RegistroClima.objects.filter(fecha=self.hoy).count(), 3)
+
+    def test_resume_reutiliza_el_clima_de_una_corrida_cortada(self):
+        self._correr()
+        # Corrida interrumpida: una localidad sin clima y otra con clima pero sin recalcular
+        RegistroClima.objects.filter(localidad=self.localidades[0], fecha=self.hoy).delete()
+        RegistroClima.objects.filter(localidad=self.localidades[1], fecha=self.hoy).update(
+            riegos_recalculados=False, calendario_actualizado=False
+        )
+        api = self._correr('--resume')
+        self.assertEqual(api.call_count, 1)
+        self.assertEqual(
+            RegistroClima.objects.filter(fecha=self.hoy, riegos_recalculados=True, calendario_actualizado=True).count(), 3
+        )
+
+    def test_sin_resume_vuelve_a_consultar(self):
+        self._correr()
+        self.assertEqual(self._correr().call_count, 3)
+        self.assertEqual(RegistroClima.objects.filter(fecha=self.hoy).count(), 3)
+
+
+class ReclamarLocalidadesTests(TestCase):
+    """Los workers de --claim reclaman lotes disjuntos y retoman los reclamos vencidos."""
+
+    def setUp(self):
+        self.hoy = date.today()
+        for i in range(12):
+            user = User.objects.create_user(f'reclamo{i}', password='x')
+            LocalidadUsuario.objects.create(user=user, nombre_localidad=f'L{i}', latitud=-30.0 - i, longitud=-64.0)
+        self.localidades = LocalidadUsuario.objects.order_by('id')
+
+    def _ids(self, lote):
+        return {localidad.id for localidad in lote}
+
+    def test_lotes_disjuntos_hasta_agotar(self):
+        vistos = set()
+        for turno in range(6):
+            lote = reclamar_localidades(self.localidades, self.hoy, f'worker-{turno % 2}', 5)
+            if not lote:
+                break
+            self.assertFalse(vistos & self._ids(lote))
+            vistos |= self._ids(lote)
+        self.assertEqual(vistos, set(self.localidades.values_list('id', flat=True)))
+        self.assertEqual(reclamar_localidades(self.localidades, self.hoy, 'worker-2', 5), [])
+
+    def test_reclamo_vencido_o_de_otro_dia_se_libera(self):
+        primero = reclamar_localidades(self.localidades, self.hoy, 'caido', 12)
+        self.assertEqual(len(primero), 12)
+        self.assertEqual(reclamar_localidades(self.localidades, self.hoy, 'nuevo', 12), [])
+
+        ReclamoLocalidad.objects.filter(localidad_id__in=self._ids(primero[:3])).update(
+            expira_en=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertEqual(self._ids(reclamar_localidades(self.localidades, self.hoy, 'nuevo', 12)), self._ids(primero[:3]))
+
+        # Los reclamos de ayer no bloquean la corrida de hoy
+        ReclamoLocalidad.objects.update(fecha=self.hoy - timedelta(days=1))
+        self.assertEqual(len(reclamar_localidades(self.localidades, self.hoy, 'nuevo', 12)), 12)
+
+    def test_renovar_y_terminar(self):
+        reclamos = ReclamosWorker(self.hoy, 'lento', lease_minutos=30)
+        lote = reclamos.reclamar(self.localidades, 4)
+        ReclamoLocalidad.objects.update(expira_en=timezone.now() - timedelta(minutes=1))
+
+        # Vencido pero nadie lo tomó: sigue siendo suyo y se extiende
+        self.assertEqual(reclamos.renovar(lote), lote)
+        self.assertFalse(ReclamoLocalidad.objects.filter(expira_en__lt=timezone.now()).exists())
+        self.assertEqual(len(reclamar_localidades(self.localidades, self.hoy, 'otro', 12)), 8)
+
+        # Terminado: no se libera aunque venza el lease
+        reclamos.terminar(lote)
+        ReclamoLocalidad.objects.update(expira_en=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self._ids(reclamar_localidades(self.localidades, self.hoy, 'otro', 12)), self._ids(
+            LocalidadUsuario.objects.exclude(id__in=self._ids(lote))
+        ))
+        self.assertEqual(ReclamoLocalidad.objects.filter(worker='lento', terminado=True).count(), 4)
+
+    def test_parsear_shard(self):
+        self.assertEqual(parsear_shard('1/4'), (1, 4))
+        for invalido in ('4/4', '-1/2', 'a/b', '3'):
+            with self.subTest(valor=invalido), self.assertRaises(ValueError):
+                parsear_shard(invalido)
+
+
+@override_settings(WEATHER_FORECAST_DAYS=0)
+class ReclamosPipelineTests(TransactionTestCase):
+    """En --claim una localidad que otro worker tomó mientras el lote esperaba en cola no se procesa dos veces."""
+
+    def setUp(self):
+        cache.clear()
+        self.hoy = date.today()
+        for i in range(3):
+            user = User.objects.create_user(f'lease{i}', password='x')
+            LocalidadUsuario.objects.create(user=user, nombre_localidad=f'L{i}', latitud=-30.0 - i, longitud=-64.0)
+            crear_planta(user, tipo_cultivo='outdoor')
+        self.localidades = LocalidadUsuario.objects.order_by('id')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_lease_vencido_mientras_el_lote_espera(self):
+        reclamos = ReclamosWorker(self.hoy, 'worker-a')
+        perdida = self.localidades[0]
+
+        def lotes():
+            lote = reclamos.reclamar(self.localidades, 3)
+            # El lote espera en cola más que el lease y otro worker toma una localidad
+            ReclamoLocalidad.objects.update(expira_en=timezone.now() - timedelta(minutes=1))
+            self.assertEqual(reclamar_localidades(self.localidades, self.hoy, 'worker-b', 1), [perdida])
+            yield lote
+
+        pipeline = PipelineOutdoor(hoy=self.hoy, resume=True, reclamos=reclamos)
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima_crudo()):
+            pipeline.ejecutar(lotes())
+
+        self.assertEqual(pipeline.localidades_perdidas, 1)
+        registros = RegistroClima.objects.filter(fecha=self.hoy)
+        self.assertEqual(
+            set(registros.values_list('localidad_id', flat=True)), {localidad.id for localidad in self.localidades[1:]}
+        )
+        self.assertTrue(all(registro.calendario_actualizado for registro in registros))
+        self.assertEqual(Planta.objects.get(usuario_id=perdida.user_id).motivo_riego, '')
+        # La perdida sigue siendo de worker-b; las propias quedan terminadas
+        self.assertEqual(ReclamoLocalidad.objects.get(localidad=perdida).worker, 'worker-b')
+        self.assertEqual(
+            ReclamoLocalidad.objects.filter(worker='worker-a', terminado=True).count(), 2
+        )
+        # Terminadas: aunque venzan los leases nadie las vuelve a reclamar hoy
+        ReclamoLocalidad.objects.filter(worker='worker-a').update(expira_en=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(reclamar_localidades(self.localidades.exclude(id=perdida.id), self.hoy, 'worker-c', 3), [])
+
+
+class PresupuestoConsultasTests(TestCase):
+    """--max-api-calls cuenta celdas que van a la API: ni las repetidas ni las servidas por el cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.localidades = []
+        for i in range(4):
+            user = User.objects.create_user(f'presupuesto{i}', password='x')
+            # Las dos primeras comparten celda de grilla
+            latitud = -31.0 if i < 2 else -31.0 - i
+            self.localidades.append(LocalidadUsuario.objects.create(
+                user=user, nombre_localidad=f'L{i}', latitud=latitud, longitud=-64.0
+            ))
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_localidades_de_la_misma_celda_no_suman(self):
+        seleccionadas, omitidas = aplicar_presupuesto_consultas(self.localidades, 2)
+        self.assertEqual(seleccionadas, self.localidades[:3])
+        self.assertEqual(omitidas, self.localidades[3:])
+
+    def test_celdas_en_cache_no_consumen_presupuesto(self):
+        for localidad in self.localidades[:3]:
+            weather_cache.obtener(localidad.latitud, localidad.longitud, clima_crudo)
+        seleccionadas, omitidas = aplicar_presupuesto_consultas(self.localidades, 1)
+        self.assertEqual(seleccionadas, self.localidades)
+        self.assertEqual(omitidas, [])
+
+    def test_pronostico_consume_el_mismo_presupuesto(self):
+        # Cada celda nueva: clima actual + pronóstico
+        seleccionadas, omitidas = aplicar_presupuesto_consultas(self.localidades, 4, dias=3)
+        self.assertEqual(seleccionadas, self.localidades[:3])
+        self.assertEqual(omitidas, self.localidades[3:])
+
+    def test_pronostico_en_cache_o_de_hoy_no_consume_presupuesto(self):
+        prefijo = weather_cache.prefijo_pronostico(3)
+        weather_cache.obtener(self.localidades[2].latitud, self.localidades[2].longitud, pronostico_crudo, prefijo=prefijo)
+        seleccionadas, omitidas = aplicar_presupuesto_consultas(
+            self.localidades, 4, dias=3, sin_pronostico={self.localidades[3].id}
+        )
+        self.assertEqual(seleccionadas, self.localidades)
+        self.assertEqual(omitidas, [])
+
+    def test_pronosticos_pasan_por_el_cache(self):
+        with mock.patch('plantas.services.weather_service.consultar_pronostico_crudo',
+                        side_effect=lambda latitud, longitud, dias: pronostico_crudo(dias)) as api:
+            pronosticos, consultas = obtener_pronosticos_concurrente(self.localidades, 3)
+            self.assertEqual((consultas, api.call_count), (3, 3))
+            self.assertEqual(len(pronosticos), 4)
+            self.assertEqual(len(pronosticos[0][1]), 3)
+
+            pronosticos, consultas = obtener_pronosticos_concurrente(self.localidades, 3)
+            self.assertEqual((consultas, api.call_count), (0, 3))
+            self.assertEqual(len(pronosticos), 4)
+            # Otra cantidad de días es otro request
+            obtener_pronosticos_concurrente(self.localidades[:1], 5)
+            self.assertEqual(api.call_count, 4)
+
+    def test_localidades_con_clima_de_hoy_no_consumen_presupuesto(self):
+        seleccionadas, omitidas = aplicar_presupuesto_consultas(
+            self.localidades, 1, sin_consulta={self.localidades[0].id, self.localidades[2].id}
+        )
+        self.assertEqual(seleccionadas, self.localidades[:3])
+        self.assertEqual(omitidas, self.localidades[3:])
+
+
+class PronosticoClimaTests(TestCase):
+    """El pronóstico se guarda por localidad con su ajuste y posterga riegos ante lluvia intensa."""
+
+    def setUp(self):
+        self.hoy = date.today()
+        self.user = User.objects.create_user('pronostico', password='x')
+        self.localidad = LocalidadUsuario.objects.create(
+            user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2
+        )
+
+    def _dia(self, dias, lluvia=0.0):
+        return PronosticoClima(
+            localidad=self.localidad, fecha=self.hoy + timedelta(days=dias), emitido=self.hoy,
+            temperatura_max=25, temperatura_min=15, humedad_promedio=50, precipitacion_mm=lluvia,
+        )
+
+    def test_parsear_pronostico(self):
+        dias = parsear_pronostico(pronostico_crudo(dias=3, lluvia=4))
+        self.assertEqual(sorted(dias), [self.hoy + timedelta(days=i) for i in (1, 2, 3)])
+        manana = dias[self.hoy + timedelta(days=1)]
+        # Lluvia del día y la noche sumadas, humedad promediada
+        self.assertEqual((manana['precipitacion_mm'], manana['humedad_promedio']), (4.0, 60.0))
+
+    def test_guardar_reemplaza_y_cuenta_cambios(self):
+        # Pronóstico de ayer para hoy: desde hoy manda el RegistroClima
+        vencido = self._dia(0)
+        vencido.emitido = self.hoy - timedelta(days=1)
+        vencido.save()
+        dias = parsear_pronostico(pronostico_crudo(dias=3))
+        self.assertEqual(guardar_pronosticos_lote([(self.localidad, dias)]), {'dias': 3, 'dias_cambiados': 3})
+        self.assertEqual(PronosticoClima.objects.filter(localidad=self.localidad).count(), 3)
+        self.assertEqual(PronosticoClima.objects.filter(ajuste_dias__isnull=False).count(), 3)
+
+        self.assertEqual(guardar_pronosticos_lote([(self.localidad, dias)])['dias_cambiados'], 0)
+        dias[self.hoy + timedelta(days=2)]['precipitacion_mm'] = 20.0
+        self.assertEqual(guardar_pronosticos_lote([(self.localidad, dias)])['dias_cambiados'], 1)
+        self.assertTrue(PronosticoClima.objects.get(fecha=self.hoy + timedelta(days=2)).resetear_riego)
+
+    def test_lluvia_intensa_antes_del_riego_lo_posterga(self):
+        antes = crear_planta(self.user, tipo_cultivo='outdoor')
+        despues = crear_planta(self.user, tipo_cultivo='outdoor')
+        for planta, proxima in ((antes, 3), (despues, 1)):
+            planta.proxima_fecha_riego = self.hoy + timedelta(days=proxima)
+            planta.frecuencia_riego_dias = 4
+        pronosticos = [self._dia(1), self._dia(2, lluvia=20), self._dia(3)]
+        for pronostico in pronosticos:
+            pronostico.actualizar_ajuste()
+
+        postergadas = proyectar_pronostico([antes, despues], pronosticos)
+        self.assertEqual(list(postergadas), [antes.id])
+        self.assertEqual(antes.proxima_fecha_riego, self.hoy + timedelta(days=6))
+        self.assertIn('Lluvia intensa pronosticada', antes.motivo_riego)
+        self.assertEqual(despues.proxima_fecha_riego, self.hoy + timedelta(days=1))
+
+    def test_sin_lluvia_no_cambia_nada(self):
+        planta = crear_planta(self.user, tipo_cultivo='outdoor')
+        proxima = planta.proxima_fecha_riego
+        pronosticos = [self._dia(1, lluvia=3), self._dia(2)]
+        self.assertEqual(proyectar_pronostico([planta], pronosticos), {})
+        self.assertEqual(planta.proxima_fecha_riego, proxima)
+
+
+@override_settings(WEATHER_FORECAST_DAYS=3)
+class PronosticoCronTests(TransactionTestCase):
+    """update_outdoor_climate guarda el pronóstico y lo proyecta sobre las plantas outdoor."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('cron_pronostico', password='x')
+        LocalidadUsuario.objects.create(user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2)
+        self.planta = crear_planta(self.user, tipo_cultivo='outdoor')
+
+    def test_lluvia_pronosticada_posterga_el_riego(self):
+        hoy = date.today()
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima_crudo()), \
+                mock.patch('plantas.services.weather_service.consultar_pronostico_crudo',
+                           return_value=pronostico_crudo(dias=3, lluvia=20)) as api:
+            call_command('update_outdoor_climate', stdout=StringIO(), stderr=StringIO())
+        api.assert_called_once()
+        self.assertEqual(PronosticoClima.objects.filter(emitido=hoy, resetear_riego=True).count(), 3)
+        self.planta.refresh_from_db()
+        self.assertGreater(self.planta.proxima_fecha_riego, hoy + timedelta(days=3))
+        self.assertTrue(self.planta.motivo_riego.startswith('Lluvia intensa pronosticada'))
+
+
+class ClimasConcurrentesTests(SimpleTestCase):
+    """obtener_climas_concurrente consulta en paralelo y entrega todas las localidades."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.localidades = [
+            LocalidadUsuario(id=i, nombre_localidad=f'L{i}', latitud=-31.0 - i, longitud=-64.0) for i in range(6)
+        ]
+
+    def _consultar(self, concurrencia, api):
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', side_effect=api):
+            return list(obtener_climas_concurrente(self.localidades, concurrencia=concurrencia))
+
+    def test_entrega_todas_las_localidades(self):
+        for concurrencia in (1, 4):
+            cache.clear()
+            resultados = self._consultar(concurrencia, lambda latitud, longitud: clima_crudo(temperatura=-latitud))
+            self.assertCountEqual([localidad for localidad, _, _ in resultados], self.localidades)
+            for localidad, datos, latencia in resultados:
+                # Cada localidad recibe el clima de su propia celda
+                self.assertAlmostEqual(datos['temperatura_max'], -localidad.latitud + 2, delta=0.1)
+                self.assertGreaterEqual(latencia, 0)
+
+    def test_requests_simultaneas_acotadas(self):
+        lock = threading.Lock()
+        en_curso = []
+        maximo = []
+
+        def api(latitud, longitud):
+            with lock:
+                en_curso.append(1)
+                maximo.append(len(en_curso))
+            time.sleep(0.05)
+            with lock:
+                en_curso.pop()
+            return clima_crudo()
+
+        self._consultar(3, api)
+        self.assertEqual(len(maximo), 6)
+        self.assertGreater(max(maximo), 1)
+        self.assertLessEqual(max(maximo), 3)
+
+    def test_error_de_una_celda_no_corta_las_demas(self):
+        def api(latitud, longitud):
+            if round(latitud) == -33:
+                raise requests.exceptions.ConnectionError('sin red')
+            return clima_crudo()
+
+        resultados = {localidad.id: datos for localidad, datos, _ in self._consultar(4, api)}
+        self.assertEqual(len(resultados), 6)
+        self.assertIsNone(resultados[2])
+        self.assertEqual(sum(datos is not None for datos in resultados.values()), 5)
+
+
+@override_settings(WEATHER_GRID_DEGREES=0.1)
+class GrillaClimaTests(SimpleTestCase):
+    """Localidades de la misma celda de grilla comparten una consulta a la Weather API."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_celda_y_centro(self):
+        self.assertEqual(celda_clima(-31.42, -64.18), celda_clima(-31.48, -64.11))
+        self.assertNotEqual(celda_clima(-31.42, -64.18), celda_clima(-31.52, -64.18))
+        self.assertEqual(centro_celda(celda_clima(-31.42, -64.18)), (-31.45, -64.15))
+
+    @override_settings(WEATHER_GRID_DEGREES=0)
+    def test_sin_grilla_usa_las_coordenadas_exactas(self):
+        self.assertEqual(celda_clima(-31.42, -64.18), (-31.42, -64.18))
+        self.assertEqual(centro_celda((-31.42, -64.18)), (-31.42, -64.18))
+
+    def test_una_consulta_por_celda(self):
+        localidades = [
+            LocalidadUsuario(id=1, nombre_localidad='Centro', latitud=-31.42, longitud=-64.18),
+            LocalidadUsuario(id=2, nombre_localidad='Alberdi', latitud=-31.41, longitud=-64.19),
+            LocalidadUsuario(id=3, nombre_localidad='Carlos Paz', latitud=-31.42, longitud=-64.50),
+        ]
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima_crudo()) as api:
+            resultados = list(obtener_climas_concurrente(localidades, concurrencia=2))
+        self.assertEqual(api.call_count, 2)
+        # Se consulta el centro de cada celda, no la coordenada de una localidad
+        self.assertCountEqual(
+            [llamada.args for llamada in api.call_args_list], [(-31.45, -64.15), (-31.45, -64.45)]
+        )
+        self.assertCountEqual([localidad.id for localidad, datos, _ in resultados if datos], [1, 2, 3])
+
+
+class PersistenciaLoteTests(TestCase):
+    """El cron guarda clima y plantas de un lote con una cantidad fija de queries."""
+
+    def setUp(self):
+        self.localidades = []
+        for i in range(6):
+            user = User.objects.create_user(f'lote{i}', password='x')
+            self.localidades.append(LocalidadUsuario.objects.create(
+                user=user, nombre_localidad=f'L{i}', latitud=-31.0 - i, longitud=-64.0
+            ))
+            crear_planta(user, tipo_cultivo='outdoor')
+
+    def test_upsert_inserta_y_actualiza(self):
+        guardados = guardar_registros_clima_lote([(localidad, parsear_clima(clima_crudo())) for localidad in self.localidades])
+        self.assertEqual(set(guardados), {localidad.id for localidad in self.localidades})
+        RegistroClima.objects.update(riegos_recalculados=True, calendario_actualizado=True)
+
+        guardados = guardar_registros_clima_lote(
+            [(localidad, parsear_clima(clima_crudo(lluvia=20))) for localidad in self.localidades[:2]]
+        )
+        self.assertEqual(RegistroClima.objects.count(), 6)
+        actualizado = RegistroClima.objects.get(localidad=self.localidades[0])
+        self.assertEqual(actualizado.precipitacion_mm, 20)
+        # El ajuste se guarda junto al registro y los datos nuevos invalidan los checkpoints
+        self.assertTrue(actualizado.resetear_riego)
+        self.assertFalse(actualizado.riegos_recalculados or actualizado.calendario_actualizado)
+        self.assertTrue(RegistroClima.objects.get(localidad=self.localidades[2]).riegos_recalculados)
+        self.assertIs(guardados[self.localidades[0].id].localidad, self.localidades[0])
+        self.assertFalse(LocalidadUsuario.objects.filter(id=self.localidades[0].id, ultima_actualizacion_clima=None).exists())
+
+    def _queries(self, funcion):
+        with CaptureQueriesContext(connection) as queries:
+            funcion()
+        return len(queries)
+
+    def test_queries_no_crecen_con_el_lote(self):
+        datos = parsear_clima(clima_crudo())
+        chico = self._queries(lambda: guardar_registros_clima_lote([(localidad, datos) for localidad in self.localidades[:2]]))
+        grande = self._queries(lambda: guardar_registros_clima_lote([(localidad, datos) for localidad in self.localidades]))
+        self.assertEqual(chico, grande)
+
+    def test_plantas_en_una_query(self):
+        user_ids = [localidad.user_id for localidad in self.localidades]
+        with self.assertNumQueries(1):
+            plantas_por_usuario = cargar_plantas_outdoor_por_usuario(user_ids)
+            plantas = [planta for plantas in plantas_por_usuario.values() for planta in plantas]
+            # select_related: leer el usuario no hace otra query
+            [planta.usuario.username for planta in plantas]
+        self.assertEqual(len(plantas), 6)
+
+        for planta in plantas:
+            planta.motivo_riego = 'recalculada'
+            planta.frecuencia_riego_dias = 9
+        with self.assertNumQueries(1):
+            guardar_plantas_recalculadas(plantas)
+        self.assertEqual(Planta.objects.filter(motivo_riego='recalculada', frecuencia_riego_dias=9).count(), 6)
+
+
+class AjusteClimaLoteTests(TestCase):
+    """El ajuste se calcula una vez por RegistroClima y se aplica igual a todo el lote."""
+
+    def setUp(self):
+        self.hoy = date.today()
+        self.user = User.objects.create_user('ajuste', password='x')
+        self.localidad = LocalidadUsuario.objects.create(
+            user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2
+        )
+        for i, (tamano, litros) in enumerate([('Pequeña', 5), ('Mediana', 10), ('Grande', 20), ('Grande', 40)]):
+            crear_planta(
+                self.user, tipo_cultivo='outdoor', tamano_planta=tamano, tamano_maceta_litros=litros,
+                fecha_ultimo_riego=self.hoy - timedelta(days=i),
+            )
+
+    def _registro(self, **campos):
+        datos = parsear_clima(clima_crudo())
+        datos.update(campos)
+        return RegistroClima.objects.create(localidad=self.localidad, fecha=self.hoy - timedelta(days=1), **datos)
+
+    def _plantas(self):
+        return list(Planta.objects.filter(usuario=self.user).order_by('id'))
+
+    def test_el_ajuste_se_guarda_con_el_registro(self):
+        registro = self._registro(temperatura_max=36, humedad_promedio=25)
+        registro = RegistroClima.objects.get(pk=registro.pk)
+        self.assertEqual(registro.ajuste_dias, -2.5)
+        with mock.patch('plantas.services.outdoor_calculator.calcular_ajuste_por_clima') as calcular:
+            aplicar_ajuste_lote(self._plantas(), registro)
+        calcular.assert_not_called()
+
+    def test_lote_igual_a_planta_por_planta(self):
+        registro = self._registro(temperatura_max=32)
+        plantas = self._plantas()
+        resultados = aplicar_ajuste_lote(plantas, registro)
+        for planta in self._plantas():
+            individual = recalcular_fecha_riego_outdoor(planta, registro, guardar=False)
+            self.assertEqual(individual, resultados[planta.id])
+            lote = next(p for p in plantas if p.id == planta.id)
+            self.assertEqual(
+                [getattr(planta, campo) for campo in CAMPOS_RECALCULO_OUTDOOR],
+                [getattr(lote, campo) for campo in CAMPOS_RECALCULO_OUTDOOR],
+            )
+
+    def test_lluvia_intensa_cuenta_como_riego_solo_si_es_posterior(self):
+        registro = self._registro(precipitacion_mm=25)
+        plantas = self._plantas()
+        anteriores = {planta.id: planta.fecha_ultimo_riego for planta in plantas}
+        resultados = aplicar_ajuste_lote(plantas, registro)
+        for planta in plantas:
+            # Las regadas el mismo día del registro o después conservan su último riego
+            reseteada = anteriores[planta.id] < registro.fecha
+            self.assertEqual(resultados[planta.id]['reseteo_por_lluvia'], reseteada)
+            self.assertEqual(planta.fecha_ultimo_riego, registro.fecha if reseteada else anteriores[planta.id])
+        self.assertEqual(sum(resultado['reseteo_por_lluvia'] for resultado in resultados.values()), 2)
+
+
+def geocode_crudo(direccion='Córdoba, Argentina', latitud=-31.42, longitud=-64.18):
+    """Respuesta mínima de la Geocoding API."""
+    return {'status': 'OK', 'results': [
+        {'formatted_address': direccion, 'geometry': {'location': {'lat': latitud, 'lng': longitud}}},
+    ]}
+
+
+class GeocodeCacheTests(TestCase):
+    """Las búsquedas de localidad repetidas se sirven desde GeocodeCache."""
+
+    def _api(self, data):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = data
+        return mock.patch.object(http_client, 'get', return_value=response)
+
+    def test_normalizar_consulta(self):
+        self.assertEqual(normalizar_consulta('  Córdoba ,Argentina'), 'cordoba, argentina')
+        self.assertEqual(normalizar_consulta('SAN   Martín,  Mendoza,'), 'san martin, mendoza')
+        self.assertEqual(normalizar_consulta(None), '')
+
+    def test_variantes_de_la_misma_consulta_van_una_vez_a_la_api(self):
+        with self._api(geocode_crudo()) as api:
+            primero = geocodificar('Córdoba, Argentina')
+            for texto in ('cordoba,argentina', '  CÓRDOBA ,  Argentina '):
+                self.assertEqual(geocodificar(texto), primero)
+        api.assert_called_once()
+        self.assertEqual(primero, {'latitud': -31.42, 'longitud': -64.18, 'direccion_formateada': 'Córdoba, Argentina'})
+        entrada = GeocodeCache.objects.get()
+        self.assertEqual((entrada.consulta, entrada.hits), ('cordoba, argentina', 2))
+        self.assertEqual(tasa_de_hits(), {'hits': 2, 'misses': 1, 'tasa': 2 / 3})
+
+    def test_sin_resultados_no_se_cachea(self):
+        with self._api({'status': 'ZERO_RESULTS', 'results': []}) as api:
+            self.assertIsNone(geocodificar('Ciudad Inexistente'))
+            self.assertIsNone(geocodificar('Ciudad Inexistente'))
+        self.assertEqual(api.call_count, 2)
+        self.assertFalse(GeocodeCache.objects.exists())
+
+    def test_podar_en_orden_lru(self):
+        ahora = timezone.now()
+        for i in range(5):
+            GeocodeCache.objects.create(
+                consulta=f'ciudad {i}', latitud=0, longitud=0, direccion_formateada=f'Ciudad {i}',
+                ultimo_uso=ahora - timedelta(days=10 * i),
+            )
+        self.assertEqual(podar(dias_sin_uso=25), 2)
+        self.assertEqual(podar(max_entradas=2), 1)
+        self.assertEqual(list(GeocodeCache.objects.order_by('consulta').values_list('consulta', flat=True)), ['ciudad 0', 'ciudad 1'])
+
+    def test_comando_prune(self):
+        GeocodeCache.objects.create(consulta='a', latitud=0, longitud=0, direccion_formateada='A', hits=3)
+        GeocodeCache.objects.create(consulta='b', latitud=0, longitud=0, direccion_formateada='B')
+        salida = StringIO()
+        call_command('prune_geocode_cache', '--max-entries', '1', stdout=salida)
+        self.assertEqual(GeocodeCache.objects.count(), 1)
+        self.assertIn('Entradas: 2 → 1', salida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('prune_geocode_cache', '--max-entries', '-1', stdout=StringIO())
+
+
+class WeatherCacheTests(SimpleTestCase):
+    """weather_cache: TTL, stale-while-revalidate y single-flight por celda."""
+
+    latitud, longitud = -31.4, -64.2
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.clave = weather_cache.clave_cache(self.latitud, self.longitud)
+
+    def _esperar_refrescos(self):
+        for thread in threading.enumerate():
+            if thread.name.startswith('refresco-'):
+                thread.join(timeout=5)
+
+    def _guardar_viejo(self, datos='viejo'):
+        cache.set(self.clave, {'datos': datos, 'obtenido': time.time() - 1000}, timeout=None)
+
+    @override_settings(WEATHER_CACHE_TTL=900)
+    def test_hit_dentro_del_ttl(self):
+        cargar = mock.Mock(return_value='nuevo')
+        self.assertEqual(weather_cache.obtener(self.latitud, self.longitud, cargar), 'nuevo')
+        # Otra coordenada de la misma celda usa el mismo dato
+        self.assertEqual(weather_cache.obtener(self.latitud + 0.01, self.longitud, cargar), 'nuevo')
+        cargar.assert_called_once()
+
+    @override_settings(WEATHER_CACHE_TTL=900, WEATHER_CACHE_STALE=3600)
+    def test_stale_while_revalidate(self):
+        self._guardar_viejo()
+        cargar = mock.Mock(return_value='nuevo')
+        with mock.patch.object(weather_cache, 'connection') as conexion:
+            # Las vistas reciben el dato viejo al instante y se refresca en segundo plano
+            self.assertEqual(weather_cache.obtener(self.latitud, self.longitud, cargar, permitir_viejo=True), 'viejo')
+            self._esperar_refrescos()
+        cargar.assert_called_once()
+        self.assertEqual(cache.get(self.clave)['datos'], 'nuevo')
+        # El thread de refresco cierra su conexión a la BD (DatabaseCache)
+        conexion.close.assert_called_once()
+
+    @override_settings(WEATHER_CACHE_TTL=900)
+    def test_el_cron_no_acepta_datos_viejos(self):
+        self._guardar_viejo()
+        self.assertEqual(weather_cache.obtener(self.latitud, self.longitud, lambda: 'nuevo'), 'nuevo')
+
+    @override_settings(WEATHER_CACHE_TTL=900)
+    def test_single_flight_en_el_proceso(self):
+        llamadas = []
+
+        def cargar():
+            llamadas.append(1)
+            time.sleep(0.2)
+            return 'nuevo'
+
+        resultados = []
+        threads = [
+            threading.Thread(target=lambda: resultados.append(weather_cache.obtener(self.latitud, self.longitud, cargar)))
+            for _ in range(5)
+        ]
+        antes = weather_cache.obtener_metricas()['esperas']
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, ['nuevo'] * 5)
+        self.assertEqual(weather_cache.obtener_metricas()['esperas'] - antes, 4)
+
+    @override_settings(WEATHER_CACHE_TTL=900)
+    def test_espera_la_carga_de_otro_proceso(self):
+        cache.add(f'{self.clave}:lock', 1)
+
+        def otro_proceso_guarda(segundos):
+            cache.set(self.clave, {'datos': 'de otro proceso', 'obtenido': time.time()})
+
+        cargar = mock.Mock(return_value='nuevo')
+        with mock.patch.object(weather_cache.time, 'sleep', otro_proceso_guarda):
+            self.assertEqual(weather_cache.obtener(self.latitud, self.longitud, cargar), 'de otro proceso')
+        cargar.assert_not_called()
+
+    def test_error_de_carga_no_queda_en_vuelo(self):
+        with self.assertRaises(RuntimeError):
+            weather_cache.obtener(self.latitud, self.longitud, mock.Mock(side_effect=RuntimeError('API caída')))
+        self.assertIsNone(cache.get(f'{self.clave}:lock'))
+        self.assertEqual(weather_cache.obtener(self.latitud, self.longitud, lambda: 'nuevo'), 'nuevo')
+
+
+class ClienteHttpTests(SimpleTestCase):
+    """http_client.get reintenta errores transitorios con backoff y registra métricas."""
+
+    def setUp(self):
+        self.session = mock.Mock()
+        sesion = mock.patch.object(http_client, 'get_session', return_value=self.session)
+        backoff = mock.patch.object(http_client, '_esperar_backoff')
+        sesion.start()
+        self.backoff = backoff.start()
+        self.addCleanup(sesion.stop)
+        self.addCleanup(backoff.stop)
+        http_client.reiniciar_metricas()
+        self.addCleanup(http_client.reiniciar_metricas)
+
+    def _respuestas(self, *respuestas):
+        self.session.get.side_effect = [
+            respuesta if isinstance(respuesta, Exception) else mock.Mock(status_code=respuesta)
+            for respuesta in respuestas
+        ]
+
+    def test_reintenta_5xx_y_429(self):
+        self._respuestas(503, 429, 200)
+        response = http_client.get('https://api', endpoint='weather', reintentos=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.get.call_count, 3)
+        self.assertEqual([llamada.args for llamada in self.backoff.call_args_list], [(0,), (1,)])
+        metricas = http_client.obtener_metricas()['weather']
+        self.assertEqual((metricas['llamadas'], metricas['errores']), (3, 2))
+
+    def test_agotados_los_reintentos_devuelve_la_ultima_respuesta(self):
+        self._respuestas(503, 503)
+        self.assertEqual(http_client.get('https://api', reintentos=1).status_code, 503)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_errores_4xx_no_se_reintentan(self):
+        self._respuestas(404)
+        self.assertEqual(http_client.get('https://api').status_code, 404)
+        self.session.get.assert_called_once()
+        self.backoff.assert_not_called()
+
+    def test_errores_de_red(self):
+        self._respuestas(requests.exceptions.ConnectionError('reset'), 200)
+        self.assertEqual(http_client.get('https://api', endpoint='geocoding').status_code, 200)
+        self.assertEqual(http_client.obtener_metricas()['geocoding']['errores'], 1)
+
+        self._respuestas(*[requests.exceptions.Timeout('lento')] * 3)
+        with self.assertRaises(requests.exceptions.Timeout):
+            http_client.get('https://api', reintentos=2)
+
+    def test_siempre_con_timeout(self):
+        self._respuestas(200)
+        http_client.get('https://api', params={'q': 'x'})
+        self.session.get.assert_called_once_with('https://api', params={'q': 'x'}, timeout=http_client.DEFAULT_TIMEOUT)
+
+
+class PoolHttpTests(SimpleTestCase):
+    """El pool de conexiones del cliente HTTP acompaña a --concurrency."""
+
+    def setUp(self):
+        for atributo in ('_session', '_pool_maxsize'):
+            parche = mock.patch.object(http_client, atributo, None)
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def _tamano(self):
+        return http_client.get_session().get_adapter('https://weather.googleapis.com')._pool_maxsize
+
+    @override_settings(HTTP_POOL_MAXSIZE=2)
+    def test_ajustar_pool(self):
+        self.assertEqual(self._tamano(), 2)
+        http_client.ajustar_pool(8)
+        self.assertEqual(self._tamano(), 8)
+        # No se achica
+        http_client.ajustar_pool(4)
+        self.assertEqual(self._tamano(), 8)
+
+    @override_settings(HTTP_POOL_MAXSIZE=2)
+    def test_ajustar_antes_de_crear_la_sesion(self):
+        http_client.ajustar_pool(12)
+        self.assertEqual(self._tamano(), 12)
+
+
+class RecalculoIncrementalTests(TestCase):
+    """firma_programacion detecta qué plantas cambió el recálculo y cuáles necesitan evento."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('incremental', password='x')
+        self.plantas = [crear_planta(self.user, tipo_cultivo='outdoor') for _ in range(3)]
+
+    def test_separar_cambiadas(self):
+        firmas = {planta.id: firma_programacion(planta) for planta in self.plantas}
+        self.plantas[0].proxima_fecha_riego += timedelta(days=1)
+        self.plantas[1].motivo_riego = 'Calor alto (31.0°C) -1 día'
+        cambiadas, sin_cambios = separar_cambiadas(self.plantas, firmas)
+        self.assertEqual(cambiadas, self.plantas[:2])
+        self.assertEqual(sin_cambios, self.plantas[2:])
+
+    def test_requiere_evento_solo_si_cambia_la_fecha(self):
+        planta = self.plantas[0]
+        fecha = planta.proxima_fecha_riego
+        self.assertTrue(requiere_evento(planta, fecha))
+        planta.google_calendar_event_id = 'evento'
+        planta.motivo_riego = 'otro motivo'
+        self.assertFalse(requiere_evento(planta, fecha))
+        self.assertTrue(requiere_evento(planta, fecha - timedelta(days=1)))
+
+
+@override_settings(WEATHER_FORECAST_DAYS=0)
+class RecalculoIncrementalCronTests(TransactionTestCase):
+    """Una corrida con el mismo clima no reescribe plantas ni toca Calendar."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('incremental_cron', password='x')
+        LocalidadUsuario.objects.create(user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2)
+        for _ in range(3):
+            crear_planta(self.user, tipo_cultivo='outdoor')
+        Planta.objects.update(google_calendar_event_id='evento')
+        self.user.profile.google_access_token = 'token'
+        self.user.profile.save()
+
+    def _correr(self, clima):
+        cache.clear()
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima), \
+                mock.patch('notificaciones.services.google_calendar.update_calendar_event_for_plant',
+                           return_value={'id': 'evento'}) as calendario:
+            call_command('update_outdoor_climate', stdout=StringIO(), stderr=StringIO())
+        return CronRun.objects.order_by('-inicio', '-id').first().reporte['totales'], calendario
+
+    def test_mismo_clima_no_cambia_nada(self):
+        self._correr(clima_crudo())
+        with mock.patch('plantas.services.outdoor_pipeline.guardar_plantas_recalculadas') as guardar:
+            totales, calendario = self._correr(clima_crudo())
+        guardar.assert_called_once_with([])
+        calendario.assert_not_called()
+        self.assertEqual((totales['plantas_cambiadas'], totales['plantas_sin_cambios']), (0, 3))
+        self.assertEqual(totales['eventos_omitidos'], 3)
+
+    def test_cambio_de_fecha_actualiza_el_evento(self):
+        self._correr(clima_crudo(temperatura=20, humedad=60))
+        totales, calendario = self._correr(clima_crudo(temperatura=38, humedad=20))
+        self.assertEqual(totales['plantas_cambiadas'], 3)
+        self.assertEqual(calendario.call_count, 3)
+        self.assertEqual(totales['eventos_actualizados'], 3)
+
+
+@override_settings(WEATHER_FORECAST_DAYS=0)
+class PipelineCalendarioTests(TransactionTestCase):
+    """Un error inesperado en un worker de Calendar no deja colgado el pipeline."""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(6):
+            user = User.objects.create_user(f'pipeline{i}', password='x')
+            LocalidadUsuario.objects.create(user=user, nombre_localidad=f'L{i}', latitud=-30.0 - i, longitud=-64.0)
+            crear_planta(user, tipo_cultivo='outdoor')
+
+    def test_worker_sigue_consumiendo_tras_un_error(self):
+        salida = StringIO()
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima_crudo()), \
+                mock.patch('plantas.services.outdoor_pipeline.PipelineOutdoor._actualizar_calendario',
+                           side_effect=RuntimeError('Calendar caído')):
+            call_command(
+                # La cola de Calendar (un item por localidad) admite uno solo en espera
+                'update_outdoor_climate', '--queue-size', '1',
+                stdout=salida, stderr=StringIO(),
+            )
+        self.assertIn('Localidades procesadas: 6/6', salida.getvalue())
+        # Los recálculos quedaron guardados; Calendar queda pendiente para la próxima corrida
+        registros = RegistroClima.objects.filter(fecha=date.today())
+        self.assertEqual(registros.filter(riegos_recalculados=True).count(), 6)
+        self.assertFalse(registros.filter(calendario_actualizado=True).exists())
+        self.assertEqual(CronRun.objects.get().estado, 'parcial')
+
+
+@override_settings(WEATHER_FORECAST_DAYS=0)
+class ReporteClimaOutdoorTests(TestCase):
+    """--report-json y el registro de la corrida en CronRun."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reporte_json_por_stdout_sin_progreso(self):
+        user = User.objects.create_user('reporte', password='x')
+        LocalidadUsuario.objects.create(user=user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2)
+        crear_planta(user, tipo_cultivo='outdoor')
+        salida, progreso = StringIO(), StringIO()
+        with mock.patch('plantas.services.weather_service.consultar_clima_crudo', return_value=clima_crudo()):
+            call_command('update_outdoor_climate', '--report-json', '-', stdout=salida, stderr=progreso)
+
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual(reporte['fecha'], date.today().isoformat())
+        self.assertIn('Resumen', progreso.getvalue())
+        self.assertEqual(CronRun.objects.get().estado, 'ok')
+
+    def test_corrida_sin_localidades_queda_registrada(self):
+        salida = StringIO()
+        call_command('update_outdoor_climate', '--report-json', '-', stdout=salida, stderr=StringIO())
+        json.loads(salida.getvalue())
+        corrida = CronRun.objects.get()
+        self.assertEqual(corrida.comando, 'update_outdoor_climate')
+        self.assertEqual(corrida.estado, 'ok')
+
+
+class ResumenClimaTests(TestCase):
+    """Resúmenes semanales/mensuales, retención de RegistroClima y el endpoint de historial."""
+
+    def setUp(self):
+        self.hoy = date.today()
+        self.user = User.objects.create_user('historial', password='x')
+        self.localidad = LocalidadUsuario.objects.create(
+            user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _registro(self, fecha, temperatura_max=30, temperatura_min=10, lluvia=0.0):
+        return RegistroClima.objects.create(
+            localidad=self.localidad, fecha=fecha, temperatura_max=temperatura_max,
+            temperatura_min=temperatura_min, humedad_promedio=50, precipitacion_mm=lluvia,
+        )
+
+    def test_actualizar_resumenes_de_la_semana_y_el_mes(self):
+        lunes = date(2026, 3, 2)
+        registros = [
+            self._registro(lunes, temperatura_max=30, lluvia=5),
+            self._registro(lunes + timedelta(days=1), temperatura_max=34, temperatura_min=14, lluvia=2.5),
+            self._registro(lunes + timedelta(days=2), temperatura_max=26, temperatura_min=6),
+        ]
+        self.assertEqual(actualizar_resumenes(registros), 2)
+        semana = ResumenClima.objects.get(periodo='semana', inicio=lunes)
+        self.assertEqual((semana.dias, semana.temperatura_max, semana.temperatura_min), (3, 34, 6))
+        self.assertEqual((semana.precipitacion_total_mm, semana.temperatura_media), (7.5, 20))
+        self.assertEqual(ResumenClima.objects.get(periodo='mes', inicio=date(2026, 3, 1)).dias, 3)
+
+    def test_compactar_resume_y_borra_lo_viejo(self):
+        corte = fecha_corte(self.hoy, 60)
+        viejos = [self._registro(corte - timedelta(days=i), lluvia=1) for i in range(1, 41)]
+        self._registro(corte)
+        self.assertEqual(compactar_historial(self.hoy, 60, dry_run=True)['registros_compactados'], 40)
+        self.assertEqual(RegistroClima.objects.count(), 41)
+
+        resumen = compactar_historial(self.hoy, 60, tamano_lote=7)
+        self.assertEqual(resumen['registros_compactados'], 40)
+        self.assertEqual(list(RegistroClima.objects.values_list('fecha', flat=True)), [corte])
+        # Los días compactados quedaron en los resúmenes de sus meses
+        meses = ResumenClima.objects.filter(periodo='mes', inicio__lt=corte)
+        self.assertEqual(sum(meses.values_list('dias', flat=True)), 40)
+        self.assertEqual(sum(meses.values_list('precipitacion_total_mm', flat=True)), 40)
+
+        # Un día nuevo de un mes compactado no pisa el resumen completo
+        mes = inicio_periodo(viejos[0].fecha, 'mes')
+        dias_antes = ResumenClima.objects.get(periodo='mes', inicio=mes).dias
+        actualizar_resumenes([self._registro(viejos[0].fecha)])
+        self.assertEqual(ResumenClima.objects.get(periodo='mes', inicio=mes).dias, dias_antes)
+
+    def test_comando_compact_climate_history(self):
+        self._registro(self.hoy - timedelta(days=400))
+        self._registro(self.hoy)
+        call_command('compact_climate_history', '--dias', '90', '--dry-run', stdout=StringIO())
+        self.assertEqual(RegistroClima.objects.count(), 2)
+        salida = StringIO()
+        call_command('compact_climate_history', '--dias', '90', stdout=salida)
+        self.assertEqual(RegistroClima.objects.count(), 1)
+        self.assertIn('Registros diarios eliminados: 1', salida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('compact_climate_history', '--dias', '-1', stdout=StringIO())
+
+    def test_endpoint_historial(self):
+        url = '/api/localidad-outdoor/clima/historial/'
+        lunes = inicio_periodo(self.hoy, 'semana')
+        for semanas in (1, 3, 40):
+            self._registro(lunes - timedelta(weeks=semanas))
+        actualizar_resumenes(RegistroClima.objects.all())
+
+        respuesta = self.client.get(url, {'periodo': 'semana'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            [fila['inicio'] for fila in respuesta.data['resumenes']],
+            [lunes - timedelta(weeks=3), lunes - timedelta(weeks=1)],
+        )
+        respuesta = self.client.get(url, {'periodo': 'semana', 'desde': (lunes - timedelta(weeks=52)).isoformat(),
+                                          'hasta': (lunes - timedelta(weeks=2)).isoformat()})
+        self.assertEqual(len(respuesta.data['resumenes']), 2)
+        self.assertEqual(self.client.get(url, {'periodo': 'anio'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'desde': '2026-13-01'}).status_code, 400)
+
+        otro = APIClient()
+        otro.force_authenticate(User.objects.create_user('sin_localidad', password='x'))
+        self.assertEqual(otro.get(url).status_code, 404)
+
+
+class CompletarHuecosTests(TestCase):
+    """completar_huecos marca calendario_actualizado sólo si los eventos se sincronizaron."""
+
+    class Proveedor:
+        def obtener_rango(self, latitud, longitud, desde, hasta):
+            dias = (hasta - desde).days + 1
+            return {
+                desde + timedelta(days=i): {
+                    'temperatura_max': 37, 'temperatura_min': 25, 'humedad_promedio': 20,
+                    'precipitacion_mm': 0, 'velocidad_viento_kmh': 30,
+                }
+                for i in range(dias)
+            }
+
+    def setUp(self):
+        self.hoy = date.today()
+        self.user = User.objects.create_user('huecos', password='x')
+        self.localidad = LocalidadUsuario.objects.create(
+            user=self.user, nombre_localidad='Córdoba', latitud=-31.4, longitud=-64.2
+        )
+        RegistroClima.objects.create(
+            localidad=self.localidad, fecha=self.hoy - timedelta(days=5), temperatura_max=20,
+            temperatura_min=10, humedad_promedio=60,
+        )
+        crear_planta(self.user, tipo_cultivo='outdoor')
+        self.user.profile.google_access_token = 'token'
+        self.user.profile.save()
+
+    def _completar(self, evento):
+        localidades = LocalidadUsuario.objects.select_related('user__profile')
+        with mock.patch(
+            'notificaciones.services.google_calendar.update_calendar_event_for_plant', return_value=evento
+        ) as sincronizar:
+            resumen = completar_huecos(localidades, self.hoy - timedelta(days=4), self.hoy - timedelta(days=1),
+                                       proveedor=self.Proveedor())
+        rellenados = RegistroClima.objects.filter(fecha__gt=self.hoy - timedelta(days=5))
+        return resumen, sincronizar, rellenados
+
+    def test_eventos_sincronizados(self):
+        resumen, sincronizar, rellenados = self._completar({'id': 'evento'})
+        self.assertEqual(resumen['registros_creados'], 4)
+        self.assertEqual(resumen['eventos_actualizados'], sincronizar.call_count)
+        self.assertEqual(sincronizar.call_count, 1)
+        self.assertEqual(rellenados.filter(riegos_recalculados=True, calendario_actualizado=True).count(), 4)
+
+    def test_evento_fallido_no_marca_calendario(self):
+        resumen, sincronizar, rellenados = self._completar(None)
+        self.assertEqual(sincronizar.call_count, 1)
+        self.assertEqual(resumen['eventos_actualizados'], 0)
+        self.assertEqual(rellenados.filter(riegos_recalculados=True).count(), 4)
+        self.assertFalse(rellenados.filter(calendario_actualizado=True).exists())
+
+    def test_cada_dia_se_reaplica_con_su_fecha(self):
+        Planta.objects.update(fecha_ultimo_riego=self.hoy - timedelta(days=10))
+        self._completar({'id': 'evento'})
+        planta = Planta.objects.get()
+        # Mediana de 10 L: 5 días, -3 por calor, sequedad y viento. El último día
+        # rellenado (ayer) ya estaba atrasada: la fecha es la de ese día, no la de hoy
+        self.assertEqual(planta.frecuencia_riego_dias, 2)
+        self.assertEqual(planta.proxima_fecha_riego, self.hoy - timedelta(days=1))
+        self.assertIn('Calor extremo', planta.motivo_riego)
+
+    def test_sin_calendar_vinculado_no_marca_calendario(self):
+        self.user.profile.google_access_token = None
+        self.user.profile.save()
+        resumen, sincronizar, rellenados = self._completar({'id': 'evento'})
+        sincronizar.assert_not_called()
+        self.assertFalse(rellenados.filter(calendario_actualizado=True).exists())
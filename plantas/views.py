@@ -8,6 +8,10 @@ from .models import Planta, Riego, ConfiguracionUsuario, LocalidadUsuario, Regis
 from .serializers import PlantaSerializer, RiegoSerializer, RegisterSerializer, ConfiguracionUsuarioSerializer, LocalidadUsuarioSerializer
 from .permissions import IsOwner
 from .storage_service import PlantImageStorageService
+from .services.riego_calculator import CAMPOS_CALCULO, calcular_riego_lote, con_programacion
+from .services import weather_cache
+from .services.geocoding import geocodificar
+from .services.weather_service import consultar_clima_crudo, parsear_clima
 from .serializers import ImagenPlantaSerializer
 from notificaciones.services.google_calendar import get_user_calendar_service
 
@@ -21,6 +25,9 @@ from django.db.models import Avg, Sum, Count, Max, Min, Value
 from django.db.models.functions import Coalesce
 from django.contrib.auth import login, authenticate
 from django.conf import settings
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from datetime import date, timedelta
 import requests
 
 # Logger para este módulo
@@ -121,34 +128,23 @@ class LocalidadUsuarioView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Geocoding usando Google Maps API (en backend)
+        # Geocoding en backend (pasa primero por el cache persistente de GeocodeCache)
         try:
-            geocode_url = f"https://maps.googleapis.com/maps/api/geocode/json"
-            params = {
-                'address': nombre_localidad,
-                'key': settings.GOOGLE_MAPS_API_KEY
-            }
-            geocode_res = requests.get(geocode_url, params=params)
-            geocode_data = geocode_res.json()
+            resultado = geocodificar(nombre_localidad)
             
-            if not geocode_data.get('results'):
+            if resultado is None:
                 return Response(
                     {"error": "No se encontró la localidad. Intentá con otro nombre."}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Extraer coordenadas y nombre completo
-            result = geocode_data['results'][0]
-            location = result['geometry']['location']
-            formatted_address = result['formatted_address']
-            
             # Crear o actualizar localidad
             localidad, created = LocalidadUsuario.objects.update_or_create(
                 user=request.user,
                 defaults={
-                    'nombre_localidad': formatted_address,
-                    'latitud': location['lat'],
-                    'longitud': location['lng'],
+                    'nombre_localidad': resultado['direccion_formateada'],
+                    'latitud': resultado['latitud'],
+                    'longitud': resultado['longitud'],
                     'activo': True
                 }
             )
@@ -188,6 +184,19 @@ class LocalidadClimaView(APIView):
                 localidad=localidad
             ).order_by('-fecha').first()
             
+            # Si el cron todavía no guardó el de hoy, usar el clima actual del cache
+            # compartido (sin reintentos: si la API falla se muestra el último registro)
+            if ultimo_registro is None or ultimo_registro.fecha != date.today():
+                try:
+                    datos = weather_cache.obtener(
+                        localidad.latitud, localidad.longitud,
+                        lambda: consultar_clima_crudo(localidad.latitud, localidad.longitud, reintentos=0),
+                        permitir_viejo=True,
+                    )
+                    ultimo_registro = RegistroClima(localidad=localidad, **parsear_clima(datos))
+                except (requests.exceptions.RequestException, ValueError, KeyError, AttributeError) as e:
+                    logger.warning(f"Clima actual no disponible para {localidad.nombre_localidad}: {e}")
+            
             if not ultimo_registro:
                 return Response(
                     {"error": "No hay datos de clima disponibles"}, 
@@ -200,7 +209,17 @@ class LocalidadClimaView(APIView):
                 'humedad_promedio': ultimo_registro.humedad_promedio,
                 'precipitacion_mm': ultimo_registro.precipitacion_mm,
                 'velocidad_viento_kmh': ultimo_registro.velocidad_viento_kmh,
-                'fecha': ultimo_registro.fecha
+                'fecha': ultimo_registro.fecha,
+                'ajuste': ultimo_registro.ajuste(),
+                'pronostico': [
+                    {
+                        'fecha': pronostico.fecha,
+                        'temperatura_max': pronostico.temperatura_max,
+                        'precipitacion_mm': pronostico.precipitacion_mm,
+                        'ajuste': pronostico.ajuste(),
+                    }
+                    for pronostico in localidad.pronosticos.filter(fecha__gt=date.today())
+                ],
             })
             
         except LocalidadUsuario.DoesNotExist:
@@ -210,6 +229,56 @@ class LocalidadClimaView(APIView):
             )
 
 
+class LocalidadClimaHistorialView(APIView):
+    """
+    GET: Historial de clima de la localidad del usuario para gráficos.
+    
+    Se sirve de los resúmenes (ResumenClima), no de los registros diarios:
+    una fila por semana o mes. Parámetros opcionales:
+    - ?periodo=semana|mes  (default: mes)
+    - ?desde=YYYY-MM-DD / ?hasta=YYYY-MM-DD  (default: últimas 26 semanas o 12 meses)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            localidad = request.user.localidad_outdoor
+        except LocalidadUsuario.DoesNotExist:
+            return Response(
+                {"error": "No tiene localidad configurada"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        periodo = request.query_params.get('periodo', 'mes')
+        if periodo not in ('semana', 'mes'):
+            raise ValidationError({'periodo': "Valor inválido. Opciones: semana, mes"})
+        
+        fechas = {}
+        for parametro in ('desde', 'hasta'):
+            valor = request.query_params.get(parametro)
+            if not valor:
+                continue
+            try:
+                fechas[parametro] = parse_date(valor)
+            except ValueError:
+                fechas[parametro] = None
+            if fechas[parametro] is None:
+                raise ValidationError({parametro: "Formato de fecha inválido. Usar YYYY-MM-DD"})
+        
+        desde = fechas.get('desde') or date.today() - timedelta(weeks=26 if periodo == 'semana' else 52)
+        resumenes = localidad.resumenes_clima.filter(periodo=periodo, inicio__gte=desde)
+        if fechas.get('hasta'):
+            resumenes = resumenes.filter(inicio__lte=fechas['hasta'])
+        
+        return Response({
+            'periodo': periodo,
+            'resumenes': list(resumenes.order_by('inicio').values(
+                'inicio', 'dias', 'temperatura_max', 'temperatura_min', 'temperatura_media',
+                'precipitacion_total_mm', 'humedad_media', 'viento_medio_kmh',
+            )),
+        })
+
+
 class TriggerRecalculoOutdoorView(APIView):
     """
     POST: Trigger manual para recalcular riegos outdoor ahora (útil para testing)
@@ -282,25 +351,22 @@ class GoogleCalendarDisconnectView(APIView):
         # 1. Si el usuario tiene un token, intentar eliminar los eventos existentes ANTES de borrar el token.
         if profile.google_access_token:
             try:
-                # Usamos la función helper para borrar eventos (maneja 404/410)
-                from notificaciones.services.google_calendar import delete_calendar_event
+                # Borrado en lote (batch requests de Calendar; 404/410 cuentan como borrado)
+                from notificaciones.services.calendar_batch import borrar_eventos
                 
-                # Restauramos la query que se perdió en la edición anterior
-                plantas_con_evento = Planta.objects.filter(usuario=user, google_calendar_event_id__isnull=False)
+                plantas_con_evento = list(Planta.objects.filter(usuario=user, google_calendar_event_id__isnull=False))
                 
-                for planta in plantas_con_evento:
-                    # Intentamos borrar de Google Calendar
-                    borrado_exitoso = delete_calendar_event(user, planta.google_calendar_event_id)
-                    
-                    if borrado_exitoso:
-                        logger.info(f"Evento de Google Calendar eliminado: {planta.google_calendar_event_id} (planta: {planta.nombre_personalizado})")
-                    else:
-                        logger.warning(f"No se pudo confirmar borrado del evento {planta.google_calendar_event_id} (planta: {planta.nombre_personalizado})")
-
-                    # CRÍTICO: Siempre limpiamos el ID en la base de datos para no quedar desincronizados.
+                try:
+                    borrados, errores = borrar_eventos(user, plantas_con_evento)
+                    logger.info(f"Eventos de Google Calendar eliminados al desvincular: {len(borrados)} de {len(plantas_con_evento)}")
+                    for error in errores:
+                        logger.warning(f"No se pudo confirmar borrado: {error}")
+                finally:
+                    # CRÍTICO: Siempre limpiamos los IDs en la base de datos para no quedar desincronizados.
                     # Si el evento sigue en Google (por error), es mejor perder el link que tener un ID fantasma.
-                    planta.google_calendar_event_id = None
-                    planta.save(update_fields=['google_calendar_event_id'])
+                    Planta.objects.filter(id__in=[planta.id for planta in plantas_con_evento]).update(
+                        google_calendar_event_id=None, google_calendar_sync_hash=''
+                    )
 
             except Exception as e:
                 # Si falla la obtención del servicio (ej. token expirado), solo lo informamos y continuamos.
@@ -311,6 +377,10 @@ class GoogleCalendarDisconnectView(APIView):
         profile.google_refresh_token = None
         profile.google_token_expiry = None
         profile.save()
+
+        # Descartar el cliente de Calendar cacheado en este proceso
+        from notificaciones.services import calendar_clients
+        calendar_clients.invalidar(user.id)
         
         # Registrar auditoría
         AuditLog.log(user, 'CALENDAR_UNLINK', request)
@@ -330,33 +400,26 @@ class WeatherDataView(APIView):
         if not location:
             return Response({"error": "La localidad es requerida."}, status=status.HTTP_400_BAD_REQUEST)
 
-        api_key = settings.GOOGLE_MAPS_API_KEY
         # Primero, necesitamos geocodificar la localidad para obtener latitud y longitud
-        geocode_url = f"https://maps.googleapis.com/maps/api/geocode/json?address={location}&key={api_key}"
-        
+        # (cacheado en GeocodeCache: las localidades repetidas no consumen cuota)
         try:
-            geocode_response = requests.get(geocode_url)
-            geocode_response.raise_for_status()  # Lanza un error si el status no es 2xx
-            geocode_data = geocode_response.json()
-            if not geocode_data.get('results'):
+            resultado = geocodificar(location)
+            if resultado is None:
                 return Response({"error": "No se pudo encontrar la localidad."}, status=status.HTTP_404_NOT_FOUND)
         except requests.exceptions.RequestException as e:
             return Response({"error": f"Error al contactar Google Geocoding API: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except ValueError: # JSONDecodeError hereda de ValueError
             return Response({"error": "Respuesta inválida de Google Geocoding API. Verificá la API Key y que la API esté habilitada."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Extraemos latitud y longitud de la respuesta de Geocoding
-        location_coords = geocode_data['results'][0]['geometry']['location']
-        lat = location_coords.get('lat')
-        lng = location_coords.get('lng')
+        lat = resultado['latitud']
+        lng = resultado['longitud']
         
-        # Ahora pedimos el clima para esas coordenadas
-        weather_url = f"https://weather.googleapis.com/v1/currentConditions:lookup?key={api_key}&location.latitude={lat}&location.longitude={lng}"
+        # Ahora pedimos el clima para esas coordenadas (cache compartido por celda)
         try:
-            # La llamada correcta es un GET con los parámetros en la URL
-            weather_response = requests.get(weather_url)
-            weather_response.raise_for_status()
-            return Response(weather_response.json(), status=weather_response.status_code)
+            datos = weather_cache.obtener(
+                lat, lng, lambda: consultar_clima_crudo(lat, lng), permitir_viejo=True
+            )
+            return Response(datos, status=status.HTTP_200_OK)
         except requests.exceptions.RequestException as e:
             return Response({"error": f"Error al contactar Google Weather API: {e}"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except ValueError:
@@ -368,8 +431,67 @@ class PlantaViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, IsOwner]
 
     def get_queryset(self):
-        # Cada usuario sólo ve sus plantas
-        return Planta.objects.filter(usuario=self.request.user).order_by("id")
+        """
+        Cada usuario sólo ve sus plantas. Filtros opcionales sobre proxima_fecha_riego (indexada):
+        - ?estado=urgente|hoy|pronto|no_necesita
+        - ?vence_antes=YYYY-MM-DD  (próximo riego hasta esa fecha, inclusive)
+        - ?ordering=dias_restantes | -dias_restantes
+        """
+        queryset = Planta.objects.filter(usuario=self.request.user)
+        params = self.request.query_params
+
+        estado = params.get('estado')
+        if estado:
+            hoy = date.today()
+            filtros_estado = {
+                'urgente': {'proxima_fecha_riego__lt': hoy},
+                'hoy': {'proxima_fecha_riego': hoy},
+                'pronto': {'proxima_fecha_riego': hoy + timedelta(days=1)},
+                'no_necesita': {'proxima_fecha_riego__gt': hoy + timedelta(days=1)},
+            }
+            if estado not in filtros_estado:
+                raise ValidationError({'estado': f"Valor inválido. Opciones: {', '.join(filtros_estado)}"})
+            queryset = queryset.filter(**filtros_estado[estado])
+
+        vence_antes = params.get('vence_antes')
+        if vence_antes:
+            try:
+                fecha = parse_date(vence_antes)
+            except ValueError:
+                fecha = None
+            if fecha is None:
+                raise ValidationError({'vence_antes': "Formato de fecha inválido. Usar YYYY-MM-DD"})
+            queryset = queryset.filter(proxima_fecha_riego__lte=fecha)
+
+        ordering = params.get('ordering')
+        if ordering == 'dias_restantes':
+            return queryset.order_by('proxima_fecha_riego', 'id')
+        if ordering == '-dias_restantes':
+            return queryset.order_by('-proxima_fecha_riego', 'id')
+        return queryset.order_by("id")
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lista las plantas del usuario calculando el riego de todas en una sola pasada
+        (calcular_riego_lote) en lugar de una llamada a calculos_riego() por planta.
+        Las indoor usan la temperatura y humedad de ConfiguracionUsuario, como su
+        programación guardada (ver Planta.clima_indoor).
+        """
+        plantas = list(self.filter_queryset(self.get_queryset()))
+        clima_indoor = ConfiguracionUsuario.objects.filter(user=request.user).values_list(
+            'temperatura_promedio', 'humedad_relativa'
+        ).first() or (None, None)
+
+        context = self.get_serializer_context()
+        context['calculos_riego'] = calcular_riego_lote(
+            [planta for planta in plantas if planta.tipo_cultivo == 'indoor'], *clima_indoor
+        )
+        context['calculos_riego'].update(
+            calcular_riego_lote([planta for planta in plantas if planta.tipo_cultivo != 'indoor'])
+        )
+
+        serializer = self.get_serializer(plantas, many=True, context=context)
+        return Response(serializer.data)
 
     def perform_create(self, serializer):
         planta = serializer.save()  # el serializer setea usuario desde request
@@ -546,6 +668,71 @@ class PlantaViewSet(viewsets.ModelViewSet):
         
         return Response(datos_recalculados)
 
+    @action(detail=False, methods=['post'], url_path='recalcular-lote')
+    def recalcular_lote(self, request):
+        """
+        Recalcula el estado de riego de todas las plantas del usuario (o de un subconjunto)
+        en una sola request, en lugar de un GET /recalcular/ por planta.
+        POST /api/plantas/recalcular-lote/
+        Body opcional: { "temperatura": 25, "humedad": 60, "ids": [1, 2, 3] }
+        Si no se pasan temperatura/humedad, usa la configuración indoor del usuario.
+        Como en el listado, las outdoor muestran su programación guardada (con el
+        ajuste por clima) y las indoor también, salvo que se pasen temperatura o
+        humedad explícitas: ahí se devuelve el cálculo con esos valores.
+        """
+        temperatura = request.data.get('temperatura')
+        humedad = request.data.get('humedad')
+        ids = request.data.get('ids')
+
+        try:
+            temperatura = float(temperatura) if temperatura not in (None, '') else None
+            humedad = float(humedad) if humedad not in (None, '') else None
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'temperatura y humedad deben ser numéricas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        explicitos = temperatura is not None or humedad is not None
+        usando_config = False
+        config = ConfiguracionUsuario.objects.filter(user=request.user).first()
+        if temperatura is None and config is not None and config.temperatura_promedio is not None:
+            temperatura = config.temperatura_promedio
+            usando_config = True
+        if humedad is None and config is not None and config.humedad_relativa is not None:
+            humedad = config.humedad_relativa
+            usando_config = True
+
+        plantas = Planta.objects.filter(usuario=request.user).order_by('id').only(
+            *CAMPOS_CALCULO, 'tipo_cultivo', 'proxima_fecha_riego', 'frecuencia_riego_dias'
+        )
+        if ids is not None:
+            if not isinstance(ids, (list, tuple)):
+                return Response({'error': '"ids" debe ser una lista de IDs numéricos'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                ids = [int(planta_id) for planta_id in ids]
+            except (TypeError, ValueError):
+                return Response({'error': '"ids" debe ser una lista de IDs numéricos'}, status=status.HTTP_400_BAD_REQUEST)
+            plantas = plantas.filter(id__in=ids)
+        plantas = list(plantas)
+
+        # Una sola query (sólo columnas de cálculo) y una pasada de cálculo por tipo de cultivo
+        indoor = [planta for planta in plantas if planta.tipo_cultivo == 'indoor']
+        calculos = calcular_riego_lote(indoor, temperatura_externa=temperatura, humedad_externa=humedad)
+        calculos.update(calcular_riego_lote([planta for planta in plantas if planta.tipo_cultivo != 'indoor']))
+
+        resultados = []
+        for planta in plantas:
+            datos = calculos[planta.id]
+            if planta.tipo_cultivo != 'indoor' or not explicitos:
+                datos = con_programacion(datos, planta)
+            resultados.append({'id': planta.id, **datos})
+
+        return Response({
+            'usando_config_indoor': usando_config,
+            'plantas': resultados,
+        })
+
     @action(detail=True, methods=['post'])
     def regar(self, request, pk=None):
         """
@@ -708,7 +895,8 @@ class RiegoViewSet(viewsets.ReadOnlyModelViewSet):
 # ========== ELIMINAR CUENTA ==========
 from rest_framework.decorators import api_view, permission_classes
 from django.db import transaction
-from notificaciones.services.google_calendar import delete_calendar_event
+from notificaciones.services import calendar_clients
+from notificaciones.services.calendar_batch import borrar_eventos
 from notificaciones.models import Profile as NotificationProfile
 import traceback
 
@@ -740,20 +928,22 @@ def delete_account(request):
             logger.debug(f"Perfil de notificaciones encontrado para {username}")
             if profile.google_access_token:
                 logger.info(f"Eliminando eventos de Google Calendar para {username}")
-                # Borrar todos los eventos de Google Calendar antes de eliminar
+                # Borrar todos los eventos de Google Calendar antes de eliminar (en lote)
                 plantas_con_evento = Planta.objects.filter(
                     usuario=user, 
                     google_calendar_event_id__isnull=False
                 )
                 
-                for planta in plantas_con_evento:
-                    try:
-                        delete_calendar_event(user, planta.google_calendar_event_id)
-                        eventos_eliminados += 1
-                        logger.debug(f"Evento {planta.google_calendar_event_id} eliminado")
-                    except Exception as e:
+                try:
+                    borrados, errores = borrar_eventos(user, plantas_con_evento)
+                    eventos_eliminados = len(borrados)
+                    # Sin ID, la señal post_delete de Planta no vuelve a borrarlos uno por uno
+                    Planta.objects.filter(id__in=borrados).update(google_calendar_event_id=None, google_calendar_sync_hash='')
+                    for error in errores:
                         # Si falla el borrado de un evento, continuamos
-                        logger.warning(f"Error al borrar evento {planta.google_calendar_event_id}: {e}")
+                        logger.warning(f"Error al borrar evento: {error}")
+                except Exception as e:
+                    logger.warning(f"No se pudieron borrar los eventos de Google Calendar de {username}: {e}")
         except NotificationProfile.DoesNotExist:
             logger.debug(f"Usuario {username} no tiene perfil de notificaciones")
             pass
@@ -774,6 +964,7 @@ def delete_account(request):
         logger.info(f"Eliminando perfil de notificaciones del usuario {username}...")
         # 5. Eliminar perfil de notificaciones
         NotificationProfile.objects.filter(user=user).delete()
+        calendar_clients.invalidar(user.id)
         
         # Registrar auditoría ANTES de eliminar el usuario
         AuditLog.log(
@@ -256,6 +256,48 @@ GOOGLE_CLIENT_SECRET = config('GOOGLE_CLIENT_SECRET', default=None)
 
 GOOGLE_MAPS_API_KEY = config('GOOGLE_MAPS_API_KEY')
 
+# Tamaño (en grados) de la grilla para agrupar localidades en una sola consulta de clima.
+# 0.1° ≈ 11 km. Con 0 cada localidad consulta sus coordenadas exactas.
+WEATHER_GRID_DEGREES = config('WEATHER_GRID_DEGREES', default=0.1, cast=float)
+
+# Conexiones keep-alive por host del cliente HTTP compartido (Geocoding/Weather, ver
+# plantas.services.http_client). Los comandos con --concurrency mayor lo agrandan solos.
+HTTP_POOL_MAXSIZE = config('HTTP_POOL_MAXSIZE', default=16, cast=int)
+
+# Cache compartido (clima actual por celda, ver plantas.services.weather_cache).
+# El default locmem es por proceso: no comparte datos ni locks entre workers, sólo
+# sirve para desarrollo. render.yaml configura CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+# con CACHE_LOCATION=riego_cache (tabla creada con `python manage.py createcachetable`);
+# también sirve django.core.cache.backends.redis.RedisCache con CACHE_LOCATION=redis://...
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='riego-indoor'),
+    }
+}
+
+# Segundos que el clima actual cacheado se considera vigente, y ventana extra en la
+# que las vistas lo siguen sirviendo mientras se refresca en segundo plano.
+WEATHER_CACHE_TTL = config('WEATHER_CACHE_TTL', default=900, cast=int)
+WEATHER_CACHE_STALE = config('WEATHER_CACHE_STALE', default=3600, cast=int)
+
+# Días de pronóstico que guarda el cron outdoor por celda (PronosticoClima) para
+# proyectar los riegos hacia adelante (máx. 10, 0 = desactivado).
+WEATHER_FORECAST_DAYS = config('WEATHER_FORECAST_DAYS', default=3, cast=int)
+
+# Proveedor de clima histórico para completar días faltantes (backfill_climate).
+# Clase con obtener_rango(latitud, longitud, desde, hasta); la URL se puede apuntar a un stub local.
+WEATHER_HISTORY_PROVIDER = config('WEATHER_HISTORY_PROVIDER', default='plantas.services.clima_historico.OpenMeteoProvider')
+WEATHER_HISTORY_URL = config('WEATHER_HISTORY_URL', default='https://api.open-meteo.com/v1/forecast')
+
+# Días de RegistroClima diario que se conservan; los anteriores (alineado a inicio de
+# mes) se compactan en ResumenClima semanal/mensual (ver compact_climate_history).
+CLIMA_RETENCION_DIAS = config('CLIMA_RETENCION_DIAS', default=400, cast=int)
+
+# Clientes de Google Calendar (uno por usuario) que cada proceso mantiene construidos
+# en un LRU (ver notificaciones.services.calendar_clients).
+GOOGLE_CALENDAR_CLIENTS_MAX = config('GOOGLE_CALENDAR_CLIENTS_MAX', default=256, cast=int)
+
 # --- Security Settings for Production ---
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -256,6 +256,7 @@ async function cargarDatosClimaDropdown() {
               <span><i class="bi bi-wind"></i> Viento:</span>
               <strong>${clima.velocidad_viento_kmh?.toFixed(0) || '-'} km/h</strong>
             </div>
+            ${clima.ajuste?.motivo ? `<small class="d-block mt-1"><i class="bi bi-calendar-check"></i> ${clima.ajuste.motivo}</small>` : ''}
             <small class="text-muted d-block mt-1">Actualizado hoy</small>
           `;
 
@@ -281,6 +282,7 @@ async function cargarDatosClimaDropdown() {
               <span><i class="bi bi-wind"></i> Viento:</span>
               <strong>${clima.velocidad_viento_kmh?.toFixed(0) || '-'} km/h</strong>
             </div>
+            ${clima.ajuste?.motivo ? `<small class="text-white d-block mt-1"><i class="bi bi-calendar-check"></i> ${clima.ajuste.motivo}</small>` : ''}
             <small class="text-white-50 d-block mt-1">Actualizado hoy</small>
           `;
 
@@ -347,21 +349,30 @@ async function cargarLocalidadOutdoor() {
 
 async function recalcularTodasLasPlantas(temperatura, sufijo = '') {
   const plantCards = document.querySelectorAll('#plant-list .card');
-  for (const card of plantCards) {
-    const plantId = card.querySelector('[data-id]').dataset.id;
-    try {
-      const recalcUrl = `/api/plantas/${plantId}/recalcular/?temperatura=${temperatura}`;
-      const recalcRes = await fetchProtegido(recalcUrl);
-      if (!recalcRes.ok) continue;
+  if (plantCards.length === 0) return;
+
+  try {
+    // Un solo request para todas las plantas (antes era un GET /recalcular/ por planta)
+    const recalcRes = await fetchProtegido('/api/plantas/recalcular-lote/', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ temperatura })
+    });
+    if (!recalcRes.ok) return;
 
-      const nuevosDatos = await recalcRes.json();
+    const { plantas } = await recalcRes.json();
+    const datosPorId = new Map(plantas.map(planta => [String(planta.id), planta]));
+
+    for (const card of plantCards) {
+      const plantId = card.querySelector('[data-id]').dataset.id;
+      const nuevosDatos = datosPorId.get(plantId);
       const textoRiego = card.querySelector('.card-text');
-      if (textoRiego) {
+      if (nuevosDatos && textoRiego) {
         textoRiego.innerHTML = `🌱 <strong>${nuevosDatos.estado_texto}</strong>${sufijo}`;
       }
-    } catch (error) {
-      console.warn(`No se pudo recalcular la planta ${plantId}:`, error);
     }
+  } catch (error) {
+    console.warn('No se pudieron recalcular las plantas:', error);
   }
 }
 